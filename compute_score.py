@@ -1,10 +1,13 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
+import os
+import json
 import editdistance
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
-from utils import Tools
+from src.utils.tools import Tools
 
 
 def compute_EM(target, predictions, passk):
@@ -24,23 +27,80 @@ def compute_EM(target, predictions, passk):
     return any(EM_scores)
 
 
+def bounded_edit_distance(a, b, max_distance):
+    """
+    Levenshtein distance of `a` and `b` if it is at most `max_distance`, otherwise some value
+    above `max_distance`. Only the diagonal band of the DP table within `max_distance` is
+    filled, and the computation stops once a whole row exceeds the bound.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) - len(a) > max_distance:
+        return max_distance + 1
+    # editdistance fills the full table in C, which is faster unless the band is narrow
+    if len(b) <= 64 * (2 * max_distance + 1):
+        return editdistance.eval(a, b)
+
+    over = max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [over] * (len(b) + 1)
+        current[0] = min(i, over)
+        row_min = current[0]
+        char = a[i - 1]
+        for j in range(max(1, i - max_distance), min(len(b), i + max_distance) + 1):
+            value = previous[j - 1] + (char != b[j - 1])
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            current[j] = min(value, over)
+            row_min = min(row_min, current[j])
+        if row_min > max_distance:
+            return over
+        previous = current
+    return previous[len(b)]
+
+
+def _running_max_ES(target_str, prediction_strs):
+    """
+    ES of the best of the first k predictions, for every k. A prediction is only compared
+    in full when it can still beat the best ES so far.
+    """
+    best_ES = None
+    running_max = []
+    for prediction_str in prediction_strs:
+        max_len = max(len(target_str), len(prediction_str))
+        if best_ES == 1:
+            # nothing beats an exact match
+            pass
+        elif prediction_str == target_str:
+            best_ES = 1 - (0 / max_len)
+        else:
+            if best_ES is None:
+                max_distance = max_len
+            else:
+                # one above the largest distance that beats best_ES, as slack for rounding
+                max_distance = int((1 - best_ES) * max_len) + 1
+            distance = bounded_edit_distance(target_str, prediction_str, max_distance)
+            if distance <= max_distance:
+                ES = 1 - (distance / max_len)
+                if best_ES is None or ES > best_ES:
+                    best_ES = ES
+        running_max.append(best_ES)
+    return running_max
+
+
 def compute_ES(target, predictions, passk):
     target_lines = [line.strip() for line in target.splitlines() if line.strip()]
     target_str = "\n".join(target_lines)
-    ES_scores = []
+    prediction_strs = []
     for prediction in predictions[:passk]:
         prediction_lines = [line.strip() for line in prediction.splitlines() if line.strip()][
             : len(target_lines)
         ]
-        prediction_str = "\n".join(prediction_lines)
-        ES_scores.append(
-            1
-            - (
-                editdistance.eval(target_str, prediction_str)
-                / max(len(target_str), len(prediction_str))
-            )
-        )
-    return max(ES_scores)
+        prediction_strs.append("\n".join(prediction_lines))
+    return max(_running_max_ES(target_str, prediction_strs))
 
 
 def compute_score_by_repo_with_metadata(repos, lines, stype, passk=1):
@@ -62,6 +122,123 @@ def compute_score_by_repo_with_metadata(repos, lines, stype, passk=1):
         print(f"{avg_scores[repo]}\t{repo_count[repo]}\t{repo}")
 
 
+def _score_samples(target, samples, passks):
+    """
+    Scores every sample once and derives EM and ES for each k from the per-sample scores,
+    exactly as `compute_EM` and `compute_ES` would with `passk=k`.
+    """
+    target_lines = [line.strip() for line in target.splitlines() if line.strip()]
+    target_str = "\n".join(target_lines)
+    exact_matches = []
+    prediction_strs = []
+    for prediction in samples[: max(passks)]:
+        prediction_lines = [line.strip() for line in prediction.splitlines() if line.strip()][
+            : len(target_lines)
+        ]
+        exact_matches.append(prediction_lines == target_lines)
+        prediction_strs.append("\n".join(prediction_lines))
+    running_max_ES = _running_max_ES(target_str, prediction_strs)
+    return {
+        "EM": {k: any(exact_matches[:k]) for k in passks},
+        "ES": {k: max(running_max_ES[:k]) for k in passks},
+    }
+
+
+def _score_chunk(chunk, passks):
+    return [(repo, _score_samples(target, samples, passks)) for repo, target, samples in chunk]
+
+
+def _iter_chunks(file_path, repos, chunk_size):
+    """
+    Streams (repo, ground truth, samples) triples of a prediction file in chunks.
+    """
+    chunk = []
+    with open(file_path, "r", encoding="utf8") as f:
+        for line in f:
+            line = json.loads(line)
+            repo = line["metadata"]["task_id"].split("/")[0]
+            if repos is not None and repo not in repos:
+                continue
+            samples = [choice["text"] for choice in line["choices"]]
+            chunk.append((repo, line["metadata"]["ground_truth"], samples))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def _imap_bounded(executor, fn, iterable, max_pending, *args):
+    """
+    Like `executor.map`, but submits new tasks only as results are consumed, so that a large
+    file is never held in memory as pending tasks.
+    """
+    pending = []
+    for item in iterable:
+        pending.append(executor.submit(fn, item, *args))
+        if len(pending) >= max_pending:
+            yield pending.pop(0).result()
+    for future in pending:
+        yield future.result()
+
+
+def compute_score_tables(file_paths, repos=None, passks=(1,), num_workers=None, chunk_size=256):
+    """
+    Computes EM and ES at every k in `passks` for each prediction file, in a single pass over
+    each file. Chunks of lines are scored on a process pool.
+
+    Args:
+        file_paths: Prediction files; each is reported as one mode, named after the file.
+        repos: Repos to score; None scores every repo found in the files.
+        passks: Numbers of samples k to report EM@k and ES@k for.
+        num_workers: Scoring processes; 1 scores in this process.
+        chunk_size: Prediction lines per task.
+
+    Returns:
+        {mode: {repo: {"count": n, "EM@k": score, "ES@k": score, ...}}}
+    """
+    passks = sorted(set(passks))
+    repos = set(repos) if repos is not None else None
+    num_workers = num_workers or os.cpu_count()
+    tables = {}
+    executor = ProcessPoolExecutor(num_workers) if num_workers > 1 else None
+    try:
+        for file_path in file_paths:
+            chunks = _iter_chunks(file_path, repos, chunk_size)
+            if executor is None:
+                results = (_score_chunk(chunk, passks) for chunk in chunks)
+            else:
+                results = _imap_bounded(executor, _score_chunk, chunks, 2 * num_workers, passks)
+
+            sums = defaultdict(lambda: defaultdict(float))
+            for chunk_scores in results:
+                for repo, scores in chunk_scores:
+                    sums[repo]["count"] += 1
+                    for stype, scores_by_k in scores.items():
+                        for k, score in scores_by_k.items():
+                            sums[repo][f"{stype}@{k}"] += score
+
+            mode = os.path.basename(file_path).replace(".jsonl", "")
+            tables[mode] = {}
+            for repo in sorted(sums):
+                count = int(sums[repo].pop("count"))
+                tables[mode][repo] = {"count": count}
+                for key, total in sums[repo].items():
+                    tables[mode][repo][key] = round(total / count, 4)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return tables
+
+
+def print_score_tables(tables):
+    for mode, table in tables.items():
+        print(mode)
+        for repo, scores in table.items():
+            columns = "\t".join(f"{key} {value}" for key, value in scores.items())
+            print(f"{columns}\t{repo}")
+
+
 if __name__ == "__main__":
     repos = [
         "huggingface_diffusers",
@@ -73,7 +250,8 @@ if __name__ == "__main__":
         "pytorch_rl",
         "opendilab_ACE",
     ]
-    """compute single prediction"""
+    # compute every metric of a prediction file in one pass
     file_path = "output/line-rgrg-ada-ws-20-ss-2_samples.0.jsonl"
-    compute_score_by_repo_with_metadata(repos, Tools.load_jsonl(file_path), "EM", passk=1)
-    compute_score_by_repo_with_metadata(repos, Tools.load_jsonl(file_path), "ES", passk=1)
+    tables = compute_score_tables([file_path], repos, passks=(1,))
+    print_score_tables(tables)
+    Tools.dump_json(tables, "output/scores.json")
@@ -1,10 +1,14 @@
 import os
-from typing import List
+import time
+from typing import List, Optional
 
-# Disable parallel tokenization for HuggingFace
+# Disable parallel tokenization for HuggingFace; this overrides the `num_threads` given to
+# CodeGenTokenizer, whose batches are then encoded on one thread
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 from src.utils.constants import Constants
+from src.utils.file_path_builder import FilePathBuilder
+from src.utils.stage_profiler import StageProfiler
 from src.pipelines.windowing import (
     make_repo_windows,
     make_baseline_and_ground_windows,
@@ -24,6 +28,8 @@ from src.pipelines.prompting import (
     build_prompts_for_predictions,
 )
 from src.pipelines.predictions import build_predictions
+from src.pipelines.dag import DagExecutor
+from src.pipelines.graph import build_first_stage_nodes
 
 
 def run_repo_stage(
@@ -53,6 +59,27 @@ def run_rg1_and_gt_stage(
     build_prompts_for_baseline_and_ground(benchmark, repos, window_sizes, slice_sizes, vector_type)
 
 
+def run_first_stage_dag(
+    benchmark: str,
+    base_dir: str,
+    repos: List[str],
+    window_sizes: List[int],
+    slice_sizes: List[int],
+    vector_type: str = "one-gram",
+    max_workers: Optional[int] = None,
+    force: bool = False,
+) -> None:
+    """
+    Runs `run_repo_stage` and `run_rg1_and_gt_stage` as a DAG: stages whose inputs and
+    parameters are unchanged since their last run are skipped, and independent
+    (repo, window size, slice size) stages run in parallel.
+    """
+    nodes = build_first_stage_nodes(
+        benchmark, base_dir, repos, window_sizes, slice_sizes, vector_type
+    )
+    DagExecutor(nodes, max_workers=max_workers).run(force)
+
+
 def run_repocoder_stage(
     benchmark: str,
     base_dir: str,
@@ -62,11 +89,14 @@ def run_repocoder_stage(
     prediction_path_template: str,
     mode: str = Constants.rgrg,
     vector_type: str = "one-gram",
+    prefix_cache: bool = False,
 ) -> None:
     """
     Runs the full pipeline for the RepoCoder-style method (prediction-based generation).
+    With `prefix_cache`, the RG, GT and RepoCoder prompts are generated in one prefix-cached
+    pass (see `build_predictions`).
     """
-    build_predictions()
+    build_predictions(benchmark=benchmark, prefix_cache=prefix_cache)
     # make_prediction_windows(
     #     benchmark, base_dir, repos, window_sizes, slice_sizes, mode, prediction_path_template
     # )
@@ -94,6 +124,13 @@ if __name__ == "__main__":
         # "opendilab_ACE",
     ]
 
+    # Stage timings are written to data/reports/{run_name}.stages.json; set capture_profiles
+    # to also save a cProfile capture of every stage
+    run_name = time.strftime("run-%Y%m%d-%H%M%S")
+    capture_profiles = False
+    if capture_profiles:
+        StageProfiler.capture_dir = FilePathBuilder.stage_profile_dir(run_name)
+
     # Context window settings
     window_sizes = [20]
     slice_sizes = [2]  # Window stride = window_size / slice_size
@@ -104,6 +141,8 @@ if __name__ == "__main__":
 
     # run_repo_stage(Constants.base_repos_dir, repos, window_sizes, slice_sizes)
     # run_rg1_and_gt_stage(benchmark, Constants.base_repos_dir, repos, window_sizes, slice_sizes)
+    # run_first_stage_dag(benchmark, Constants.base_repos_dir, repos, window_sizes, slice_sizes)
     run_repocoder_stage(
         benchmark, Constants.base_repos_dir, repos, window_sizes, slice_sizes, prediction_path
     )
+    StageProfiler.dump_report(FilePathBuilder.stage_report_path(run_name))
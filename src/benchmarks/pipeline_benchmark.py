@@ -0,0 +1,270 @@
+import os
+import sys
+import time
+import platform
+import resource
+import subprocess
+import tempfile
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.benchmarks.synthetic_repo import SyntheticRepoGenerator
+from src.pipelines.prompting import build_prompts_for_baseline_and_ground
+from src.pipelines.retrieval import search_baseline_and_ground
+from src.pipelines.vectorization import (
+    vectorize_repo_windows,
+    vectorize_baseline_and_ground_windows,
+)
+from src.pipelines.windowing import make_repo_windows, make_baseline_and_ground_windows
+from src.utils.codegen_tokenizer import CodeGenTokenizer
+from src.utils.codex_tokenizer import CodexTokenizer
+from src.utils.constants import Constants
+from src.utils.simple_tokenizer import SimpleTokenizer
+from src.utils.tools import Tools
+
+
+class _TreeMemorySampler:
+    """
+    Samples, on a background thread, the summed PSS of this process and all its descendants
+    (Linux /proc) and keeps its peak; stages run their work in pool processes. PSS splits the
+    pages forked workers share with their parent between them, where summing RSS would count
+    them once per worker. Reading it walks the page tables, so samples are spaced by at least
+    ten times the time a sample takes, to keep the sampler from slowing down the stage.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    @staticmethod
+    def _tree_pss_bytes() -> int:
+        total = 0
+        pids = [os.getpid()]
+        while pids:
+            pid = pids.pop()
+            try:
+                with open(f"/proc/{pid}/smaps_rollup") as f:
+                    for line in f:
+                        if line.startswith("Pss:"):
+                            # reported in kilobytes
+                            total += int(line.split()[1]) * 1024
+                            break
+                for task in os.listdir(f"/proc/{pid}/task"):
+                    with open(f"/proc/{pid}/task/{task}/children") as f:
+                        pids.extend(int(child) for child in f.read().split())
+            except (FileNotFoundError, ProcessLookupError):
+                # exited while being sampled
+                continue
+        return total
+
+    def _sample(self) -> None:
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            self.peak_bytes = max(self.peak_bytes, self._tree_pss_bytes())
+            self._stop.wait(max(self.interval, 10 * (time.perf_counter() - start)))
+
+    def __enter__(self) -> "_TreeMemorySampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+class PipelineBenchmark:
+    """
+    Times every stage of `run_repo_stage` and `run_rg1_and_gt_stage` on synthetic repositories.
+
+    The repositories and the task file are generated into a temporary workspace, the pipeline
+    runs there with its usual relative `data/...` paths, and the wall time and memory of each
+    stage are written to a JSON file that can be compared across commits. Memory is read from
+    Linux's /proc, so that measuring it does not slow down the timed stages.
+    """
+
+    def __init__(
+        self,
+        repos: Tuple[str, ...] = ("synthetic_a", "synthetic_b"),
+        num_files: int = 50,
+        lines_per_file: int = 200,
+        vocab_size: int = 500,
+        num_tasks: int = 200,
+        window_sizes: Tuple[int, ...] = (20,),
+        slice_sizes: Tuple[int, ...] = (2,),
+        seed: int = 0,
+        tokenizer: str = "auto",
+    ):
+        """
+        Args:
+            repos: Names of the synthetic repositories.
+            num_files: Files per repository.
+            lines_per_file: Approximate lines per file.
+            vocab_size: Distinct identifiers in the generated code.
+            num_tasks: Completion tasks per repository.
+            window_sizes: Window sizes to run the stages with.
+            slice_sizes: Slice sizes to run the stages with.
+            seed: Seed of the repository generator.
+            tokenizer: "real" for the Codex/CodeGen tokenizers, "simple" for the offline
+                `SimpleTokenizer`, or "auto" to fall back to it when the real ones fail to load.
+        """
+        self.repos = list(repos)
+        self.num_tasks = num_tasks
+        self.window_sizes = list(window_sizes)
+        self.slice_sizes = list(slice_sizes)
+        self.tokenizer = tokenizer
+        self.generator = SyntheticRepoGenerator(num_files, lines_per_file, vocab_size, seed)
+        self.config = {
+            "repos": self.repos,
+            "num_files": num_files,
+            "lines_per_file": lines_per_file,
+            "vocab_size": vocab_size,
+            "num_tasks": num_tasks,
+            "window_sizes": self.window_sizes,
+            "slice_sizes": self.slice_sizes,
+            "seed": seed,
+        }
+
+    def _resolve_tokenizers(self) -> Tuple[Callable, Callable, str]:
+        """
+        Returns the tokenizer classes for vectorization and prompt building, and their name.
+        """
+        if self.tokenizer != "simple":
+            try:
+                CodexTokenizer().tokenize("import os")
+                CodeGenTokenizer()
+                return CodexTokenizer, CodeGenTokenizer, "real"
+            except Exception as e:
+                if self.tokenizer == "real":
+                    raise
+                print(f"Tokenizers unavailable ({e!r}), using SimpleTokenizer")
+        return SimpleTokenizer, SimpleTokenizer, "simple"
+
+    @staticmethod
+    def _get_commit() -> Optional[str]:
+        try:
+            return subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True
+            ).strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _generate_workspace(self) -> None:
+        tasks = []
+        for repo in self.repos:
+            files = self.generator.generate_repo(Constants.base_repos_dir, repo)
+            tasks.extend(self.generator.make_tasks(repo, files, self.num_tasks))
+        Tools.dump_jsonl(tasks, Constants.short_api_completion_benchmark)
+
+    @staticmethod
+    def _peak_rss_mb() -> float:
+        """
+        Returns the peak RSS of this process (VmHWM) in MB.
+        """
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    # reported in kilobytes
+                    return int(line.split()[1]) / 1024
+        raise RuntimeError("VmHWM is not reported in /proc/self/status")
+
+    @staticmethod
+    def _time_stage(name: str, fn: Callable, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        """
+        Runs one stage and measures its wall time, the peak RSS of this process during the
+        stage, and the sampled peak of the summed PSS of this process and its children.
+        """
+        # resets the peak RSS of this process to its current RSS
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        with _TreeMemorySampler() as sampler:
+            start = time.perf_counter()
+            fn(*args, **kwargs)
+            seconds = time.perf_counter() - start
+        stage = {
+            "name": name,
+            "seconds": round(seconds, 4),
+            "max_rss_mb": round(PipelineBenchmark._peak_rss_mb(), 1),
+            "tree_peak_pss_mb": round(sampler.peak_bytes / 2**20, 1),
+            # ru_maxrss is reported in kilobytes on Linux; this is the largest child so far
+            "children_max_rss_mb": round(
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1
+            ),
+        }
+        print(f"{name}: {stage['seconds']}s, peak PSS {stage['tree_peak_pss_mb']} MB with children")
+        return stage
+
+    def _run_stages(self, prompt_tokenizer_cls: Callable) -> List[Dict[str, Any]]:
+        benchmark = Constants.short_api_benchmark
+        base_dir = Constants.base_repos_dir
+        args = (self.repos, self.window_sizes, self.slice_sizes)
+        return [
+            # run_repo_stage
+            self._time_stage("make_repo_windows", make_repo_windows, base_dir, *args),
+            self._time_stage("vectorize_repo_windows", vectorize_repo_windows, *args),
+            # run_rg1_and_gt_stage
+            self._time_stage(
+                "make_baseline_and_ground_windows",
+                make_baseline_and_ground_windows,
+                benchmark,
+                base_dir,
+                *args,
+            ),
+            self._time_stage(
+                "vectorize_baseline_and_ground_windows",
+                vectorize_baseline_and_ground_windows,
+                benchmark,
+                *args,
+            ),
+            self._time_stage(
+                "search_baseline_and_ground", search_baseline_and_ground, benchmark, *args
+            ),
+            self._time_stage(
+                "build_prompts_for_baseline_and_ground",
+                build_prompts_for_baseline_and_ground,
+                benchmark,
+                *args,
+                tokenizer_cls=prompt_tokenizer_cls,
+            ),
+        ]
+
+    def run(self, output_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Generates the workspace, runs the stages and returns the results; also dumps them
+        as JSON to `output_path` if given.
+        """
+        output_path = os.path.abspath(output_path) if output_path else None
+        repo_tokenizer_cls, prompt_tokenizer_cls, tokenizer_name = self._resolve_tokenizers()
+        results = {
+            "commit": self._get_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "tokenizer": tokenizer_name,
+            "config": self.config,
+        }
+
+        cwd = os.getcwd()
+        default_tokenizer_cls = Tools.tokenizer_cls
+        with tempfile.TemporaryDirectory() as workspace:
+            try:
+                os.chdir(workspace)
+                Tools.tokenizer_cls = repo_tokenizer_cls
+                self._generate_workspace()
+                results["stages"] = self._run_stages(prompt_tokenizer_cls)
+            finally:
+                os.chdir(cwd)
+                Tools.tokenizer_cls = default_tokenizer_cls
+        results["total_seconds"] = round(sum(stage["seconds"] for stage in results["stages"]), 4)
+
+        if output_path:
+            Tools.dump_json(results, output_path)
+            print(f"Saved benchmark results to {output_path}")
+        return results
+
+
+if __name__ == "__main__":
+    benchmark = PipelineBenchmark(num_files=50, lines_per_file=200, num_tasks=200)
+    commit = (benchmark._get_commit() or "unknown")[:10]
+    benchmark.run(f"data/benchmarks/pipeline-{commit}.json")
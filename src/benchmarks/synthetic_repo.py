@@ -0,0 +1,126 @@
+import os
+import random
+from typing import Any, Dict, List, Tuple
+
+
+class SyntheticRepoGenerator:
+    """
+    Deterministic generator of Python-like repositories and completion tasks for benchmarks.
+
+    Files are built from a fixed vocabulary of identifiers drawn with a skewed distribution, so
+    that statements recur across files the way idioms do in real code and retrieval has
+    something to find. The same seed, repo name and sizes always yield the same files and tasks.
+    """
+
+    def __init__(
+        self, num_files: int = 50, lines_per_file: int = 200, vocab_size: int = 500, seed: int = 0
+    ):
+        """
+        Args:
+            num_files: Number of `.py` files per repository.
+            lines_per_file: Approximate number of lines per file.
+            vocab_size: Number of distinct identifiers.
+            seed: Seed of the generator.
+        """
+        self.num_files = num_files
+        self.lines_per_file = lines_per_file
+        self.vocab_size = vocab_size
+        self.seed = seed
+
+    def _rng(self, repo: str) -> random.Random:
+        # string seeds are hashed deterministically, unlike hash()
+        return random.Random(f"{self.seed}/{repo}")
+
+    def _name(self, rng: random.Random) -> str:
+        # low indices are drawn far more often than high ones
+        index = min(int(rng.paretovariate(1.2)) - 1, self.vocab_size - 1)
+        return f"name_{index}"
+
+    def _make_function(self, rng: random.Random) -> List[str]:
+        args = [self._name(rng) for _ in range(rng.randint(1, 3))]
+        lines = [f"def {self._name(rng)}({', '.join(args)}):"]
+        for _ in range(rng.randint(3, 12)):
+            kind = rng.random()
+            target, obj, method = self._name(rng), rng.choice(args), self._name(rng)
+            if kind < 0.5:
+                lines.append(f"    {target} = {obj}.{method}({', '.join(rng.sample(args, 1))})")
+            elif kind < 0.7:
+                lines.append(f"    if {obj} is not None:")
+                lines.append(f"        {obj} = {method}({obj}, {rng.randint(0, 9)})")
+            elif kind < 0.85:
+                lines.append(f"    for {target} in {obj}.{method}():")
+                lines.append(f"        {obj}.append({target})")
+            else:
+                lines.append(f"    # {method} {target} {obj}")
+        lines.append(f"    return {rng.choice(args)}")
+        lines.append("")
+        return lines
+
+    def _make_file(self, rng: random.Random) -> List[str]:
+        lines = [f"import {self._name(rng)}" for _ in range(rng.randint(1, 4))]
+        lines.append("")
+        while len(lines) < self.lines_per_file:
+            lines.extend(self._make_function(rng))
+        return lines
+
+    def generate_repo(self, base_dir: str, repo: str) -> Dict[Tuple[str, ...], List[str]]:
+        """
+        Writes the files of `repo` under `base_dir`.
+
+        Returns:
+            The lines of every file, keyed by file path tuple (starting with the repo name).
+        """
+        rng = self._rng(repo)
+        files = {}
+        for index in range(self.num_files):
+            fpath_tuple = (repo, f"package_{index % 5}", f"module_{index}.py")
+            lines = self._make_file(rng)
+            path = os.path.join(base_dir, *fpath_tuple)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf8") as f:
+                f.write("\n".join(lines) + "\n")
+            files[fpath_tuple] = lines
+        return files
+
+    def make_tasks(
+        self,
+        repo: str,
+        files: Dict[Tuple[str, ...], List[str]],
+        num_tasks: int,
+        max_context_lines: int = 60,
+    ) -> List[Dict[str, Any]]:
+        """
+        Picks non-empty target lines and builds completion tasks in the benchmark JSONL schema.
+
+        Args:
+            repo: Repository name, used for task ids.
+            files: Output of `generate_repo`.
+            num_tasks: Number of tasks.
+            max_context_lines: Lines of the file kept in front of the target line.
+        """
+        rng = self._rng(f"{repo}/tasks")
+        candidates = [
+            (fpath_tuple, line_no)
+            for fpath_tuple, lines in sorted(files.items())
+            for line_no in range(1, len(lines))
+            if lines[line_no].strip()
+        ]
+        tasks = []
+        for index, (fpath_tuple, line_no) in enumerate(
+            rng.sample(candidates, min(num_tasks, len(candidates)))
+        ):
+            lines = files[fpath_tuple]
+            context_start_lineno = max(0, line_no - max_context_lines)
+            tasks.append(
+                {
+                    "prompt": "\n".join(lines[context_start_lineno:line_no]),
+                    "metadata": {
+                        "task_id": f"{repo}/{index}",
+                        "ground_truth": lines[line_no],
+                        "fpath_tuple": list(fpath_tuple),
+                        "context_start_lineno": context_start_lineno,
+                        "line_no": line_no,
+                    },
+                }
+            )
+        return tasks
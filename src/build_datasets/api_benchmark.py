@@ -1,29 +1,56 @@
 import os
+import math
 import ipdb
 import random
 from tqdm import tqdm
 from collections import defaultdict
-from concurrent.futures import as_completed, ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
-from file_visitors import FileDefinedAPI, FileImportedAPI, FileCallAPI
-from make_dataset_utils import Tools, CodexTokenizer
+from file_visitors import FileDefinedAPI, FileImportedAPI, FileCallAPI, FileIndexer
+from make_dataset_utils import Tools
 
 
 class APICallLocator:
-    def __init__(self, base_dir, repo):
+    def __init__(self, base_dir, repo, cache_base_dir=None, num_workers=1):
         self.base_dir = base_dir
         self.repo = repo
         self.source_code_files = Tools.iterate_repository(repo)
+        self.index_cache_path = (
+            os.path.join(cache_base_dir, f"{repo}-api-index.pkl") if cache_base_dir else None
+        )
+        self.num_workers = num_workers  # for parsing the files
+        self.index_by_file = None
+        self.code_lines_by_file = dict()
+
+    def _get_code_lines(self, base_dir, fpath_tuple):
+        # the contexts of all the apis of a file are cut from the same lines
+        if fpath_tuple not in self.code_lines_by_file:
+            file_path = os.path.join(base_dir, *fpath_tuple)
+            self.code_lines_by_file[fpath_tuple] = Tools.read_code(file_path).splitlines()
+        return self.code_lines_by_file[fpath_tuple]
+
+    def _get_index_by_file(self):
+        # every file is parsed once, on first use, for all the api collectors
+        if self.index_by_file is None:
+            file_indexer = FileIndexer(
+                self.repo, self.source_code_files, self.index_cache_path, self.num_workers
+            )
+            self.index_by_file = file_indexer.get_index_by_file()
+        return self.index_by_file
 
     def collect_defined_apis_for_each_file(self):
-        file_define_api = FileDefinedAPI(self.repo, self.source_code_files)
+        index_by_file = self._get_index_by_file()
+        file_define_api = FileDefinedAPI(self.repo, self.source_code_files, index_by_file)
         defined_apis_by_file = file_define_api.get_defined_apis_by_file()
 
         init_files = dict()
         for fpath_tuple in self.source_code_files.keys():
             if fpath_tuple[-1] == "__init__.py":
                 init_files[fpath_tuple] = self.source_code_files[fpath_tuple]
-        file_import_api = FileImportedAPI(self.repo, init_files, defined_apis_by_file)
+        file_import_api = FileImportedAPI(
+            self.repo, init_files, defined_apis_by_file, index_by_file
+        )
         imported_apis_of_init_files = file_import_api.get_imported_apis_by_file()
         for module_path_tuple, imported_apis_info in imported_apis_of_init_files.items():
             defined_apis_info = defined_apis_by_file[module_path_tuple]
@@ -36,7 +63,9 @@ class APICallLocator:
         for fpath_tuple in self.source_code_files.keys():
             if fpath_tuple[-1] != "__init__.py":
                 non_init_files[fpath_tuple] = self.source_code_files[fpath_tuple]
-        file_import_api = FileImportedAPI(self.repo, non_init_files, available_apis_by_file)
+        file_import_api = FileImportedAPI(
+            self.repo, non_init_files, available_apis_by_file, self._get_index_by_file()
+        )
         imported_apis_of_non_init_files = file_import_api.get_imported_apis_by_file()
         for module_path_tuple, imported_apis_info in imported_apis_of_non_init_files.items():
             defined_apis_info = available_apis_by_file[module_path_tuple]
@@ -46,9 +75,7 @@ class APICallLocator:
     def _build_func_signature_context_with_positions(
         self, base_dir, fpath_tuple, func_header_start_line_no, func_body_start_line_no, class_name
     ):
-        file_path = os.path.join(base_dir, *fpath_tuple)
-        code = Tools.read_code(file_path)
-        func_signature_and_doc = code.splitlines()[
+        func_signature_and_doc = self._get_code_lines(base_dir, fpath_tuple)[
             func_header_start_line_no - 1 : func_body_start_line_no - 1
         ]  # lineno is 1-indexed
         intent = 0
@@ -67,9 +94,7 @@ class APICallLocator:
     def _build_func_body_context_with_positions(
         self, base_dir, fpath_tuple, func_start_line_no, func_end_line_no, class_name
     ):
-        file_path = os.path.join(base_dir, *fpath_tuple)
-        code = Tools.read_code(file_path)
-        func_body = code.splitlines()[
+        func_body = self._get_code_lines(base_dir, fpath_tuple)[
             func_start_line_no - 1 : func_end_line_no
         ]  # lineno is 1-indexed
         intent = 0
@@ -86,7 +111,21 @@ class APICallLocator:
         return "\n".join(func_body)
 
     def _build_api_set_for_available_api_dicts(self, available_apis_by_file):
+        # a class imported by many files is only turned into contexts once
+        context_by_api_position = dict()
+
         def __buil_context_for_available_api(available_api):
+            api_position = (
+                available_api["current_fpath_tuple"],
+                available_api["api_name"],
+                available_api.get("class_name"),
+                tuple(available_api["func_node_start_end_positions"].values()),
+            )
+            if api_position not in context_by_api_position:
+                context_by_api_position[api_position] = __build_context(available_api)
+            return context_by_api_position[api_position]
+
+        def __build_context(available_api):
             try:
                 func_header_start_line_no = available_api["func_node_start_end_positions"][
                     "start_lineno"
@@ -164,38 +203,43 @@ class APICallLocator:
         available_api_set_by_file = self._build_api_set_for_available_api_dicts(
             available_apis_by_file
         )
-        file_call_api = FileCallAPI(self.repo, self.source_code_files)
+        file_call_api = FileCallAPI(self.repo, self.source_code_files, self._get_index_by_file())
         called_apis_by_file = file_call_api.get_called_apis_by_file()
         for fpath_tuple, called_apis_info in called_apis_by_file.items():
-            available_api_set = available_api_set_by_file[fpath_tuple]
+            # the first api of each name, in sorted rather than set order so that the same api
+            # is matched in every run
+            available_api_by_name = dict()
+            for available_api in sorted(available_api_set_by_file[fpath_tuple]):
+                available_api_by_name.setdefault(available_api[0], available_api)
             called_intra_apis = []
             for called_api in called_apis_info:
-                for available_api in available_api_set:
-                    if called_api["api_name"] == available_api[0]:
-                        called_api["signature_context"] = available_api[1]
-                        called_api["body_context"] = available_api[2]
-                        called_intra_apis.append(called_api)
-                        break
+                available_api = available_api_by_name.get(called_api["api_name"])
+                if available_api is not None:
+                    called_api["signature_context"] = available_api[1]
+                    called_api["body_context"] = available_api[2]
+                    called_intra_apis.append(called_api)
             called_apis_by_file[fpath_tuple] = called_intra_apis
         return called_apis_by_file
 
 
 class APIHoleDigger:
-    def __init__(self, repo_base_dir, cache_base_dir, repo, context_max_tokens=2000):
+    def __init__(self, repo_base_dir, cache_base_dir, repo, context_max_tokens=2000, seed=0):
         self.repo_base_dir = repo_base_dir
         self.repo = repo
         self.chosen_apis_cache_path = os.path.join(
             cache_base_dir, f"{self.repo}-random-api-200.pkl"
         )
         self.context_max_tokens = context_max_tokens
-        self.tokenizer = CodexTokenizer()
+        self.seed = seed
+        # token count of each line, per file, filled in by trim_context as holes need them
+        self.line_token_counts_by_file = dict()
 
     def _make_context_prompt_by_prepending(
         self, base_dir, fpath_tuple, called_line_no, additional_context, context_max_tokens
     ):
         # line_no is 0-indexed
-        code = Tools.read_code(os.path.join(base_dir, *fpath_tuple))
-        previous_code_lines = code.splitlines()[:called_line_no]
+        code_lines = Tools.read_code(os.path.join(base_dir, *fpath_tuple)).splitlines()
+        previous_code_lines = code_lines[:called_line_no]
         if not previous_code_lines:
             ipdb.set_trace()
         additional_lines = []
@@ -203,8 +247,13 @@ class APIHoleDigger:
             additional_lines = (
                 ["'''Relevant Helpful functions:"] + additional_context.splitlines() + ["'''"]
             )
+        if fpath_tuple not in self.line_token_counts_by_file:
+            self.line_token_counts_by_file[fpath_tuple] = [None] * len(code_lines)
         trimed_context, context_start_lineno = Tools.trim_context(
-            self.tokenizer, previous_code_lines, context_max_tokens
+            Tools.get_tokenizer(),
+            previous_code_lines,
+            context_max_tokens,
+            self.line_token_counts_by_file[fpath_tuple],
         )
         context_lines = additional_lines + trimed_context
         return "\n".join(context_lines), context_start_lineno
@@ -236,32 +285,52 @@ class APIHoleDigger:
         )
         return context_prompt, context_start_lineno, ground_truth, fpath_tuple, called_line_no
 
-    def dig_holes(self, context_type):
+    def _dig_holes_in_chunk(self, called_apis, context_type):
+        return [self._dig_hole(called_api, context_type) for called_api in called_apis]
+
+    def dig_holes(self, context_type, num_workers=None):
         chosen_apis = Tools.load_pickle(self.chosen_apis_cache_path)
-        prompts = []
         print(f"digging holes for {self.repo}...")
-        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
-            future_to_prompt = {
-                executor.submit(self._dig_hole, api, context_type): index
-                for index, api in enumerate(chosen_apis)
-            }
-            for future in tqdm(as_completed(future_to_prompt), total=len(future_to_prompt)):
-                index = future_to_prompt[future]
-                prompt = future.result()
-                prompts.append((prompt, index))
-        prompts = sorted(prompts, key=lambda x: x[1])
-        return [i[0] for i in prompts]
+        num_workers = num_workers or os.cpu_count()
+        if num_workers <= 1:
+            return self._dig_holes_in_chunk(chosen_apis, context_type)
+        # one chunk per worker, each worker loads the tokenizer once
+        chunk_size = max(1, math.ceil(len(chosen_apis) / num_workers))
+        chunks = [chosen_apis[i : i + chunk_size] for i in range(0, len(chosen_apis), chunk_size)]
+        prompts = []
+        with ProcessPoolExecutor(
+            max_workers=num_workers, initializer=Tools.get_tokenizer
+        ) as executor:
+            for chunk_prompts in tqdm(
+                executor.map(self._dig_holes_in_chunk, chunks, repeat(context_type)),
+                total=len(chunks),
+            ):
+                prompts.extend(chunk_prompts)
+        return prompts
 
     def random_chosen(self, api_call_locator, num=200):
         if os.path.exists(self.chosen_apis_cache_path):
             return
         called_apis_by_file = api_call_locator.find_intra_api_calls_for_each_file()
         all_called_apis = [i for apis in list(called_apis_by_file.values()) for i in apis]
-        random.shuffle(all_called_apis)
+        random.Random(f"{self.seed}/{self.repo}").shuffle(all_called_apis)
         Tools.dump_pickle(all_called_apis[:num], self.chosen_apis_cache_path)
 
 
-def build_random_API_benchmark():
+def _build_repo_prompts(repo_base_dir, cache_base_dir, repo, context_types, seed):
+    # runs in a pool process, one per repo; the files were indexed beforehand
+    locator = APICallLocator(repo_base_dir, repo, cache_base_dir)
+    holedigger = APIHoleDigger(
+        repo_base_dir, cache_base_dir, repo, context_max_tokens=2000, seed=seed
+    )
+    holedigger.random_chosen(locator)
+    return {
+        context_type: holedigger.dig_holes(context_type, num_workers=1)
+        for context_type in context_types
+    }
+
+
+def build_random_API_benchmark(num_workers=None, seed=0):
     REPO_BASE_DIR = "downloaded_repos"
     OUT_BASE_DIR = "output"
     CACHE_BASE_DIR = "data/cache"
@@ -275,19 +344,34 @@ def build_random_API_benchmark():
         "pytorch_rl",
         "opendilab_ACE",
     ]
-    holedigger_by_repo = dict()
+    context_types = ["none"]
+    num_workers = num_workers or os.cpu_count()
+
+    # the files of each repo are parsed in parallel, filling the api index caches
     for repo in repos:
-        locator = APICallLocator(REPO_BASE_DIR, repo)
-        holedigger = APIHoleDigger(REPO_BASE_DIR, CACHE_BASE_DIR, repo, context_max_tokens=2000)
-        holedigger.random_chosen(locator)
-        holedigger_by_repo[repo] = holedigger
-
-    for context_type in ["none"]:
-        prompts_by_repo = dict()
-        for repo in repos:
-            holedigger = holedigger_by_repo[repo]
-            prompts = holedigger.dig_holes(context_type)
-            prompts_by_repo[repo] = prompts
+        holedigger = APIHoleDigger(REPO_BASE_DIR, CACHE_BASE_DIR, repo)
+        if not os.path.exists(holedigger.chosen_apis_cache_path):
+            APICallLocator(REPO_BASE_DIR, repo, CACHE_BASE_DIR, num_workers)._get_index_by_file()
+
+    # then the repos are processed in parallel, and the results kept in the order of the repos
+    with ProcessPoolExecutor(
+        max_workers=min(num_workers, len(repos)), initializer=Tools.get_tokenizer
+    ) as executor:
+        repo_prompts = executor.map(
+            _build_repo_prompts,
+            repeat(REPO_BASE_DIR),
+            repeat(CACHE_BASE_DIR),
+            repos,
+            repeat(context_types),
+            repeat(seed),
+        )
+        prompts_by_repo_and_type = dict(zip(repos, repo_prompts))
+
+    for context_type in context_types:
+        prompts_by_repo = {
+            repo: prompts_by_type[context_type]
+            for repo, prompts_by_type in prompts_by_repo_and_type.items()
+        }
         json_lines = []
         for repo, prompts in prompts_by_repo.items():
             json_lines.extend(
@@ -236,7 +236,12 @@ class APIDefineVisitor(ast.NodeVisitor):
                 parent_nodes.append(("func", current_node.name))
             elif isinstance(current_node, ast.ClassDef):
                 parent_nodes.append(("class", current_node.name))
+        return self._func_type_from_parents(parent_nodes)
 
+    def _func_type_from_parents(self, parent_nodes):
+        """
+        parent_nodes are the enclosing ("func", name) and ("class", name) scopes, innermost first
+        """
         if len(parent_nodes) > 1:  # local method, cannot be called by other module
             return ("local", None)
         elif len(parent_nodes) < 1:
@@ -290,3 +295,37 @@ class APIDefineVisitor(ast.NodeVisitor):
                     "current_fpath_tuple": self.fpath_tuple,
                 }
             )
+
+
+class FileIndexVisitor(APICallVisitor, APIImportVisitor, APIDefineVisitor):
+    """
+    collects the called, imported and defined apis of a file in a single pass over its tree.
+    the enclosing functions and classes are tracked on a stack while visiting, so no parent
+    pointers are needed to tell the type of a function
+    """
+
+    def __init__(self, file_module, fpath_tuple):
+        ast.NodeVisitor.__init__(self)
+        self.fpath_tuple = fpath_tuple
+        self.file_module = file_module
+        self.called_apis = list()
+        self.renamed_api = dict()
+        self.imported_apis = []
+        self.defined_outer_apis = []
+        self.defined_classes = defaultdict(list)
+        self.scopes = []  # enclosing ("func", name) and ("class", name), outermost first
+
+    def generic_visit(self, node):
+        # the visitors record a node after visiting its children, so the scope is popped by then
+        if isinstance(node, ast.FunctionDef):
+            scope = ("func", node.name)
+        elif isinstance(node, ast.ClassDef):
+            scope = ("class", node.name)
+        else:
+            return super().generic_visit(node)
+        self.scopes.append(scope)
+        super().generic_visit(node)
+        self.scopes.pop()
+
+    def _get_func_type(self, node):
+        return self._func_type_from_parents(self.scopes[::-1])
@@ -1,14 +1,110 @@
+import os
 import ast
+import math
+import hashlib
+import pickle
 import ipdb
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
 
-from ast_visitors import APIDefineVisitor, APICallVisitor, APIImportVisitor
+from ast_visitors import APIDefineVisitor, APICallVisitor, APIImportVisitor, FileIndexVisitor
 from config import REPO_PACKAGE_DIR
 
 
+class FileIndexer:
+    """
+    parses each file of a repo once and collects its called, imported and defined apis.
+    the index of every file is cached on disk with the hash of the file, so unchanged files
+    are not parsed again
+    """
+
+    def __init__(self, repo, source_code_files, cache_path=None, num_workers=1):
+        self.repo = repo
+        self.source_code_files = source_code_files
+        self.cache_path = cache_path
+        self.num_workers = num_workers  # files are parsed in one chunk per worker
+
+    def _file_hash(self, fpath_tuple, code):
+        # the module of a file decides how its relative imports are resolved
+        file_module = build_file_module_from_file_tuple(self.repo, fpath_tuple)
+        return hashlib.sha256(f"{file_module}\n{code}".encode("utf8")).hexdigest()
+
+    def _index_file(self, fpath_tuple, code):
+        file_module = build_file_module_from_file_tuple(self.repo, fpath_tuple)
+        try:
+            tree = ast.parse(code)
+            visitor = FileIndexVisitor(file_module, fpath_tuple)
+            visitor.visit(tree)
+        except Exception as e:
+            print(f"{fpath_tuple} fail to parse: {e}")
+            return None  # cached too, so that the file is not parsed again
+        return {
+            "called_apis": visitor.called_apis,
+            "imported_apis": visitor.imported_apis,
+            "defined_classes": visitor.defined_classes,
+            "defined_outer_apis": visitor.defined_outer_apis,
+        }
+
+    def _index_files(self, files):
+        if self.num_workers <= 1 or len(files) < 2:
+            return [
+                (fpath_tuple, self._index_file(fpath_tuple, code)) for fpath_tuple, code in files
+            ]
+        chunk_size = math.ceil(len(files) / self.num_workers)
+        chunks = [files[i : i + chunk_size] for i in range(0, len(files), chunk_size)]
+        with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+            return [
+                indexed
+                for indexed_chunk in executor.map(_index_files, repeat(self.repo), chunks)
+                for indexed in indexed_chunk
+            ]
+
+    def get_index_by_file(self):
+        """
+        returns the index of every file that can be parsed
+        """
+        cached = dict()
+        if self.cache_path and os.path.exists(self.cache_path):
+            with open(self.cache_path, "rb") as f:
+                cached = pickle.load(f)
+
+        print(f"Indexing APIs in {self.repo}")
+        file_hashes = dict()
+        files_to_parse = []
+        for fpath_tuple, code in self.source_code_files.items():
+            file_hashes[fpath_tuple] = self._file_hash(fpath_tuple, code)
+            if fpath_tuple not in cached or cached[fpath_tuple][0] != file_hashes[fpath_tuple]:
+                files_to_parse.append((fpath_tuple, code))
+        parsed = dict(self._index_files(files_to_parse))
+        print(f"Parsed {len(parsed)} out of {len(self.source_code_files)} files")
+
+        entries = dict()
+        index_by_file = dict()
+        for fpath_tuple, file_hash in file_hashes.items():
+            index = parsed[fpath_tuple] if fpath_tuple in parsed else cached[fpath_tuple][1]
+            entries[fpath_tuple] = (file_hash, index)
+            if index is not None:
+                index_by_file[fpath_tuple] = index
+
+        if self.cache_path and (parsed or entries.keys() != cached.keys()):
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            with open(self.cache_path, "wb") as f:
+                pickle.dump(entries, f)
+        return index_by_file
+
+
+def _index_files(repo, files):
+    # runs in a pool process on a chunk of (fpath_tuple, code) pairs
+    return FileIndexer(repo, dict())._index_files(files)
+
+
 class FileCallAPI:
-    def __init__(self, repo, source_code_files):
+    def __init__(self, repo, source_code_files, index_by_file=None):
         self.repo = repo
         self.source_code_files = source_code_files
+        self.index_by_file = index_by_file  # from FileIndexer, saves parsing the files again
         self.api_calls_by_file = dict()
 
     def _ast_processor_call(self, code, fpath_tuple):
@@ -19,6 +115,12 @@ class FileCallAPI:
     def get_called_apis_by_file(self):
         print(f"Collecting called APIs in {self.repo}")
         for fpath_tuple, code in self.source_code_files.items():
+            if self.index_by_file is not None:
+                if fpath_tuple in self.index_by_file:
+                    self.api_calls_by_file[fpath_tuple] = self.index_by_file[fpath_tuple][
+                        "called_apis"
+                    ]
+                continue
             try:
                 visitor = self._ast_processor_call(code, fpath_tuple)
             except Exception as e:
@@ -29,9 +131,10 @@ class FileCallAPI:
 
 
 class FileDefinedAPI:
-    def __init__(self, repo, source_code_files):
+    def __init__(self, repo, source_code_files, index_by_file=None):
         self.repo = repo
         self.source_code_files = source_code_files
+        self.index_by_file = index_by_file  # from FileIndexer, saves parsing the files again
         self.defined_apis_by_file = dict()
 
     def _ast_processor_define(self, code, fpath_tuple):
@@ -47,6 +150,14 @@ class FileDefinedAPI:
         """
         print(f"Finding defined APIs in {self.repo}")
         for fpath_tuple, code in self.source_code_files.items():
+            if self.index_by_file is not None:
+                if fpath_tuple in self.index_by_file:
+                    index = self.index_by_file[fpath_tuple]
+                    self.defined_apis_by_file[fpath_tuple] = {
+                        "defined_classes": index["defined_classes"],
+                        "defined_outer_apis": index["defined_outer_apis"],
+                    }
+                continue
             try:
                 visitor = self._ast_processor_define(code, fpath_tuple)
             except Exception as e:
@@ -60,11 +171,13 @@ class FileDefinedAPI:
 
 
 class FileImportedAPI:
-    def __init__(self, repo, source_code_files, defined_apis_by_file):
+    def __init__(self, repo, source_code_files, defined_apis_by_file, index_by_file=None):
         self.repo = repo
         self.source_code_files = source_code_files
         self.defined_apis_by_file = defined_apis_by_file
+        self.index_by_file = index_by_file  # from FileIndexer, saves parsing the files again
         self.imported_apis_by_file = dict()
+        self.fpath_tuples_by_module_suffix = None
 
     def _ast_processor_import(self, code, file_tuple):
         file_module = build_file_module_from_file_tuple(self.repo, file_tuple)
@@ -79,13 +192,18 @@ class FileImportedAPI:
         """
         print(f"Finding imported APIs in {self.repo}")
         for fpath_tuple, code in self.source_code_files.items():
-            try:
-                visitor = self._ast_processor_import(code, fpath_tuple)
-            except Exception as e:
-                print(f"{fpath_tuple} fail to parse: {e}")
-                continue
+            if self.index_by_file is not None:
+                if fpath_tuple not in self.index_by_file:
+                    continue
+                imported_apis = self.index_by_file[fpath_tuple]["imported_apis"]
+            else:
+                try:
+                    imported_apis = self._ast_processor_import(code, fpath_tuple).imported_apis
+                except Exception as e:
+                    print(f"{fpath_tuple} fail to parse: {e}")
+                    continue
             # tring to locate the module of the imported api and the type of api (class or outer func)
-            self.imported_apis_by_file[fpath_tuple] = self._get_apis_info(visitor.imported_apis)
+            self.imported_apis_by_file[fpath_tuple] = self._get_apis_info(imported_apis)
         return self.imported_apis_by_file
 
     def _get_apis_info(self, imported_apis):
@@ -142,19 +260,28 @@ class FileImportedAPI:
             "imported_members": imported_members,  # not necessarily a callable api
         }
 
+    def _build_module_suffix_index(self):
+        """
+        maps every dotted suffix of the module of each file to the files, in the order of
+        defined_apis_by_file, e.g. "a.b.c" is found by "a.b.c", "b.c" and "c"
+        """
+        fpath_tuples_by_module_suffix = defaultdict(list)
+        for fpath_tuple in self.defined_apis_by_file.keys():
+            module_parts = build_file_module_from_file_tuple(self.repo, fpath_tuple).split(".")
+            for i in range(len(module_parts)):
+                fpath_tuples_by_module_suffix[".".join(module_parts[i:])].append(fpath_tuple)
+        return fpath_tuples_by_module_suffix
+
     def _map_imported_api_to_fpath_tuple(self, imported_api):
         """
         return the most possible file module for the imported api
         """
+        if self.fpath_tuples_by_module_suffix is None:
+            self.fpath_tuples_by_module_suffix = self._build_module_suffix_index()
 
         def __find_possible_fpath_tuple(imported_node, current_fpath_tuple):
-            located_file_tuples = [
-                fpath_tuple
-                for fpath_tuple in self.defined_apis_by_file.keys()
-                if f".{build_file_module_from_file_tuple(self.repo, fpath_tuple)}".endswith(
-                    f".{imported_node}"
-                )
-            ]
+            # the files whose module ends with the imported module
+            located_file_tuples = self.fpath_tuples_by_module_suffix.get(imported_node, [])
             if len(located_file_tuples) == 1:
                 return located_file_tuples[0]
             elif len(located_file_tuples) < 1:
@@ -223,6 +350,7 @@ class FileImportedAPI:
         return common_length
 
 
+@lru_cache(maxsize=None)
 def build_file_module_from_file_tuple(repo, fpath_tuple):
     # fpath_tuple: (repo_name, 'webui', 'launch.py')
     assert fpath_tuple[0] == repo and fpath_tuple[-1].endswith(".py")
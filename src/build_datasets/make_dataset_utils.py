@@ -1,6 +1,5 @@
 import os
 import glob
-import ipdb
 import pickle
 import json
 import tiktoken
@@ -13,11 +12,23 @@ class CodexTokenizer:
     def tokenize(self, text):
         return self.tokenizer.encode_ordinary(text)
 
+    def tokenize_batch(self, texts):
+        return self.tokenizer.encode_ordinary_batch(texts)
+
     def decode(self, token_ids):
         return self.tokenizer.decode(token_ids)
 
 
 class Tools:
+    # one tokenizer per process, shared by every digger and pool task running in it
+    _tokenizer = None
+
+    @staticmethod
+    def get_tokenizer():
+        if Tools._tokenizer is None:
+            Tools._tokenizer = CodexTokenizer()
+        return Tools._tokenizer
+
     @staticmethod
     def read_code(fname):
         with open(fname, "r", encoding="utf8") as f:
@@ -58,15 +69,39 @@ class Tools:
             return lines
 
     @staticmethod
-    def trim_context(tokenizer, previous_context_lines, context_max_tokens):
+    def _count_line_tokens(tokenizer, lines, lineno, line_token_counts):
+        if line_token_counts is None:
+            return len(tokenizer.tokenize(lines[lineno]))
+        if line_token_counts[lineno] is None:
+            line_token_counts[lineno] = len(tokenizer.tokenize(lines[lineno]))
+        return line_token_counts[lineno]
+
+    @staticmethod
+    def trim_context(tokenizer, previous_context_lines, context_max_tokens, line_token_counts=None):
+        # keeps the last context_max_tokens tokens of the context, as tokenizing the whole context
+        # would, but only tokenizes the lines needed for them. line_token_counts caches the token
+        # count of each line of the file (None until counted) across the holes of a file.
         previous_total_lines = len(previous_context_lines)
-        previous_context = "\n".join(previous_context_lines)
-        tokens = tokenizer.tokenize(previous_context)
-        decoded_context_total_lines = tokenizer.decode(tokens).count("\n") + 1
-        try:
-            assert previous_total_lines == decoded_context_total_lines
-        except AssertionError:
-            ipdb.set_trace()
+        start_lineno = previous_total_lines
+        estimated_tokens = 0
+        while start_lineno > 0 and estimated_tokens <= context_max_tokens:
+            start_lineno -= 1
+            estimated_tokens += 1 + Tools._count_line_tokens(
+                tokenizer, previous_context_lines, start_lineno, line_token_counts
+            )
+        while True:
+            # tokens are split at whitespace, so from the first non-blank character of a line on
+            # the context tokenizes the same whatever comes before that line
+            while start_lineno > 0 and not previous_context_lines[start_lineno].strip():
+                start_lineno -= 1
+            first_line = previous_context_lines[start_lineno] if previous_context_lines else ""
+            leading_whitespace = first_line[: len(first_line) - len(first_line.lstrip())]
+            tokens = tokenizer.tokenize("\n".join(previous_context_lines[start_lineno:]))
+            unaligned_tokens = len(tokenizer.tokenize(leading_whitespace))
+            if start_lineno == 0 or len(tokens) - unaligned_tokens >= context_max_tokens:
+                break
+            # the line counts underestimated the context, take twice as many lines
+            start_lineno = max(0, 2 * start_lineno - previous_total_lines)
         trimmed_tokens = tokens[-context_max_tokens:]
         trimmed_context = tokenizer.decode(trimmed_tokens)
         trimed_context_total_lines = trimmed_context.count("\n") + 1
@@ -79,7 +114,8 @@ class Tools:
     def iterate_repository(repo):
         base_dir = "data/repositories"
         pattern = os.path.join(f"{base_dir}/{repo}", "**", "*.py")
-        files = glob.glob(pattern, recursive=True)
+        # sorted, so that the files and what is sampled from them do not depend on the file system
+        files = sorted(glob.glob(pattern, recursive=True))
 
         skipped_files = []
         loaded_code_files = dict()
@@ -101,5 +137,4 @@ class Tools:
 
     @staticmethod
     def tokenize(code):
-        tokenizer = CodexTokenizer()
-        return tokenizer.tokenize(code)
+        return Tools.get_tokenizer().tokenize(code)
@@ -1,7 +1,10 @@
 import os
 import random
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
-from make_dataset_utils import Tools, CodexTokenizer
+from make_dataset_utils import Tools
 
 
 class RandomHoleDigger:
@@ -12,82 +15,118 @@ class RandomHoleDigger:
         context_max_tokens=2000,
         line_min_tokens=5,
         max_sample_per_repo=200,
+        seed=0,
     ):
         self.source_code_files = Tools.iterate_repository(repo)
         self.context_max_tokens = context_max_tokens
         self.max_sample_per_repo = max_sample_per_repo
         self.line_min_tokens = line_min_tokens
         self.repo = repo
-        self.tokenizer = CodexTokenizer()
+        self.tokenizer = Tools.get_tokenizer()
+        self.rng = random.Random(f"{seed}/{repo}")
+        # token count of each line, per file, filled in by trim_context as holes need them
+        self.line_token_counts_by_file = dict()
 
     def _get_line_types(self, lines):
-        line_types = dict()
+        line_types = []
         in_multiline_comment = False
         multiline_comment_start = ""
-        for lineno, line in enumerate(lines):
+        for line in lines:
             stripped_line = line.strip()
             if not stripped_line:
-                line_types[lineno] = "empty"
+                line_types.append("empty")
                 continue
             if in_multiline_comment:
                 if stripped_line.endswith(multiline_comment_start):
                     in_multiline_comment = False
-                line_types[lineno] = "comment"
+                line_types.append("comment")
             elif stripped_line.startswith('"""') or stripped_line.startswith("'''"):
                 in_multiline_comment = True
                 multiline_comment_start = stripped_line[:3]
-                line_types[lineno] = "comment"
-            elif stripped_line and stripped_line[0] == "#":
-                line_types[lineno] = "comment"
+                line_types.append("comment")
+            elif stripped_line[0] == "#":
+                line_types.append("comment")
             else:
-                line_types[lineno] = "code"
+                line_types.append("code")
         return line_types
 
     def _get_usable_lines(self, lines):
+        # code lines that follow a non-empty line
         line_types = self._get_line_types(lines)
-        usable_lines = []
-        for lineno, line_type in line_types.items():
-            if line_type == "code":
-                if lineno == 0:
-                    continue
-                if line_types[lineno - 1] == "empty":
-                    continue
-                usable_lines.append(lineno)
-        return usable_lines
+        return [
+            lineno
+            for lineno in range(1, len(line_types))
+            if line_types[lineno] == "code" and line_types[lineno - 1] != "empty"
+        ]
+
+    def _iterate_candidates(self, candidate_lines):
+        # a Fisher-Yates shuffle drawn one candidate at a time, so that only the candidates
+        # looked at before max_sample_per_repo lines are chosen get shuffled
+        for i in range(len(candidate_lines)):
+            j = self.rng.randrange(i, len(candidate_lines))
+            candidate_lines[i], candidate_lines[j] = candidate_lines[j], candidate_lines[i]
+            yield candidate_lines[i]
+
+    def _get_too_long_lines(self, lines):
+        # a token covers at least one byte, so only lines of more than context_max_tokens bytes
+        # need to be tokenized to know if they fit
+        long_lines = [line for line in lines if len(line.encode("utf8")) > self.context_max_tokens]
+        if not long_lines:
+            return set()
+        token_lists = self.tokenizer.tokenize_batch(long_lines)
+        return {
+            line
+            for line, tokens in zip(long_lines, token_lists)
+            if len(tokens) > self.context_max_tokens
+        }
 
     def get_chosen_lines(self):
+        code_lines_by_file = dict()
         candidate_lines = []
         for fpath_tuple, code in self.source_code_files.items():
             code_lines = code.splitlines()
-            usable_lines = self._get_usable_lines(code_lines)
-            candidate_lines.extend([(fpath_tuple, line_no) for line_no in usable_lines])
-        random.shuffle(candidate_lines)
+            code_lines_by_file[fpath_tuple] = code_lines
+            candidate_lines.extend(
+                (fpath_tuple, line_no) for line_no in self._get_usable_lines(code_lines)
+            )
+        candidates = self._iterate_candidates(candidate_lines)
         chosen_lines = []
         chosen_line_strs = set()
-        for fpath_tuple, line_no in candidate_lines:
-            code_lines = self.source_code_files[fpath_tuple].splitlines()
-            line = code_lines[line_no]
-            if len(self.tokenizer.tokenize(line)) > self.context_max_tokens:
-                continue
-            if line.strip() in chosen_line_strs:
-                continue
-            chosen_line_strs.add(line.strip())
-            chosen_lines.append(
-                {
-                    "fpath_tuple": fpath_tuple,
-                    "line_no": line_no,
-                    "ground_truth": line,
-                    "code_lines": code_lines,
-                }
-            )
-            if len(chosen_lines) >= self.max_sample_per_repo:
+        while len(chosen_lines) < self.max_sample_per_repo:
+            # draws as many candidates as lines are still needed, and tokenizes them together
+            batch = list(itertools.islice(candidates, self.max_sample_per_repo - len(chosen_lines)))
+            if not batch:
                 break
+            too_long_lines = self._get_too_long_lines(
+                [code_lines_by_file[fpath_tuple][line_no] for fpath_tuple, line_no in batch]
+            )
+            for fpath_tuple, line_no in batch:
+                code_lines = code_lines_by_file[fpath_tuple]
+                line = code_lines[line_no]
+                if line in too_long_lines:
+                    continue
+                if line.strip() in chosen_line_strs:
+                    continue
+                chosen_line_strs.add(line.strip())
+                chosen_lines.append(
+                    {
+                        "fpath_tuple": fpath_tuple,
+                        "line_no": line_no,
+                        "ground_truth": line,
+                        "code_lines": code_lines,
+                    }
+                )
         return chosen_lines
 
     def _make_context(self, line):
         previous_lines = line["code_lines"][: line["line_no"]]
+        if line["fpath_tuple"] not in self.line_token_counts_by_file:
+            self.line_token_counts_by_file[line["fpath_tuple"]] = [None] * len(line["code_lines"])
         trimmed_lines, trimed_context_start_lineno = Tools.trim_context(
-            self.tokenizer, previous_lines, self.context_max_tokens
+            self.tokenizer,
+            previous_lines,
+            self.context_max_tokens,
+            self.line_token_counts_by_file[line["fpath_tuple"]],
         )
         return "\n".join(trimmed_lines), trimed_context_start_lineno
 
@@ -112,6 +151,12 @@ class RandomHoleDigger:
         return test_data
 
 
+def _make_repo_dataset(repo_base_dir, repo, seed):
+    # runs in a pool process, one per repo
+    print(f"Processing {repo}")
+    return RandomHoleDigger(repo_base_dir, repo, seed=seed).make_dataset()
+
+
 if __name__ == "__main__":
     OUT_BASE_DIR = "output"
     REPO_BASE_DIR = "downloaded_repos"
@@ -127,9 +172,14 @@ if __name__ == "__main__":
         "pytorch_rl",
         "opendilab_ACE",
     ]
+    seed = 0
     lines = []
-    for repo in repos:
-        print(f"Processing {repo}")
-        digger = RandomHoleDigger(REPO_BASE_DIR, repo)
-        lines += digger.make_dataset()
+    with ProcessPoolExecutor(
+        max_workers=min(os.cpu_count(), len(repos)), initializer=Tools.get_tokenizer
+    ) as executor:
+        # map keeps the order of the repos, so the output only depends on the seed
+        for repo_lines in executor.map(
+            _make_repo_dataset, repeat(REPO_BASE_DIR), repos, repeat(seed)
+        ):
+            lines += repo_lines
     Tools.dump_jsonl(lines, os.path.join(OUT_BASE_DIR, "ten-repos-random-line-completion.jsonl"))
@@ -0,0 +1,62 @@
+class TokenBudgetScheduler:
+    """
+    Groups prompts into generation batches by token length instead of file order.
+
+    Prompts are sorted by length so that each batch holds prompts of similar size, and a batch
+    grows until its padded size (rows x longest row) would exceed `max_batch_tokens`. This keeps
+    left-padding waste low and bounds the memory of every forward pass. Prompts that cannot fit
+    in the model context are reported separately instead of failing the run.
+    """
+
+    def __init__(self, max_length, max_batch_tokens=None, max_batch_size=None):
+        """
+        Args:
+            max_length: Context limit of the model (prompt plus generated tokens).
+            max_batch_tokens: Upper bound on padded tokens per batch; None means no bound.
+            max_batch_size: Upper bound on prompts per batch; None means no bound.
+        """
+        self.max_length = max_length
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+
+    def _fits(self, batch_rows, row_length):
+        if self.max_batch_size is not None and batch_rows > self.max_batch_size:
+            return False
+        if self.max_batch_tokens is not None and batch_rows * row_length > self.max_batch_tokens:
+            return False
+        return True
+
+    def schedule(self, prompt_lengths, max_new_tokens):
+        """
+        Plans the generation batches.
+
+        Args:
+            prompt_lengths: Token length of each prompt.
+            max_new_tokens: Tokens each prompt may generate, counted towards the budget.
+
+        Returns:
+            A list of batches (lists of prompt indices, longest prompts first) and the list of
+            indices of prompts too long to generate any token.
+        """
+        too_long = [i for i, length in enumerate(prompt_lengths) if length >= self.max_length]
+        too_long_set = set(too_long)
+        order = sorted(
+            [i for i in range(len(prompt_lengths)) if i not in too_long_set],
+            key=lambda i: prompt_lengths[i],
+            reverse=True,
+        )
+
+        batches = []
+        batch = []
+        for index in order:
+            if batch:
+                # the first prompt of a batch is its longest one
+                row_length = min(prompt_lengths[batch[0]] + max_new_tokens, self.max_length)
+                if self._fits(len(batch) + 1, row_length):
+                    batch.append(index)
+                    continue
+                batches.append(batch)
+            batch = [index]
+        if batch:
+            batches.append(batch)
+        return batches, too_long
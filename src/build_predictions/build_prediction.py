@@ -1,29 +1,86 @@
 import os
+import json
+import hashlib
 import torch
 import tqdm
 from transformers import AutoModelForCausalLM, AutoTokenizer
 
+from src.build_predictions.batch_scheduler import TokenBudgetScheduler
+from src.build_predictions.inference_pool import InferencePool
+from src.build_predictions.line_stopping import LineBudgetDecoder, count_lines_needed
+from src.build_predictions.prefix_cache import PrefixCacheGenerator
+from src.build_predictions.prompt_lookup import PromptLookupDecoder
+from src.utils.file_path_builder import FilePathBuilder
+from src.utils.stage_profiler import StageProfiler
 from src.utils.tools import Tools
-from src.utils.constants import Constants
+
+# name of the prompt lookup decoder in the paths of its shard checkpoints
+_PROMPT_LOOKUP_DECODER = "prompt-lookup"
 
 
 class BuildPrediction:
-    def __init__(self, model_name, batch_size):
+    def __init__(
+        self,
+        model_name,
+        batch_size,
+        max_batch_tokens=None,
+        num_replicas=1,
+        threads_per_replica=None,
+        quantize=False,
+        benchmark=None,
+    ):
         self.model_name = model_name
         self.model = AutoModelForCausalLM.from_pretrained(model_name)
+        if quantize:
+            # int8 weights with activations quantized on the fly, CPU only
+            self.model = torch.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
         self.tokenizer = AutoTokenizer.from_pretrained(model_name, padding_side="left")
         self.tokenizer.add_special_tokens({"pad_token": self.tokenizer.eos_token})
         # self.model.cuda()
         self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.num_replicas = num_replicas
+        self.threads_per_replica = threads_per_replica
+        # with a benchmark, generation stops once the scored number of lines is produced
+        self.benchmark = benchmark
         print("done loading model")
 
-    def _get_batchs(self, prompts, batch_size):
-        batches = []
-        for i in range(0, len(prompts), batch_size):
-            batches.append(prompts[i : i + batch_size])
-        return batches
+    def _get_batchs(self, prompts, max_new_tokens=100):
+        """
+        Plans length-bucketed batches of prompt indices under the batch size and token budget.
+        Also returns the indices of prompts too long to generate any token.
+        """
+        prompt_lengths = [len(ids) for ids in self.tokenizer(prompts)["input_ids"]]
+        scheduler = TokenBudgetScheduler(
+            self.model.config.max_position_embeddings, self.max_batch_tokens, self.batch_size
+        )
+        return scheduler.schedule(prompt_lengths, max_new_tokens)
+
+    def _generate_batches(self, prompt_batches, lines_needed_batches):
+        """
+        Yields (batch index, completions) for every batch, in this process or, with more
+        than one replica, on an `InferencePool`.
+        """
+        if self.num_replicas <= 1:
+            for batch_id, prompt_batch in enumerate(tqdm.tqdm(prompt_batches)):
+                yield batch_id, self._generate_batch(
+                    prompt_batch, lines_needed=lines_needed_batches[batch_id]
+                )
+            return
+        pool = InferencePool(self, self.num_replicas, self.threads_per_replica)
+        yield from tqdm.tqdm(
+            pool.imap_batches(prompt_batches, lines_needed_batches), total=len(prompt_batches)
+        )
+        pool.report()
+
+    def _generate_batch(self, prompt_batch, max_new_tokens=100, lines_needed=None):
+        if lines_needed is not None:
+            return LineBudgetDecoder(self.model, self.tokenizer).generate(
+                prompt_batch, lines_needed, max_new_tokens
+            )
 
-    def _generate_batch(self, prompt_batch, max_new_tokens=100):
         prompts = self.tokenizer(prompt_batch, return_tensors="pt", padding=True, truncation=True)
 
         input_ids = prompts["input_ids"]
@@ -54,43 +111,212 @@ class BuildPrediction:
             gen_text[i] = gen_text[i][len(prompt_batch[i]) :]
         return gen_text
 
-    def batch_generate(self, file):
+    def batch_generate(self, file, shard_id=0, num_shards=1):
+        """
+        Generates completions for the prompts of `file` that fall into shard `shard_id` of
+        `num_shards` (by task-id hash), appending each finished batch to the shard's
+        checkpoint file. Task ids already in the checkpoint are skipped, so an interrupted
+        run resumes where it stopped. Once every shard is complete, they are merged into
+        `{base_name}.{model_suffix}.jsonl`.
+        """
         print(f"generating from {file}")
-        lines = Tools.load_jsonl(file)
+        shard_path, lines = self._load_pending_lines(file, shard_id, num_shards)
         # have a new line at the end
         prompts = [f"{line['prompt']}\n" for line in lines]
 
-        # for prompt in prompts:
-        #     print(prompt)
-        #     print()
-        #     print()
-        #     print()
-
-        batches = self._get_batchs(prompts, self.batch_size)
-        gen_text = []
-        for batch in tqdm.tqdm(batches):
-            print(batch)
-            gen_text.extend(self._generate_batch(batch))
-        print(f"generated {len(gen_text)} samples")
-        assert len(gen_text) == len(prompts)
-        new_lines = []
-        for line, gen in zip(lines, gen_text):
-            new_lines.append(
-                {
-                    "prompt": line["prompt"],
-                    "metadata": line["metadata"],
-                    "choices": [{"text": gen}],
-                }
+        batches, too_long = self._get_batchs(prompts)
+        error = (
+            "Prompt too long! Cannot generate any new tokens within the context limit "
+            f"({self.model.config.max_position_embeddings})"
+        )
+        Tools.append_jsonl(
+            self._make_prediction_lines(
+                [lines[i] for i in too_long], [""] * len(too_long), [error] * len(too_long)
+            ),
+            shard_path,
+        )
+        prompt_batches = [[prompts[i] for i in batch] for batch in batches]
+        if self.benchmark:
+            lines_needed_batches = [
+                [
+                    count_lines_needed(self.benchmark, lines[i]["metadata"]["ground_truth"])
+                    for i in batch
+                ]
+                for batch in batches
+            ]
+        else:
+            lines_needed_batches = [None] * len(batches)
+        with StageProfiler.profile("generate_predictions") as record:
+            for batch_id, batch_text in self._generate_batches(
+                prompt_batches, lines_needed_batches
+            ):
+                batch = batches[batch_id]
+                Tools.append_jsonl(
+                    self._make_prediction_lines([lines[i] for i in batch], batch_text), shard_path
+                )
+            record["items"] = len(prompts) - len(too_long)
+        print(f"generated {len(prompts) - len(too_long)} samples, {len(too_long)} prompts too long")
+
+        self.merge_predictions(file, num_shards)
+
+    def prompt_lookup_generate(
+        self, file, shard_id=0, num_shards=1, ngram_size=3, num_draft_tokens=10
+    ):
+        """
+        Same as `batch_generate`, but decodes one prompt at a time with `PromptLookupDecoder`,
+        drafting tokens from the retrieved fragments of each prompt. Prints the accepted draft
+        token rate per repo. Its shards are checkpointed apart from those of `batch_generate`.
+        """
+        print(f"generating from {file}")
+        shard_path, lines = self._load_pending_lines(
+            file, shard_id, num_shards, decoder=_PROMPT_LOOKUP_DECODER
+        )
+        decoder = PromptLookupDecoder(self.model, self.tokenizer, ngram_size, num_draft_tokens)
+        with StageProfiler.profile("prompt_lookup_predictions") as record:
+            for line in tqdm.tqdm(lines):
+                metadata = line["metadata"]
+                lines_needed = (
+                    count_lines_needed(self.benchmark, metadata["ground_truth"])
+                    if self.benchmark
+                    else None
+                )
+                # top_k_context is stored best-scored first
+                contexts = [context["context"] for context in metadata.get("top_k_context", [])]
+                gen_text, error = "", None
+                try:
+                    # have a new line at the end
+                    gen_text = decoder.generate(
+                        f"{line['prompt']}\n",
+                        contexts,
+                        repo=metadata["task_id"].split("/")[0],
+                        lines_needed=lines_needed,
+                    )
+                except ValueError as e:
+                    error = str(e)
+                Tools.append_jsonl(
+                    self._make_prediction_lines([line], [gen_text], [error]), shard_path
+                )
+            record["items"] = len(lines)
+        decoder.report()
+
+        self.merge_predictions(file, num_shards, decoder=_PROMPT_LOOKUP_DECODER)
+
+    def _load_pending_lines(self, file, shard_id, num_shards, decoder=None):
+        """
+        Returns the checkpoint path of the shard (of `decoder`, if not the default one) and
+        the prompt lines of the shard that are not in the checkpoint yet.
+        """
+        shard_path = FilePathBuilder.prediction_shard_path(
+            file, self.model_name, shard_id, num_shards, decoder
+        )
+        completed_task_ids = {
+            line["metadata"]["task_id"] for line in self._load_checkpoint(shard_path)
+        }
+        lines = [
+            line
+            for line in Tools.load_jsonl(file)
+            if self._get_shard(line["metadata"]["task_id"], num_shards) == shard_id
+            and line["metadata"]["task_id"] not in completed_task_ids
+        ]
+        print(f"shard {shard_id}/{num_shards}: {len(completed_task_ids)} done, {len(lines)} to go")
+        return shard_path, lines
+
+    def merge_predictions(self, file, num_shards=1, decoder=None):
+        """
+        Merges the shard checkpoints of `file` (written by `decoder`, if not the default one)
+        into `{base_name}.{model_suffix}.jsonl`, in the order of the prompt file. Does nothing
+        while some task ids are missing.
+        """
+        predictions_by_task_id = {}
+        for shard_id in range(num_shards):
+            shard_path = FilePathBuilder.prediction_shard_path(
+                file, self.model_name, shard_id, num_shards, decoder
             )
+            for line in self._load_checkpoint(shard_path):
+                predictions_by_task_id[line["metadata"]["task_id"]] = line
+
+        task_ids = [line["metadata"]["task_id"] for line in Tools.load_jsonl(file)]
+        missing = [task_id for task_id in task_ids if task_id not in predictions_by_task_id]
+        if missing:
+            print(f"{len(missing)} predictions still missing, not merging shards yet")
+            return None
+
+        out_file = FilePathBuilder.prediction_path(file, self.model_name)
+        Tools.dump_jsonl([predictions_by_task_id[task_id] for task_id in task_ids], out_file)
+        print(f"Saved predictions to {out_file}")
+        return out_file
+
+    @staticmethod
+    def _get_shard(task_id, num_shards):
+        # stable across processes and machines, unlike hash()
+        return int(hashlib.md5(task_id.encode("utf8")).hexdigest(), 16) % num_shards
 
-        # Compose output path: e.g., "rg-one-gram-ws-20-ss-2_samples"
-        base_name = os.path.splitext(os.path.basename(file))[0]
-        model_suffix = self.model_name.split("/")[-1]  # e.g., "codegen-350M-mono"
+    @staticmethod
+    def _load_checkpoint(shard_path):
+        """
+        Loads the records of a shard checkpoint. A trailing record cut short by a crash is
+        dropped and the file is rewritten, so that new records can be appended safely.
+        """
+        if not os.path.exists(shard_path):
+            return []
+        lines = []
+        truncated = False
+        with open(shard_path, "r", encoding="utf8") as f:
+            for line in f:
+                try:
+                    lines.append(json.loads(line))
+                except json.JSONDecodeError:
+                    truncated = True
+                    break
+        if truncated:
+            print(f"dropping a truncated record in {shard_path}")
+            Tools.dump_jsonl(lines, shard_path)
+        return lines
 
-        Tools.create_dir(Constants.base_predictions_dir)
-        out_file = os.path.join(Constants.base_predictions_dir, f"{base_name}.{model_suffix}.jsonl")
-        print(out_file)
+    def prefix_cached_generate(self, files, max_new_tokens=100):
+        """
+        Generates greedy completions for one or more prompt files (e.g. the RG, GT and
+        RepoCoder variants of a benchmark) in a single pass, reusing the key/value cache of
+        prompt prefixes shared across all of their prompts.
+        """
+        lines_by_file = {}
+        prompts = []
+        for file in files:
+            print(f"generating from {file}")
+            lines_by_file[file] = Tools.load_jsonl(file)
+            # have a new line at the end
+            prompts.extend([f"{line['prompt']}\n" for line in lines_by_file[file]])
 
-        # Save predictions
-        # Tools.dump_jsonl(new_lines, out_file)
-        # print(f"Saved predictions to {out_file}")
+        generator = PrefixCacheGenerator(self.model, self.tokenizer)
+        gen_text, errors = generator.generate(prompts, max_new_tokens)
+        generator.report()
+
+        offset = 0
+        for file, lines in lines_by_file.items():
+            new_lines = self._make_prediction_lines(
+                lines,
+                gen_text[offset : offset + len(lines)],
+                errors[offset : offset + len(lines)],
+            )
+            offset += len(lines)
+            out_file = FilePathBuilder.prediction_path(file, self.model_name)
+            Tools.dump_jsonl(new_lines, out_file)
+            print(f"Saved predictions to {out_file}")
+
+    def _make_prediction_lines(self, lines, gen_text, errors=None):
+        """
+        Builds prediction records. Prompts with an error message in `errors` are recorded as
+        failures with an empty completion, so they still score as misses.
+        """
+        errors = errors or [None] * len(lines)
+        new_lines = []
+        for line, gen, error in zip(lines, gen_text, errors):
+            new_line = {
+                "prompt": line["prompt"],
+                "metadata": line["metadata"],
+                "choices": [{"text": gen if error is None else ""}],
+            }
+            if error is not None:
+                new_line["error"] = error
+            new_lines.append(new_line)
+        return new_lines
@@ -0,0 +1,158 @@
+import os
+import time
+import queue
+import multiprocessing
+
+import torch
+
+
+def _replica_worker(predictor, cores, num_threads, task_queue, result_queue):
+    """
+    Serves prompt batches from `task_queue` with the model of `predictor`, pinned to `cores`.
+    """
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(num_threads)
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        batch_id, prompt_batch, lines_needed = task
+        start = time.perf_counter()
+        try:
+            gen_text = predictor._generate_batch(prompt_batch, lines_needed=lines_needed)
+        except Exception as e:
+            result_queue.put((batch_id, None, repr(e), 0, 0.0))
+            continue
+        generated_tokens = sum(len(ids) for ids in predictor.tokenizer(gen_text)["input_ids"])
+        seconds = time.perf_counter() - start
+        result_queue.put((batch_id, gen_text, None, generated_tokens, seconds))
+
+
+class InferencePool:
+    """
+    Pool of CPU model replicas fed from a shared prompt-batch queue.
+
+    At small batch sizes a single model scales poorly with torch intra-op threads, so the
+    available cores are split between `num_replicas` worker processes, each pinned to its own
+    core subset and running `threads_per_replica` torch threads. Workers are forked from the
+    process that loaded the model after its weights were moved to shared memory, so the
+    replicas map the same weight pages instead of loading a copy each.
+    """
+
+    def __init__(self, predictor, num_replicas, threads_per_replica=None, poll_seconds=5.0):
+        """
+        Args:
+            predictor: A loaded `BuildPrediction` whose model and tokenizer the replicas use.
+            num_replicas: Number of worker processes.
+            threads_per_replica: Torch threads (and pinned cores) per replica; defaults to an
+                even split of the cores available to this process.
+            poll_seconds: Interval at which the replicas are checked while waiting for results.
+        """
+        self.predictor = predictor
+        self.num_replicas = num_replicas
+        self.poll_seconds = poll_seconds
+        if hasattr(os, "sched_getaffinity"):
+            self.cores = sorted(os.sched_getaffinity(0))
+        else:
+            self.cores = list(range(os.cpu_count()))
+        self.threads_per_replica = threads_per_replica or max(1, len(self.cores) // num_replicas)
+        self.stats = {"batches": 0, "generated_tokens": 0, "busy_seconds": 0.0, "seconds": 0.0}
+
+    def _get_replica_cores(self, replica_id):
+        # wraps around when replicas x threads exceeds the available cores
+        return [
+            self.cores[(replica_id * self.threads_per_replica + i) % len(self.cores)]
+            for i in range(self.threads_per_replica)
+        ]
+
+    def _get_result(self, result_queue, workers):
+        """
+        Waits for the next result, checking between polls that the replicas are still alive:
+        a replica killed by the OS (e.g. out of memory) never posts the result of its batch.
+        """
+        while True:
+            try:
+                return result_queue.get(timeout=self.poll_seconds)
+            except queue.Empty:
+                pass
+            crashed = [worker for worker in workers if worker.exitcode not in (None, 0)]
+            if crashed:
+                raise RuntimeError(
+                    f"replica {crashed[0].pid} exited with code {crashed[0].exitcode} "
+                    "with batches still outstanding"
+                )
+            if all(worker.exitcode is not None for worker in workers):
+                raise RuntimeError("all replicas exited with batches still outstanding")
+
+    def imap_batches(self, prompt_batches, lines_needed_batches=None):
+        """
+        Generates completions for every batch on the replicas.
+
+        Args:
+            prompt_batches: Lists of prompt strings.
+            lines_needed_batches: Per batch, the lines to generate for each prompt before
+                stopping, or None to generate up to the token limit.
+
+        Yields:
+            (batch index, completions) pairs in completion order.
+        """
+        context = multiprocessing.get_context("fork")
+        task_queue = context.Queue()
+        result_queue = context.Queue()
+        self.predictor.model.share_memory()
+
+        workers = []
+        for replica_id in range(self.num_replicas):
+            worker = context.Process(
+                target=_replica_worker,
+                args=(
+                    self.predictor,
+                    self._get_replica_cores(replica_id),
+                    self.threads_per_replica,
+                    task_queue,
+                    result_queue,
+                ),
+            )
+            worker.start()
+            workers.append(worker)
+
+        start = time.perf_counter()
+        finished = False
+        try:
+            lines_needed_batches = lines_needed_batches or [None] * len(prompt_batches)
+            for batch_id, prompt_batch in enumerate(prompt_batches):
+                task_queue.put((batch_id, prompt_batch, lines_needed_batches[batch_id]))
+            for _ in workers:
+                task_queue.put(None)
+
+            for _ in range(len(prompt_batches)):
+                batch_id, gen_text, error, generated_tokens, seconds = self._get_result(
+                    result_queue, workers
+                )
+                if error is not None:
+                    raise RuntimeError(f"replica failed on batch {batch_id}: {error}")
+                self.stats["batches"] += 1
+                self.stats["generated_tokens"] += generated_tokens
+                self.stats["busy_seconds"] += seconds
+                yield batch_id, gen_text
+            finished = True
+        finally:
+            self.stats["seconds"] += time.perf_counter() - start
+            for worker in workers:
+                if not finished:
+                    worker.terminate()
+                worker.join()
+
+    def report(self):
+        """
+        Prints aggregate throughput and replica utilisation.
+        """
+        stats = self.stats
+        seconds = max(stats["seconds"], 1e-9)
+        print(
+            f"{self.num_replicas} replicas x {self.threads_per_replica} threads: "
+            f"{stats['batches']} batches, {stats['generated_tokens']} tokens in {seconds:.1f}s"
+        )
+        print(f"aggregate generated tokens/sec: {stats['generated_tokens'] / seconds:.2f}")
+        print(f"replica utilisation: {stats['busy_seconds'] / (seconds * self.num_replicas):.2%}")
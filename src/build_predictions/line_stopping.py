@@ -0,0 +1,121 @@
+import torch
+
+from src.utils.constants import Constants
+
+
+def count_lines_needed(benchmark, ground_truth):
+    """
+    Number of non-empty completion lines the benchmark scores (see `compute_EM`/`compute_ES`,
+    which keep only as many prediction lines as the target has). Line benchmarks complete
+    a single line; API benchmarks complete a call that may span several lines.
+    """
+    if benchmark in (Constants.line_benchmark, Constants.short_line_benchmark):
+        return 1
+    return max(1, len([line for line in ground_truth.splitlines() if line.strip()]))
+
+
+def count_complete_lines(text):
+    """
+    Number of non-empty lines of `text` that are terminated by a newline.
+    """
+    return len([line for line in text.split("\n")[:-1] if line.strip()])
+
+
+class LineBudgetDecoder:
+    """
+    Batched greedy decoder that stops each sequence once it has produced the number of
+    complete, non-empty lines that will be scored.
+
+    Finished sequences are dropped from the active batch (and from the key/value cache),
+    so the remaining ones are decoded with smaller forward passes.
+    """
+
+    def __init__(self, model, tokenizer):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_length = model.config.max_position_embeddings
+
+    @staticmethod
+    def _select_rows(past_key_values, rows):
+        """
+        Keeps the given batch rows of a key/value cache, for `Cache` objects and the legacy
+        tuple-of-tuples layout.
+        """
+        if hasattr(past_key_values, "batch_select_indices"):
+            past_key_values.batch_select_indices(rows)
+            return past_key_values
+        return tuple(
+            tuple(tensor.index_select(0, rows) for tensor in layer) for layer in past_key_values
+        )
+
+    def generate(self, prompt_batch, lines_needed, max_new_tokens=100):
+        """
+        Args:
+            prompt_batch: Prompt strings.
+            lines_needed: Non-empty lines to generate for each prompt before stopping.
+            max_new_tokens: Upper bound on generated tokens per prompt.
+
+        Returns:
+            Completion strings in the order of `prompt_batch`.
+        """
+        prompt_ids = [self.tokenizer(prompt)["input_ids"] for prompt in prompt_batch]
+        longest = max(len(ids) for ids in prompt_ids)
+        max_new_tokens = min(max_new_tokens, self.max_length - longest)
+        if max_new_tokens <= 0:
+            raise ValueError(
+                f"Prompt too long! Cannot generate any new tokens within the context limit ({self.max_length})"
+            )
+
+        # left padding, as in BuildPrediction._generate_batch
+        pad_id = self.tokenizer.pad_token_id
+        input_ids = torch.tensor([[pad_id] * (longest - len(ids)) + ids for ids in prompt_ids])
+        attention_mask = torch.tensor(
+            [[0] * (longest - len(ids)) + [1] * len(ids) for ids in prompt_ids]
+        )
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+
+        generated = [[] for _ in prompt_batch]
+        active = list(range(len(prompt_batch)))
+        past_key_values = None
+        with torch.no_grad():
+            for _ in range(max_new_tokens):
+                outputs = self.model(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    position_ids=position_ids,
+                    past_key_values=past_key_values,
+                    use_cache=True,
+                )
+                next_tokens = outputs.logits[:, -1].argmax(dim=-1).tolist()
+
+                keep = []
+                for row, (index, token) in enumerate(zip(active, next_tokens)):
+                    generated[index].append(token)
+                    if token == self.tokenizer.eos_token_id:
+                        continue
+                    # only a token containing a newline can complete a line
+                    if "\n" in self.tokenizer.decode([token]) and (
+                        count_complete_lines(
+                            self.tokenizer.decode(generated[index], skip_special_tokens=True)
+                        )
+                        >= lines_needed[index]
+                    ):
+                        continue
+                    keep.append(row)
+                if not keep:
+                    break
+
+                rows = torch.tensor(keep)
+                active = [active[row] for row in keep]
+                past_key_values = self._select_rows(outputs.past_key_values, rows)
+                input_ids = torch.tensor([[next_tokens[row]] for row in keep])
+                attention_mask = torch.cat(
+                    [attention_mask.index_select(0, rows), torch.ones(len(keep), 1).long()], dim=1
+                )
+                position_ids = position_ids.index_select(0, rows)[:, -1:] + 1
+
+        gen_text = []
+        for prompt, ids, new_ids in zip(prompt_batch, prompt_ids, generated):
+            text = self.tokenizer.decode(ids + new_ids, skip_special_tokens=True)
+            gen_text.append(text[len(prompt) :])
+        return gen_text
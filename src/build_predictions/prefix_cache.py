@@ -0,0 +1,145 @@
+import time
+
+import torch
+import tqdm
+
+
+class PrefixCacheGenerator:
+    """
+    Greedy generator that reuses the key/value cache of shared prompt prefixes.
+
+    Prompts are tokenized up front and visited in lexicographic token order, so every prompt
+    shares its longest possible prefix with the prompt visited just before it. The cache of that
+    previous prompt is cropped to the shared length and extended with the remaining tokens
+    only, instead of re-encoding the whole prompt. RG, GT and RepoCoder prompts of a benchmark
+    share the prompt header and often leading fragments, so generating them together saves
+    most of the prompt encoding cost on CPU.
+    """
+
+    def __init__(self, model, tokenizer):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_length = model.config.max_position_embeddings
+        self.stats = {
+            "prompts": 0,
+            "prefix_hits": 0,
+            "prompt_tokens": 0,
+            "reused_tokens": 0,
+            "generated_tokens": 0,
+            "seconds": 0.0,
+        }
+
+    @staticmethod
+    def _common_prefix_length(ids1, ids2):
+        length = 0
+        for token1, token2 in zip(ids1, ids2):
+            if token1 != token2:
+                break
+            length += 1
+        return length
+
+    @staticmethod
+    def _crop(past_key_values, length):
+        """
+        Keeps the first `length` positions of a key/value cache.
+        Handles both `Cache` objects and the legacy tuple-of-tuples layout.
+        """
+        if hasattr(past_key_values, "crop"):
+            past_key_values.crop(length)
+            return past_key_values
+        return tuple(tuple(tensor[:, :, :length] for tensor in layer) for layer in past_key_values)
+
+    def _generate_one(self, input_ids, past_key_values, reuse_length, max_new_tokens):
+        """
+        Greedily decodes a single prompt whose first `reuse_length` tokens are already cached.
+        Returns the generated token ids and the cache covering prompt and generation.
+        """
+        max_new_tokens = min(max_new_tokens, self.max_length - len(input_ids))
+        if max_new_tokens <= 0:
+            raise ValueError(
+                f"Prompt too long! Cannot generate any new tokens within the context limit ({self.max_length})"
+            )
+        if reuse_length:
+            past_key_values = self._crop(past_key_values, reuse_length)
+        else:
+            past_key_values = None
+
+        next_input = torch.tensor([input_ids[reuse_length:]])
+        generated = []
+        for _ in range(max_new_tokens):
+            outputs = self.model(
+                input_ids=next_input, past_key_values=past_key_values, use_cache=True
+            )
+            past_key_values = outputs.past_key_values
+            next_token = int(outputs.logits[0, -1].argmax())
+            generated.append(next_token)
+            if next_token == self.tokenizer.eos_token_id:
+                break
+            next_input = torch.tensor([[next_token]])
+        return generated, past_key_values
+
+    def generate(self, prompts, max_new_tokens=100):
+        """
+        Generates a greedy completion for every prompt.
+
+        Args:
+            prompts: Prompt strings, possibly taken from several prompt files.
+            max_new_tokens: Upper bound on generated tokens per prompt.
+
+        Returns:
+            Completion strings and error messages (None for prompts that were generated), in
+            the order of `prompts`. A prompt too long for the context gets an empty
+            completion and its error, instead of aborting the other prompts.
+        """
+        token_ids = [self.tokenizer(prompt)["input_ids"] for prompt in prompts]
+        order = sorted(range(len(prompts)), key=lambda i: token_ids[i])
+        gen_text = [None] * len(prompts)
+        errors = [None] * len(prompts)
+
+        start = time.perf_counter()
+        past_key_values = None
+        previous_ids = []
+        with torch.no_grad():
+            for index in tqdm.tqdm(order):
+                input_ids = token_ids[index]
+                # at least one prompt token must be fed to get next-token logits
+                reuse_length = min(
+                    self._common_prefix_length(previous_ids, input_ids), len(input_ids) - 1
+                )
+                try:
+                    generated, past_key_values = self._generate_one(
+                        input_ids, past_key_values, reuse_length, max_new_tokens
+                    )
+                except ValueError as e:
+                    # the cache of the previous prompt is left untouched for the next one
+                    gen_text[index], errors[index] = "", str(e)
+                    continue
+                previous_ids = input_ids
+
+                text = self.tokenizer.decode(input_ids + generated, skip_special_tokens=True)
+                gen_text[index] = text[len(prompts[index]) :]
+
+                self.stats["prompts"] += 1
+                self.stats["prefix_hits"] += 1 if reuse_length else 0
+                self.stats["prompt_tokens"] += len(input_ids)
+                self.stats["reused_tokens"] += reuse_length
+                self.stats["generated_tokens"] += len(generated)
+        self.stats["seconds"] += time.perf_counter() - start
+        return gen_text, errors
+
+    def report(self):
+        """
+        Prints throughput and prefix reuse statistics collected so far.
+        """
+        stats = self.stats
+        seconds = max(stats["seconds"], 1e-9)
+        prompts = max(stats["prompts"], 1)
+        prompt_tokens = max(stats["prompt_tokens"], 1)
+        print(f"prompts: {stats['prompts']}")
+        print(f"prefix hit rate: {stats['prefix_hits'] / prompts:.4f}")
+        print(f"reused prompt tokens: {stats['reused_tokens'] / prompt_tokens:.4f}")
+        print(f"generated tokens/sec: {stats['generated_tokens'] / seconds:.2f}")
+        print(
+            f"processed tokens/sec: "
+            f"{(stats['prompt_tokens'] + stats['generated_tokens']) / seconds:.2f}"
+        )
@@ -0,0 +1,196 @@
+import time
+
+import torch
+
+from src.build_predictions.line_stopping import count_complete_lines
+from src.build_predictions.prefix_cache import PrefixCacheGenerator
+
+
+class NgramDraftIndex:
+    """
+    Maps every n-gram (n = 1 .. `ngram_size`) of a token sequence to the position right after
+    its latest occurrence, so that a draft continuation can be copied from there.
+    """
+
+    def __init__(self, ngram_size):
+        self.ngram_size = ngram_size
+        self.table = {}
+        self.ids = []
+        self.indexed_length = 0
+
+    def extend(self, ids):
+        """
+        Appends tokens and indexes the n-grams that now have at least one continuation token.
+        """
+        self.ids.extend(ids)
+        for end in range(max(1, self.indexed_length), len(self.ids)):
+            for n in range(1, min(self.ngram_size, end) + 1):
+                self.table[tuple(self.ids[end - n : end])] = end
+        self.indexed_length = len(self.ids)
+
+    def lookup(self, ngram, num_tokens):
+        end = self.table.get(tuple(ngram))
+        if end is None:
+            return []
+        return self.ids[end : end + num_tokens]
+
+
+class PromptLookupDecoder:
+    """
+    Greedy draft-and-verify decoder whose drafts are copied from the retrieved code fragments.
+
+    Completions often repeat spans of the retrieved fragments, which the prompt only shows as
+    comments. The trailing n-gram of the sequence is looked up in the raw (uncommented)
+    fragments, best-scored first, and then in the prompt and the completion so far; the tokens
+    that followed it there are proposed as a draft. The draft is verified with a single
+    forward pass: the longest prefix matching the model's own argmax predictions is accepted
+    together with the model's next token, and the key/value cache is cropped back to the
+    accepted length. The output is the same as plain greedy decoding, with fewer model calls
+    whenever drafts are accepted.
+    """
+
+    def __init__(self, model, tokenizer, ngram_size=3, num_draft_tokens=10):
+        """
+        Args:
+            model: Causal language model.
+            tokenizer: Tokenizer of `model`.
+            ngram_size: Longest trailing n-gram to look up; shorter ones are tried next.
+            num_draft_tokens: Upper bound on drafted tokens per verification step.
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.ngram_size = ngram_size
+        self.num_draft_tokens = num_draft_tokens
+        self.max_length = model.config.max_position_embeddings
+        self.stats = {}
+
+    def _get_draft(self, indices, sequence, num_tokens):
+        for n in range(min(self.ngram_size, len(sequence)), 0, -1):
+            ngram = sequence[-n:]
+            for index in indices:
+                draft = index.lookup(ngram, num_tokens)
+                if draft:
+                    return draft
+        return []
+
+    def _is_finished(self, generated, lines_needed):
+        token = generated[-1]
+        if token == self.tokenizer.eos_token_id:
+            return True
+        # only a token containing a newline can complete a line
+        return (
+            lines_needed is not None
+            and "\n" in self.tokenizer.decode([token])
+            and count_complete_lines(self.tokenizer.decode(generated, skip_special_tokens=True))
+            >= lines_needed
+        )
+
+    def generate(self, prompt, contexts, repo=None, lines_needed=None, max_new_tokens=100):
+        """
+        Args:
+            prompt: Prompt string.
+            contexts: Retrieved code fragments to draft from, best-scored first.
+            repo: Repository the prompt belongs to; statistics are collected per repo.
+            lines_needed: Non-empty lines to generate before stopping, or None to generate up
+                to the token limit.
+            max_new_tokens: Upper bound on generated tokens.
+
+        Returns:
+            The completion string.
+        """
+        input_ids = self.tokenizer(prompt)["input_ids"]
+        max_new_tokens = min(max_new_tokens, self.max_length - len(input_ids))
+        if max_new_tokens <= 0:
+            raise ValueError(
+                f"Prompt too long! Cannot generate any new tokens within the context limit ({self.max_length})"
+            )
+
+        indices = []
+        for context in contexts:
+            index = NgramDraftIndex(self.ngram_size)
+            index.extend(self.tokenizer(context)["input_ids"])
+            indices.append(index)
+        sequence_index = NgramDraftIndex(self.ngram_size)
+        sequence_index.extend(input_ids)
+        indices.append(sequence_index)
+
+        stats = self.stats.setdefault(
+            repo,
+            {
+                "prompts": 0,
+                "steps": 0,
+                "generated_tokens": 0,
+                "drafted_tokens": 0,
+                "accepted_tokens": 0,
+                "seconds": 0.0,
+            },
+        )
+        start = time.perf_counter()
+        with torch.no_grad():
+            outputs = self.model(input_ids=torch.tensor([input_ids]), use_cache=True)
+            past_key_values = outputs.past_key_values
+            generated = [int(outputs.logits[0, -1].argmax())]
+            stats["steps"] += 1
+            sequence_index.extend(generated)
+            finished = self._is_finished(generated, lines_needed)
+
+            while not finished and len(generated) < max_new_tokens:
+                # the accepted draft plus the model's own next token must fit the budget
+                draft = self._get_draft(
+                    indices,
+                    input_ids + generated,
+                    min(self.num_draft_tokens, max_new_tokens - len(generated) - 1),
+                )
+                # the cache covers everything but the last generated token
+                cached_length = len(input_ids) + len(generated) - 1
+                outputs = self.model(
+                    input_ids=torch.tensor([generated[-1:] + draft]),
+                    past_key_values=past_key_values,
+                    use_cache=True,
+                )
+                predictions = outputs.logits[0].argmax(dim=-1).tolist()
+                accepted = 0
+                while accepted < len(draft) and draft[accepted] == predictions[accepted]:
+                    accepted += 1
+                past_key_values = PrefixCacheGenerator._crop(
+                    outputs.past_key_values, cached_length + 1 + accepted
+                )
+                stats["steps"] += 1
+                stats["drafted_tokens"] += len(draft)
+                stats["accepted_tokens"] += accepted
+
+                new_tokens = draft[:accepted] + [predictions[accepted]]
+                # stop exactly where token-by-token greedy decoding would have stopped
+                for token in new_tokens:
+                    generated.append(token)
+                    finished = self._is_finished(generated, lines_needed)
+                    if finished or len(generated) >= max_new_tokens:
+                        break
+                sequence_index.extend(generated[len(sequence_index.ids) - len(input_ids) :])
+
+        stats["prompts"] += 1
+        stats["generated_tokens"] += len(generated)
+        stats["seconds"] += time.perf_counter() - start
+        text = self.tokenizer.decode(input_ids + generated, skip_special_tokens=True)
+        return text[len(prompt) :]
+
+    def report(self):
+        """
+        Prints the draft acceptance rate and decoding speed of every repo, and overall.
+        """
+        total = {}
+        for repo, stats in sorted(self.stats.items(), key=lambda x: str(x[0])):
+            self._print_stats(repo, stats)
+            for key, value in stats.items():
+                total[key] = total.get(key, 0) + value
+        if total:
+            self._print_stats("all", total)
+
+    @staticmethod
+    def _print_stats(name, stats):
+        print(
+            f"{name}: {stats['prompts']} prompts, "
+            f"accepted draft tokens {stats['accepted_tokens'] / max(stats['drafted_tokens'], 1):.4f}, "
+            f"tokens per model step {stats['generated_tokens'] / max(stats['steps'], 1):.2f}, "
+            f"generated tokens/sec {stats['generated_tokens'] / max(stats['seconds'], 1e-9):.2f}"
+        )
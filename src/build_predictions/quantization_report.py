@@ -0,0 +1,154 @@
+import gc
+import time
+import queue
+import random
+import multiprocessing
+
+from compute_score import compute_EM
+from src.build_predictions.build_prediction import BuildPrediction
+from src.utils.tools import Tools
+
+
+def _rss_mb(field):
+    """
+    Returns the `field` ("VmRSS" or "VmHWM", its peak) of this process in MB, from Linux's
+    /proc/self/status.
+    """
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                # reported in kilobytes
+                return int(line.split()[1]) / 1024
+    raise RuntimeError(f"{field} is not reported in /proc/self/status")
+
+
+def _reset_peak_rss():
+    """
+    Resets the peak RSS (VmHWM) of this process to its current RSS; needs Linux >= 4.0.
+    """
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def _measure_variant(model_name, quantize, prompts, result_queue):
+    """
+    Loads one model variant and greedily completes every prompt, one prompt at a time.
+    Runs in its own process so that the RSS belongs to this variant only.
+
+    The RSS of the loaded model is measured once it is quantized and the fp32 weights are
+    collected, and the peak RSS is reset then, so that it only covers generation. Prompts too
+    long to complete are recorded as errors; the process always puts a result on `result_queue`.
+    """
+    try:
+        predictor = BuildPrediction(model_name, batch_size=1, quantize=quantize)
+        gc.collect()
+        loaded_rss_mb = _rss_mb("VmRSS")
+        _reset_peak_rss()
+        latencies = []
+        gen_text = []
+        errors = []
+        for i, prompt in enumerate(prompts):
+            start = time.perf_counter()
+            try:
+                gen_text.extend(predictor._generate_batch([prompt]))
+            except ValueError as e:
+                gen_text.append("")
+                errors.append({"prompt_id": i, "error": str(e)})
+                continue
+            latencies.append(time.perf_counter() - start)
+        result_queue.put(
+            {
+                "gen_text": gen_text,
+                "latencies": latencies,
+                "errors": errors,
+                "loaded_rss_mb": loaded_rss_mb,
+                "peak_rss_mb": _rss_mb("VmHWM"),
+            }
+        )
+    except Exception as e:
+        result_queue.put({"error": f"{type(e).__name__}: {e}"})
+        raise
+
+
+class QuantizationReport:
+    """
+    Compares the dynamic int8 CPU model against the fp32 model on a sample of prompts.
+
+    Reports mean latency per prompt, RSS of the loaded model and peak RSS during generation,
+    the number of prompts too long to complete, exact match (`compute_EM`) of each variant
+    against the ground truth, and the exact-match drift of int8 completions from the fp32 ones.
+    """
+
+    def __init__(self, model_name, prompt_file, num_prompts=20, seed=0):
+        self.model_name = model_name
+        self.prompt_file = prompt_file
+        self.num_prompts = num_prompts
+        self.seed = seed
+
+    def _run_variant(self, quantize, prompts):
+        context = multiprocessing.get_context("spawn")
+        result_queue = context.Queue()
+        process = context.Process(
+            target=_measure_variant, args=(self.model_name, quantize, prompts, result_queue)
+        )
+        process.start()
+        while True:
+            try:
+                result = result_queue.get(timeout=5)
+                break
+            except queue.Empty:
+                if not process.is_alive():
+                    raise RuntimeError(f"The variant process exited with code {process.exitcode}")
+        process.join()
+        if "error" in result:
+            variant = "int8" if quantize else "fp32"
+            raise RuntimeError(f"The {variant} variant failed: {result['error']}")
+        return result
+
+    def run(self, output_path=None):
+        """
+        Runs both variants and prints the comparison; also dumps it to `output_path` if given.
+        """
+        lines = Tools.load_jsonl(self.prompt_file)
+        lines = random.Random(self.seed).sample(lines, min(self.num_prompts, len(lines)))
+        # have a new line at the end
+        prompts = [f"{line['prompt']}\n" for line in lines]
+        ground_truths = [line["metadata"]["ground_truth"] for line in lines]
+
+        results = {
+            "fp32": self._run_variant(False, prompts),
+            "int8": self._run_variant(True, prompts),
+        }
+
+        report = {"model_name": self.model_name, "num_prompts": len(prompts)}
+        for variant, result in results.items():
+            exact_matches = [
+                compute_EM(ground_truth, [text], passk=1)
+                for ground_truth, text in zip(ground_truths, result["gen_text"])
+            ]
+            # prompts too long to complete count as misses, and are left out of the latency
+            report[variant] = {
+                "mean_latency_s": round(
+                    sum(result["latencies"]) / max(len(result["latencies"]), 1), 4
+                ),
+                "loaded_rss_mb": round(result["loaded_rss_mb"], 1),
+                "peak_rss_mb": round(result["peak_rss_mb"], 1),
+                "EM": round(sum(exact_matches) / len(prompts), 4),
+                "errors": len(result["errors"]),
+            }
+        agreements = [
+            compute_EM(fp32_text, [int8_text], passk=1)
+            for fp32_text, int8_text in zip(
+                results["fp32"]["gen_text"], results["int8"]["gen_text"]
+            )
+        ]
+        report["int8_vs_fp32_EM_drift"] = round(1 - sum(agreements) / len(prompts), 4)
+        report["int8_speedup"] = round(
+            report["fp32"]["mean_latency_s"] / max(report["int8"]["mean_latency_s"], 1e-9), 2
+        )
+
+        for key, value in report.items():
+            print(f"{key}: {value}")
+        if output_path:
+            Tools.dump_json(report, output_path)
+        return report
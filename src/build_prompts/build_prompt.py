@@ -1,6 +1,8 @@
 import os
-from typing import List, Tuple, Dict, Any, Callable
+from typing import List, Tuple, Dict, Any, Callable, Optional
 
+from src.build_prompts.fragment_merger import FragmentMerger
+from src.build_windows.window_metadata import as_metadata, metadata_to_dicts
 from src.utils.constants import Constants
 from src.utils.tools import Tools
 
@@ -18,11 +20,15 @@ class BuildPrompt:
         log_message: str,
         tokenizer: Callable,
         max_retrieval_length: int = 2000,
+        merge_fragments: bool = True,
+        num_threads: Optional[int] = None,
     ):
         self.query_lines_with_retrieval_results = query_lines_with_retrieval_results
         self.log_message = log_message
-        self.tokenizer = tokenizer()
+        # threads the tokenizer may use to count the tokens of a batch of blocks
+        self.tokenizer = tokenizer(num_threads)
         self.max_retrieval_length = max_retrieval_length
+        self.merge_fragments = merge_fragments
 
         self.tasks_by_task_id = {
             task["metadata"]["task_id"]: task for task in Tools.load_jsonl(task_path)
@@ -30,10 +36,10 @@ class BuildPrompt:
         self.separator = "# " + "-" * 50
         self.max_examples = 10
 
-    def _make_a_block(self, retrieved_context: Tuple[Dict[str, Any], float]) -> Tuple[str, int]:
+    def _make_a_block(self, retrieved_context: Tuple[Dict[str, Any], float]) -> str:
         content, _ = retrieved_context
         metadata = content["metadata"]
-        f_paths = ["/".join(x["fpath_tuple"][1:]) for x in metadata]
+        f_paths = ["/".join(as_metadata(x)["fpath_tuple"][1:]) for x in metadata]
         f_paths_str = "\n".join([f"# {f_path}" for f_path in f_paths])
         comment_lines = [f"# {line}" for line in content["context"].splitlines()]
 
@@ -47,14 +53,13 @@ class BuildPrompt:
                 "",
             ]
         )
-        token_len = len(self.tokenizer.tokenize(block))
-        return block, token_len
+        return block
 
     def _make_an_extended_block(
         self, task_metadata: Dict[str, Any], retrieved_context: Tuple[Dict[str, Any], float]
-    ) -> Tuple[str, int]:
+    ) -> str:
         content, _ = retrieved_context
-        for meta in content["metadata"]:
+        for meta in map(as_metadata, content["metadata"]):
             if (
                 meta["fpath_tuple"] == tuple(task_metadata["fpath_tuple"])
                 and meta["end_line_no"] >= task_metadata["line_no"]
@@ -66,11 +71,13 @@ class BuildPrompt:
             new_end = min(
                 meta["end_line_no"] + meta["window_size"] // meta["slice_size"], len(code_lines)
             )
-            new_start = max(0, new_end - meta["window_size"])
+            # merged fragments span more than one window
+            span = max(meta["window_size"], meta["end_line_no"] - meta["start_line_no"])
+            new_start = max(0, new_end - span)
             snippet = code_lines[new_start:new_end]
             comment_lines = [f"# {line}" for line in snippet]
             f_paths_str = "\n".join(
-                [f"# {'/'.join(x['fpath_tuple'][1:])}" for x in content["metadata"]]
+                [f"# {'/'.join(as_metadata(x)['fpath_tuple'][1:])}" for x in content["metadata"]]
             )
 
             block = "\n".join(
@@ -83,10 +90,9 @@ class BuildPrompt:
                     "",
                 ]
             )
-            token_len = len(self.tokenizer.tokenize(block))
-            return block, token_len
+            return block
 
-        return "", 0
+        return ""
 
     def _build_prompt(
         self,
@@ -96,21 +102,30 @@ class BuildPrompt:
         top_k_context: List[Tuple[Dict[str, Any], float]],
     ) -> Tuple[str, List[Tuple[Dict[str, Any], float]]]:
         make_block = self._make_an_extended_block if mode == Constants.rg else self._make_a_block
+        if self.merge_fragments:
+            top_k_context = FragmentMerger.coalesce(top_k_context)
         blocks = []
         current_token_length = 20  # assume fixed prompt head length
         chosen_context = []
 
-        for retrieved_context in reversed(top_k_context):
-            if len(chosen_context) >= self.max_examples:
-                break
-            kwargs = {"retrieved_context": retrieved_context}
-            if mode == Constants.rg:
-                kwargs["task_metadata"] = task_metadata
-            block_str, token_len = make_block(**kwargs)
-            if current_token_length + token_len < self.max_retrieval_length:
-                blocks.insert(0, block_str)
-                current_token_length += token_len
-                chosen_context.append(retrieved_context)
+        candidates = list(reversed(top_k_context))
+        position = 0
+        while position < len(candidates) and len(chosen_context) < self.max_examples:
+            # builds as many blocks as examples are still missing and tokenizes them together
+            batch = candidates[position : position + self.max_examples - len(chosen_context)]
+            position += len(batch)
+            block_strs = []
+            for retrieved_context in batch:
+                kwargs = {"retrieved_context": retrieved_context}
+                if mode == Constants.rg:
+                    kwargs["task_metadata"] = task_metadata
+                block_strs.append(make_block(**kwargs))
+            token_lens = self.tokenizer.count_tokens_batch(block_strs)
+            for retrieved_context, block_str, token_len in zip(batch, block_strs, token_lens):
+                if current_token_length + token_len < self.max_retrieval_length:
+                    blocks.insert(0, block_str)
+                    current_token_length += token_len
+                    chosen_context.append(retrieved_context)
 
         header = (
             "# Here are some relevant code fragments from other files of the repo:\n"
@@ -139,14 +154,16 @@ class BuildPrompt:
                         "top_k_context": [
                             {
                                 "context": c[0]["context"],
-                                "metadata": c[0]["metadata"],
+                                "metadata": metadata_to_dicts(c[0]["metadata"]),
                                 "sim_score": c[1],
                             }
                             for c in context
                         ],
                         "window_size": query["metadata"]["window_size"],
                         "slice_size": (
-                            context[0][0]["metadata"][0]["slice_size"] if context else None
+                            as_metadata(context[0][0]["metadata"][0])["slice_size"]
+                            if context
+                            else None
                         ),
                     },
                 }
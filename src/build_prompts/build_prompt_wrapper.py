@@ -1,8 +1,9 @@
 import functools
-from typing import List, Callable
+from typing import List, Callable, Optional
 
 from src.utils.constants import Constants
 from src.utils.file_path_builder import FilePathBuilder
+from src.utils.stage_profiler import StageProfiler
 from src.utils.tools import Tools
 from src.build_prompts.build_prompt import BuildPrompt
 
@@ -20,6 +21,8 @@ class BuildPromptWrapper:
         window_size: int,
         slice_size: int,
         tokenizer: Callable,
+        merge_fragments: bool = True,
+        num_threads: Optional[int] = None,
     ):
         self.vector_path_builder = {
             "one-gram": FilePathBuilder.one_gram_vector_path,
@@ -31,6 +34,8 @@ class BuildPromptWrapper:
         self.window_size = window_size
         self.slice_size = slice_size
         self.tokenizer = tokenizer
+        self.merge_fragments = merge_fragments
+        self.num_threads = num_threads
 
         self.task_path = {
             Constants.line_benchmark: Constants.random_line_completion_benchmark,
@@ -39,29 +44,36 @@ class BuildPromptWrapper:
             Constants.short_line_benchmark: Constants.short_random_line_completion_benchmark,
         }[benchmark]
 
-        self.max_top_k = 20
+        self.max_top_k = Constants.retrieval_max_top_k
 
     def _run(self, mode: str, query_window_path_builder: Callable, output_file_path: str) -> None:
         lines = []
         for repo in self.repos:
-            query_window_path = query_window_path_builder(repo, self.window_size, self.slice_size)
-            query_line_path = self.vector_path_builder(query_window_path)
-            repo_window_path = FilePathBuilder.repo_windows_path(
-                repo, self.window_size, self.slice_size
-            )
-            repo_vector_path = self.vector_path_builder(repo_window_path)
-            retrieval_path = FilePathBuilder.retrieval_results_path(
-                query_line_path, repo_vector_path, self.max_top_k
-            )
-            query_lines = Tools.load_pickle(retrieval_path)
+            with StageProfiler.profile(f"build_{mode}_prompts", repo) as record:
+                query_window_path = query_window_path_builder(
+                    repo, self.window_size, self.slice_size
+                )
+                query_line_path = self.vector_path_builder(query_window_path)
+                repo_window_path = FilePathBuilder.repo_windows_path(
+                    repo, self.window_size, self.slice_size
+                )
+                repo_vector_path = self.vector_path_builder(repo_window_path)
+                retrieval_path = FilePathBuilder.retrieval_results_path(
+                    query_line_path, repo_vector_path, self.max_top_k
+                )
+                query_lines = Tools.load_pickle(retrieval_path)
 
-            builder = BuildPrompt(
-                query_lines,
-                self.task_path,
-                f"repo: {repo}, window: {self.window_size}, slice: {self.slice_size}",
-                self.tokenizer,
-            )
-            lines.extend(builder.build_2nd_stage_input_file(mode))
+                builder = BuildPrompt(
+                    query_lines,
+                    self.task_path,
+                    f"repo: {repo}, window: {self.window_size}, slice: {self.slice_size}",
+                    self.tokenizer,
+                    merge_fragments=self.merge_fragments,
+                    num_threads=self.num_threads,
+                )
+                repo_lines = builder.build_2nd_stage_input_file(mode)
+                record["items"] = len(repo_lines)
+            lines.extend(repo_lines)
 
         Tools.dump_jsonl(lines, output_file_path)
 
@@ -0,0 +1,112 @@
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+from src.build_windows.window_metadata import as_metadata
+
+
+class FragmentMerger:
+    """
+    Coalesces retrieved repo windows that overlap or touch within the same file.
+
+    Repo windows are sampled every `window_size // slice_size` lines, so the top-k context of a
+    query often holds several neighbouring windows of one file. Merging their line ranges into a
+    single fragment lets the prompt show those lines (and the block header) only once.
+    """
+
+    @staticmethod
+    def _get_lines(content: Dict[str, Any]) -> List[str]:
+        """
+        Returns the lines of a repo window, or an empty list if the window cannot be merged.
+        A window is mergeable when it points at a single location whose line range matches
+        its context.
+        """
+        if len(content["metadata"]) != 1:
+            return []
+        metadata = as_metadata(content["metadata"][0])
+        lines = content["context"].split("\n")
+        if len(lines) != metadata["end_line_no"] - metadata["start_line_no"]:
+            return []
+        return lines
+
+    @staticmethod
+    def _merge_run(
+        run: List[Tuple[Dict[str, Any], float, List[str]]],
+    ) -> Tuple[Dict[str, Any], float]:
+        """
+        Merges a run of overlapping windows (sorted by start line) into one fragment.
+        The merged fragment keeps the metadata of its best scoring window, widened to the
+        union of the line ranges, and the best score of the run.
+        """
+        if len(run) == 1:
+            content, score, _ = run[0]
+            return content, score
+
+        best_content, best_score, _ = max(run, key=lambda x: x[1])
+        start_line_no = as_metadata(run[0][0]["metadata"][0])["start_line_no"]
+        end_line_no = start_line_no
+        merged_lines: List[str] = []
+        for content, _, lines in run:
+            metadata = as_metadata(content["metadata"][0])
+            window_start = metadata["start_line_no"]
+            window_end = metadata["end_line_no"]
+            if window_end > end_line_no:
+                merged_lines.extend(lines[end_line_no - window_start :])
+                end_line_no = window_end
+
+        best_metadata = as_metadata(best_content["metadata"][0])
+        metadata = {
+            "fpath_tuple": tuple(best_metadata["fpath_tuple"]),
+            "line_no": best_metadata["line_no"],
+            "start_line_no": start_line_no,
+            "end_line_no": end_line_no,
+            "window_size": best_metadata["window_size"],
+            "repo": best_metadata["repo"],
+            "slice_size": best_metadata["slice_size"],
+            "merged_windows": len(run),
+        }
+        return {"context": "\n".join(merged_lines), "metadata": [metadata]}, best_score
+
+    @staticmethod
+    def coalesce(
+        top_k_context: List[Tuple[Dict[str, Any], float]],
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        Merges overlapping or adjacent windows of the same file in a retrieval result.
+
+        Args:
+            top_k_context: (repo window, similarity score) pairs in ascending score order,
+                as produced by `CodeSearchWorker`.
+
+        Returns:
+            The coalesced fragments in the same (content, score) format and ascending score
+            order. Windows that cannot be merged are passed through unchanged.
+        """
+        fragments: List[Tuple[Dict[str, Any], float]] = []
+        windows_by_file: Dict[Tuple[str, ...], List[Tuple[Dict[str, Any], float, List[str]]]]
+        windows_by_file = defaultdict(list)
+
+        for content, score in top_k_context:
+            lines = FragmentMerger._get_lines(content)
+            if not lines:
+                fragments.append((content, score))
+                continue
+            fpath_tuple = tuple(as_metadata(content["metadata"][0])["fpath_tuple"])
+            windows_by_file[fpath_tuple].append((content, score, lines))
+
+        for windows in windows_by_file.values():
+            windows.sort(key=lambda x: as_metadata(x[0]["metadata"][0])["start_line_no"])
+            run = [windows[0]]
+            run_end = as_metadata(windows[0][0]["metadata"][0])["end_line_no"]
+            for window in windows[1:]:
+                metadata = as_metadata(window[0]["metadata"][0])
+                if metadata["start_line_no"] <= run_end:
+                    run.append(window)
+                    run_end = max(run_end, metadata["end_line_no"])
+                    continue
+                fragments.append(FragmentMerger._merge_run(run))
+                run = [window]
+                run_end = metadata["end_line_no"]
+            fragments.append(FragmentMerger._merge_run(run))
+
+        # stable sort keeps the retrieval order for ties
+        return sorted(fragments, key=lambda x: x[1])
@@ -1,6 +1,7 @@
 import numpy as np
 import copy
 
+from src.build_windows.window_metadata import as_metadata
 from src.utils.tools import Tools
 
 
@@ -13,18 +14,27 @@ class CodeSearchWorker:
         sim_scorer,
         max_top_k,
         log_message,
+        repo_embeddings=None,
     ):
         self.repo_embedding_lines = repo_embedding_lines  # list
+        # embedding arrays of the repo lines, shared by the workers searching the same corpus
+        if repo_embeddings is None:
+            repo_embeddings = self.build_repo_embeddings(repo_embedding_lines)
+        self.repo_embeddings = repo_embeddings
         self.query_embedding_lines = query_embedding_lines  # list
         self.max_top_k = max_top_k
         self.sim_scorer = sim_scorer
         self.output_path = output_path
         self.log_message = log_message
 
+    @staticmethod
+    def build_repo_embeddings(repo_embedding_lines):
+        return [np.array(line["data"][0]["embedding"]) for line in repo_embedding_lines]
+
     def _is_context_after_hole(self, repo_embedding_line, query_line):
         hole_fpath_tuple = tuple(query_line["metadata"]["fpath_tuple"])
         context_is_not_after_hole = []
-        for metadata in repo_embedding_line["metadata"]:
+        for metadata in map(as_metadata, repo_embedding_line["metadata"]):
             if tuple(metadata["fpath_tuple"]) != hole_fpath_tuple:
                 context_is_not_after_hole.append(True)
                 continue
@@ -38,10 +48,11 @@ class CodeSearchWorker:
     def _find_top_k_context(self, query_line):
         top_k_context = []
         query_embedding = np.array(query_line["data"][0]["embedding"])
-        for repo_embedding_line in self.repo_embedding_lines:
+        for repo_embedding_line, repo_line_embedding in zip(
+            self.repo_embedding_lines, self.repo_embeddings
+        ):
             if self._is_context_after_hole(repo_embedding_line, query_line):
                 continue
-            repo_line_embedding = np.array(repo_embedding_line["data"][0]["embedding"])
             similarity_score = self.sim_scorer(query_embedding, repo_line_embedding)
             top_k_context.append((repo_embedding_line, similarity_score))
         top_k_context = sorted(top_k_context, key=lambda x: x[1], reverse=False)[-self.max_top_k :]
@@ -55,3 +66,4 @@ class CodeSearchWorker:
             new_line["top_k_context"] = top_k_context
             query_lines_with_retrieved_results.append(new_line)
         Tools.dump_pickle(query_lines_with_retrieved_results, self.output_path)
+        return len(query_lines_with_retrieved_results)
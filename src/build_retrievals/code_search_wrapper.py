@@ -8,13 +8,43 @@ import functools
 
 from src.utils.constants import Constants
 from src.utils.file_path_builder import FilePathBuilder
+from src.utils.stage_profiler import StageProfiler
 from src.utils.tools import Tools
 from src.build_retrievals.similarity import SimilarityScore
 from src.build_retrievals.code_search_worker import CodeSearchWorker
 
 
+def _search_repo(repo, repo_embedding_path, query_jobs, sim_scorer, max_top_k, log_message):
+    # loads the repo corpus once and searches it for every query set
+    repo_embedding_lines = Tools.load_pickle(repo_embedding_path)
+    repo_embeddings = CodeSearchWorker.build_repo_embeddings(repo_embedding_lines)
+    for stage, query_line_path, output_path in query_jobs:
+        with StageProfiler.profile(stage, repo) as record:
+            worker = CodeSearchWorker(
+                repo_embedding_lines,
+                Tools.load_pickle(query_line_path),
+                output_path,
+                sim_scorer,
+                max_top_k,
+                log_message,
+                repo_embeddings,
+            )
+            record["items"] = worker.run()
+
+
+def _run_repo_searches(*args):
+    # runs in a pool process; the stage records are handed back to the parent
+    StageProfiler.reset()
+    _search_repo(*args)
+    return StageProfiler.records
+
+
 class CodeSearchWrapper:
-    def __init__(self, vectorizer, benchmark, repos, window_sizes, slice_sizes):
+    def __init__(self, vectorizer, benchmark, repos, window_sizes, slice_sizes, max_workers=None):
+        """
+        max_workers is the number of search processes, os.cpu_count() if None; with 1, the
+        searches run in this process.
+        """
         self.vectorizer = vectorizer
         if vectorizer == "one-gram":
             self.sim_scorer = SimilarityScore.jaccard_similarity
@@ -22,71 +52,88 @@ class CodeSearchWrapper:
         elif vectorizer == "ada002":
             self.sim_scorer = SimilarityScore.cosine_similarity
             self.vector_path_builder = FilePathBuilder.ada002_vector_path
-        self.max_top_k = 20  # store 20 top k context for the prompt construction (top 10)
+        self.max_top_k = Constants.retrieval_max_top_k
         self.repos = repos
         self.window_sizes = window_sizes
         self.slice_sizes = slice_sizes
         self.benchmark = benchmark
+        self.max_workers = max_workers or os.cpu_count()
 
-    def _run_parallel(self, query_window_path_builder, prediction_path_template=None):
-        workers = []
+    def _run_parallel(self, query_sets):
+        """
+        Searches every repo corpus for every query set, with one task per repo and window
+        configuration that loads the corpus once.
+
+        Args:
+            query_sets: (stage, query window path builder) pairs; the builder maps
+                (repo, window size, slice size) to the path of the query windows.
+        """
+        tasks = []
         for window_size in self.window_sizes:
             for slice_size in self.slice_sizes:
                 for repo in self.repos:
-                    if prediction_path_template:
-                        query_window_path = query_window_path_builder(
-                            prediction_path_template.format(
-                                window_size=window_size, slice_size=slice_size
-                            ),
-                            repo,
-                            window_size,
-                            slice_size,
-                        )
-                    else:
-                        query_window_path = query_window_path_builder(repo, window_size, slice_size)
-                    query_line_path = self.vector_path_builder(query_window_path)
                     repo_window_path = FilePathBuilder.repo_windows_path(
                         repo, window_size, slice_size
                     )
                     repo_embedding_path = self.vector_path_builder(repo_window_path)
-                    output_path = FilePathBuilder.retrieval_results_path(
-                        query_line_path, repo_embedding_path, self.max_top_k
-                    )
-                    repo_embedding_lines = Tools.load_pickle(repo_embedding_path)
-                    query_embedding_lines = Tools.load_pickle(query_line_path)
+                    query_jobs = []
+                    for stage, query_window_path_builder in query_sets:
+                        query_window_path = query_window_path_builder(repo, window_size, slice_size)
+                        query_line_path = self.vector_path_builder(query_window_path)
+                        output_path = FilePathBuilder.retrieval_results_path(
+                            query_line_path, repo_embedding_path, self.max_top_k
+                        )
+                        query_jobs.append((stage, query_line_path, output_path))
                     log_message = f"repo: {repo}, window: {window_size}, slice: {slice_size}  {self.vectorizer}, max_top_k: {self.max_top_k}"
-                    worker = CodeSearchWorker(
-                        repo_embedding_lines,
-                        query_embedding_lines,
-                        output_path,
-                        self.sim_scorer,
-                        self.max_top_k,
-                        log_message,
-                    )
-                    workers.append(worker)
-        # process pool
-        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
-            futures = {
-                executor.submit(
-                    worker.run,
-                )
-                for worker in workers
-            }
+                    tasks.append((repo, repo_embedding_path, query_jobs, log_message))
+        task_args = [
+            (repo, repo_embedding_path, query_jobs, self.sim_scorer, self.max_top_k, log_message)
+            for repo, repo_embedding_path, query_jobs, log_message in tasks
+        ]
+        if self.max_workers <= 1:
+            for args in tqdm.tqdm(task_args):
+                _search_repo(*args)
+            return
+        # process pool; only paths are sent to the workers, which load the pickles themselves
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(_run_repo_searches, *args) for args in task_args}
             for future in tqdm.tqdm(as_completed(futures), total=len(futures)):
-                future.result()
+                for record in future.result():
+                    StageProfiler.add(record)
+
+    def _prediction_query_set(self, mode, prediction_path_template):
+        def query_window_path_builder(repo, window_size, slice_size):
+            prediction_path = prediction_path_template.format(
+                window_size=window_size, slice_size=slice_size
+            )
+            return FilePathBuilder.gen_first_window_path(
+                self.benchmark, mode, prediction_path, repo, window_size, slice_size
+            )
+
+        return "search_predictions", query_window_path_builder
 
-    def search_baseline_and_ground(self):
-        query_line_path_temp = functools.partial(
-            FilePathBuilder.search_first_window_path, self.benchmark, Constants.rg
-        )
-        self._run_parallel(query_line_path_temp)
-        query_line_path_temp = functools.partial(
-            FilePathBuilder.search_first_window_path, self.benchmark, Constants.gt
-        )
-        self._run_parallel(query_line_path_temp)
+    def search_baseline_and_ground(self, prediction_mode=None, prediction_path_template=None):
+        """
+        Searches the RG1 and GT windows, and the prediction windows of `prediction_mode` if
+        given, in a single pass over the repo corpora.
+        """
+        query_sets = [
+            (
+                "search_baseline",
+                functools.partial(
+                    FilePathBuilder.search_first_window_path, self.benchmark, Constants.rg
+                ),
+            ),
+            (
+                "search_ground_truth",
+                functools.partial(
+                    FilePathBuilder.search_first_window_path, self.benchmark, Constants.gt
+                ),
+            ),
+        ]
+        if prediction_mode is not None:
+            query_sets.append(self._prediction_query_set(prediction_mode, prediction_path_template))
+        self._run_parallel(query_sets)
 
     def search_prediction(self, mode, prediction_path_template):
-        query_line_path_temp = functools.partial(
-            FilePathBuilder.gen_first_window_path, self.benchmark, mode
-        )
-        self._run_parallel(query_line_path_temp, prediction_path_template)
+        self._run_parallel([self._prediction_query_set(mode, prediction_path_template)])
@@ -1,6 +1,8 @@
+import math
+import functools
 import tqdm
-from concurrent.futures import as_completed, ProcessPoolExecutor
-from typing import List, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
 
 from src.utils.file_path_builder import FilePathBuilder
 from src.utils.tools import Tools
@@ -12,34 +14,49 @@ class BagOfWords:
     with the Codex tokenizer. Each context is represented by its token IDs.
     """
 
-    def __init__(self, input_file: str):
+    def __init__(self, input_file: str, max_workers: int = 48, num_threads: Optional[int] = None):
         """
         Args:
             input_file (str): Path to a pickle file containing context windows.
+            max_workers (int): Processes tokenizing the windows; with 1, they are tokenized
+                in this process.
+            num_threads (int, optional): Threads the tokenizer of each process may use to
+                encode a chunk; the tokenizer's default if None.
         """
         self.input_file = input_file
+        self.max_workers = max_workers
+        self.num_threads = num_threads
 
-    def build(self) -> None:
+    def _tokenize_chunks(self, chunks: List[List[str]]) -> Iterator[List[List[int]]]:
+        """
+        Yields the token ids of every chunk of contexts, in order.
+        """
+        tokenize_batch = functools.partial(Tools.tokenize_batch, num_threads=self.num_threads)
+        if self.max_workers <= 1:
+            yield from map(tokenize_batch, chunks)
+            return
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            yield from executor.map(tokenize_batch, chunks)
+
+    def build(self) -> int:
         """
         Builds the 1-gram vectors for the input windows.
         Saves the output as a pickle file where each line includes the context,
-        its metadata, and the embedding (token IDs).
+        its metadata, and the embedding (token IDs). Returns the number of vectors.
         """
         print(f"Building 1-gram vectors for: {self.input_file}")
         lines = Tools.load_pickle(self.input_file)
 
-        new_lines: List[Dict[str, Any]] = []
-        futures = {}
-
-        with ProcessPoolExecutor(max_workers=48) as executor:
-            for line in lines:
-                # Submit tokenization task for each context
-                futures[executor.submit(Tools.tokenize, line["context"])] = line
+        contexts = [line["context"] for line in lines]
+        # a few chunks per worker, each tokenized with one batch call
+        chunk_size = max(1, math.ceil(len(contexts) / (self.max_workers * 4)))
+        chunks = [contexts[i : i + chunk_size] for i in range(0, len(contexts), chunk_size)]
 
-            pbar = tqdm.tqdm(total=len(futures), desc="Tokenizing windows")
-            for future in as_completed(futures):
-                line = futures[future]
-                tokenized = future.result()
+        new_lines: List[Dict[str, Any]] = []
+        pbar = tqdm.tqdm(total=len(lines), desc="Tokenizing windows")
+        for tokenized_chunk in self._tokenize_chunks(chunks):
+            for tokenized in tokenized_chunk:
+                line = lines[len(new_lines)]
                 new_lines.append(
                     {
                         "context": line["context"],
@@ -47,9 +64,10 @@ class BagOfWords:
                         "data": [{"embedding": tokenized}],
                     }
                 )
-                pbar.update(1)
+            pbar.update(len(tokenized_chunk))
 
         # Dump results to vector file
         output_file_path = FilePathBuilder.one_gram_vector_path(self.input_file)
         Tools.dump_pickle(new_lines, output_file_path)
         print(f"Saved vectors to: {output_file_path}")
+        return len(new_lines)
@@ -2,10 +2,11 @@
 # Licensed under the MIT license.
 
 import itertools
-from typing import Callable, List
+from typing import Callable, List, Optional
 
 from src.utils.constants import Constants
 from src.utils.file_path_builder import FilePathBuilder
+from src.utils.stage_profiler import StageProfiler
 
 
 class BuildVectorWrapper:
@@ -21,6 +22,8 @@ class BuildVectorWrapper:
         repos: List[str],
         window_sizes: List[int],
         slice_sizes: List[int],
+        max_workers: Optional[int] = None,
+        num_threads: Optional[int] = None,
     ):
         """
         Args:
@@ -29,12 +32,27 @@ class BuildVectorWrapper:
             repos: List of repository names
             window_sizes: List of context window sizes
             slice_sizes: List of stride sizes
+            max_workers: Processes of each vector builder, if not its default
+            num_threads: Tokenizer threads of each vector builder process, if not its default
         """
         self.benchmark = benchmark
         self.vector_builder = vector_builder
         self.repos = repos
         self.window_sizes = window_sizes
         self.slice_sizes = slice_sizes
+        self.max_workers = max_workers
+        self.num_threads = num_threads
+
+    def _build(self, path: str) -> int:
+        builder_kwargs = {
+            name: value
+            for name, value in (
+                ("max_workers", self.max_workers),
+                ("num_threads", self.num_threads),
+            )
+            if value is not None
+        }
+        return self.vector_builder(path, **builder_kwargs).build()
 
     def vectorize_repo_windows(self) -> None:
         """
@@ -42,9 +60,9 @@ class BuildVectorWrapper:
         """
         for window_size, slice_size in itertools.product(self.window_sizes, self.slice_sizes):
             for repo in self.repos:
-                path = FilePathBuilder.repo_windows_path(repo, window_size, slice_size)
-                builder = self.vector_builder(path)
-                builder.build()
+                with StageProfiler.profile("vectorize_repo_windows", repo) as record:
+                    path = FilePathBuilder.repo_windows_path(repo, window_size, slice_size)
+                    record["items"] = self._build(path)
 
     def vectorize_baseline_and_ground_windows(self) -> None:
         """
@@ -54,16 +72,18 @@ class BuildVectorWrapper:
             for window_size in self.window_sizes:
                 for repo in self.repos:
                     # RG1 mode
-                    rg_path = FilePathBuilder.search_first_window_path(
-                        self.benchmark, Constants.rg, repo, window_size, slice_size
-                    )
-                    self.vector_builder(rg_path).build()
+                    with StageProfiler.profile("vectorize_baseline_windows", repo) as record:
+                        rg_path = FilePathBuilder.search_first_window_path(
+                            self.benchmark, Constants.rg, repo, window_size, slice_size
+                        )
+                        record["items"] = self._build(rg_path)
 
                     # GT mode
-                    gt_path = FilePathBuilder.search_first_window_path(
-                        self.benchmark, Constants.gt, repo, window_size, slice_size
-                    )
-                    self.vector_builder(gt_path).build()
+                    with StageProfiler.profile("vectorize_ground_truth_windows", repo) as record:
+                        gt_path = FilePathBuilder.search_first_window_path(
+                            self.benchmark, Constants.gt, repo, window_size, slice_size
+                        )
+                        record["items"] = self._build(gt_path)
 
     def vectorize_prediction_windows(self, mode: str, prediction_path_template: str) -> None:
         """
@@ -78,7 +98,8 @@ class BuildVectorWrapper:
                 window_size=window_size, slice_size=slice_size
             )
             for repo in self.repos:
-                window_path = FilePathBuilder.gen_first_window_path(
-                    self.benchmark, mode, prediction_path, repo, window_size
-                )
-                self.vector_builder(window_path).build()
+                with StageProfiler.profile("vectorize_prediction_windows", repo) as record:
+                    window_path = FilePathBuilder.gen_first_window_path(
+                        self.benchmark, mode, prediction_path, repo, window_size
+                    )
+                    record["items"] = self._build(window_path)
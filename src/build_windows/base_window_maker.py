@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 from src.utils.tools import Tools
 
@@ -11,17 +11,26 @@ class BaseWindowMaker(ABC):
     Subclasses need to implement `build_window` with task-specific logic.
     """
 
-    def __init__(self, base_dir: str, repo: str, window_size: int):
+    def __init__(
+        self,
+        base_dir: str,
+        repo: str,
+        window_size: int,
+        source_code_files: Optional[Dict[Tuple[str, ...], str]] = None,
+    ):
         self.base_dir = base_dir
         self.repo = repo
         self.window_size = window_size
         self.delta_size = window_size // 2
-        self.source_code: Dict[Tuple[str, ...], str] = Tools.iterate_repository(base_dir, repo)
+        # repo files already loaded by the caller are shared across window configurations
+        if source_code_files is None:
+            source_code_files = Tools.iterate_repository(base_dir, repo)
+        self.source_code: Dict[Tuple[str, ...], str] = source_code_files
 
     @abstractmethod
-    def build_window(self) -> None:
+    def build_window(self) -> int:
         """
-        Builds context windows and saves them to disk.
+        Builds context windows, saves them to disk and returns how many were built.
         Implemented by subclasses.
         """
         pass
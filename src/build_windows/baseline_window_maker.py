@@ -1,4 +1,4 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
 from src.utils.constants import Constants
 from src.utils.file_path_builder import FilePathBuilder
@@ -19,6 +19,7 @@ class BaselineWindowMaker(BaseWindowMaker):
         repo (str): The name of the repository to process.
         window_size (int): Number of lines to include in the context window.
         tasks (List[Dict[str, Any]]): List of task dictionaries with metadata.
+        source_code_files (dict, optional): Repository files already loaded by the caller.
     """
 
     def __init__(
@@ -29,13 +30,14 @@ class BaselineWindowMaker(BaseWindowMaker):
         window_size: int,
         slice_size: int,
         tasks: List[Dict[str, Any]],
+        source_code_files: Optional[Dict[Tuple[str, ...], str]] = None,
     ):
-        super().__init__(base_dir, repo, window_size)
+        super().__init__(base_dir, repo, window_size, source_code_files)
         self.benchmark = benchmark
         self.tasks = tasks
         self.slice_size = slice_size
 
-    def build_window(self, print_lines: bool = False) -> None:
+    def build_window(self, print_lines: bool = False) -> int:
         """
         Builds and saves baseline context windows for each matching task.
         The window includes all lines from (start_line) up to line_no (exclusive).
@@ -88,3 +90,4 @@ class BaselineWindowMaker(BaseWindowMaker):
             self.benchmark, Constants.rg, self.repo, self.window_size, self.slice_size
         )
         Tools.dump_pickle(code_windows, output_path)
+        return len(code_windows)
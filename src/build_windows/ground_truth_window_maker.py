@@ -1,4 +1,4 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
 from src.build_windows.base_window_maker import BaseWindowMaker
 
@@ -20,6 +20,7 @@ class GroundTruthWindowMaker(BaseWindowMaker):
         repo (str): The name of the repo the task belongs to.
         window_size (int): The number of total lines in the window.
         tasks (List[Dict[str, Any]]): List of task metadata dicts.
+        source_code_files (dict, optional): Repository files already loaded by the caller.
     """
 
     def __init__(
@@ -30,13 +31,14 @@ class GroundTruthWindowMaker(BaseWindowMaker):
         window_size: int,
         slice_size: int,
         tasks: List[Dict[str, Any]],
+        source_code_files: Optional[Dict[Tuple[str, ...], str]] = None,
     ):
-        super().__init__(base_dir, repo, window_size)
+        super().__init__(base_dir, repo, window_size, source_code_files)
         self.benchmark = benchmark
         self.tasks = tasks
         self.slice_size = slice_size
 
-    def build_window(self, print_lines: bool = False) -> None:
+    def build_window(self, print_lines: bool = False) -> int:
         """
         Builds and saves symmetric context windows centered around the task line.
 
@@ -90,3 +92,4 @@ class GroundTruthWindowMaker(BaseWindowMaker):
             self.benchmark, Constants.gt, self.repo, self.window_size, self.slice_size
         )
         Tools.dump_pickle(code_windows, output_path)
+        return len(code_windows)
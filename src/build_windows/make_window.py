@@ -1,6 +1,9 @@
+import os
+import glob
 import itertools
 import functools
-from typing import List, Optional
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from src.build_windows.baseline_window_maker import BaselineWindowMaker
 from src.build_windows.ground_truth_window_maker import GroundTruthWindowMaker
@@ -9,8 +12,80 @@ from src.build_windows.repo_window_maker import RepoWindowMaker
 
 from src.utils.constants import Constants
 from src.utils.file_path_builder import FilePathBuilder
+from src.utils.stage_profiler import StageProfiler
 from src.utils.tools import Tools
 
+# average size of a source line, and memory held per window while merging windows, in bytes
+_BYTES_PER_LINE = 32
+_BYTES_PER_WINDOW = 512
+
+
+def _repo_windows_task(
+    base_dir: str,
+    repo: str,
+    configs: List[Tuple[int, int]],
+    near_duplicate_threshold: Optional[float] = None,
+) -> None:
+    """
+    Builds the repo windows of every (window size, slice size) from a single load of the repo.
+    """
+    source_code_files = Tools.iterate_repository(base_dir, repo)
+    for window_size, slice_size in configs:
+        with StageProfiler.profile("make_repo_windows", repo) as record:
+            maker = RepoWindowMaker(
+                base_dir, repo, window_size, slice_size, source_code_files, near_duplicate_threshold
+            )
+            record["items"] = maker.build_windows()
+            if maker.dedup_stats is not None:
+                record.update(maker.dedup_stats)
+
+
+def _baseline_and_ground_task(
+    benchmark: str,
+    base_dir: str,
+    repo: str,
+    configs: List[Tuple[int, int]],
+    tasks: List[Dict[str, Any]],
+) -> None:
+    """
+    Builds the RG1 and GT windows of every (window size, slice size) from a single load of
+    the repo.
+    """
+    source_code_files = Tools.iterate_repository(base_dir, repo)
+    for window_size, slice_size in configs:
+        with StageProfiler.profile("make_baseline_windows", repo) as record:
+            record["items"] = BaselineWindowMaker(
+                benchmark, base_dir, repo, window_size, slice_size, tasks, source_code_files
+            ).build_window()
+
+        with StageProfiler.profile("make_ground_truth_windows", repo) as record:
+            record["items"] = GroundTruthWindowMaker(
+                benchmark, base_dir, repo, window_size, slice_size, tasks, source_code_files
+            ).build_window()
+
+
+def _prediction_task(
+    benchmark: str, base_dir: str, repo: str, mode: str, configs: List[Tuple[int, str]]
+) -> None:
+    """
+    Builds the prediction windows of every (window size, prediction file) from a single load
+    of the repo.
+    """
+    source_code_files = Tools.iterate_repository(base_dir, repo)
+    window_path_builder = functools.partial(FilePathBuilder.gen_first_window_path, benchmark, mode)
+    for window_size, prediction_path in configs:
+        with StageProfiler.profile("make_prediction_windows", repo) as record:
+            record["items"] = PredictionWindowMaker(
+                base_dir, repo, window_size, prediction_path, window_path_builder, source_code_files
+            ).build_window()
+
+
+def _run_in_worker(fn: Callable, args: Tuple[Any, ...]) -> List[Dict[str, Any]]:
+    # runs in a pool process; the stage records are handed back to the parent
+    StageProfiler.reset()
+    fn(*args)
+    return StageProfiler.records
+
 
 class MakeWindowWrapper:
     """
@@ -20,6 +95,10 @@ class MakeWindowWrapper:
     - Prediction-derived windows (e.g., RepoCoder)
 
     This class is used by `windowing.py` to drive window creation for the pipeline.
+
+    Each repo is one task that loads the repo once and builds the windows of every window
+    configuration. Tasks run on a process pool, largest repos first; with a memory budget,
+    a task only starts while the estimated peak memory of the running tasks fits in it.
     """
 
     def __init__(
@@ -29,6 +108,8 @@ class MakeWindowWrapper:
         repos: List[str],
         window_sizes: List[int],
         slice_sizes: List[int],
+        max_workers: Optional[int] = None,
+        max_memory_mb: Optional[int] = None,
     ):
         """
         Initializes the wrapper with common configuration.
@@ -38,12 +119,17 @@ class MakeWindowWrapper:
             repos: List of repositories to process.
             window_sizes: List of context window sizes.
             slice_sizes: List of slicing strides (for repo files or predictions).
+            max_workers: Number of worker processes (default: CPU count); 1 runs in-process.
+            max_memory_mb: Budget for the estimated peak memory of concurrently running
+                tasks; None means no budget. A task larger than the budget runs alone.
         """
         self.benchmark = benchmark
         self.base_dir = base_dir
         self.repos = repos
         self.window_sizes = window_sizes
         self.slice_sizes = slice_sizes
+        self.max_workers = max_workers or os.cpu_count()
+        self.max_memory_mb = max_memory_mb
 
         # Resolve path to the benchmark's task file
         if benchmark == Constants.line_benchmark:
@@ -57,14 +143,82 @@ class MakeWindowWrapper:
         else:
             self.task_file_path = None  # Used only if benchmark is provided
 
-    def window_for_repo_files(self) -> None:
+    def _estimate_memory(self, repo: str, copies: int, windows_per_line: float = 0.0) -> int:
+        """
+        Rough peak memory of a task, in bytes: the repo source, `copies` more copies of it, and
+        the records (metadata, span and context digest) of `windows_per_line` windows per line.
+        """
+        pattern = os.path.join(f"{self.base_dir}/{repo}", "**", "*.py")
+        source_bytes = sum(os.path.getsize(f) for f in glob.glob(pattern, recursive=True))
+        window_bytes = windows_per_line * _BYTES_PER_WINDOW / _BYTES_PER_LINE
+        return int(source_bytes * (1 + copies + window_bytes))
+
+    def _run_repo_tasks(
+        self,
+        fn: Callable,
+        args_by_repo: Dict[str, Tuple],
+        copies: int,
+        windows_per_line: float = 0.0,
+    ) -> None:
+        """
+        Runs `fn(*args)` for every repo, in this process or on a process pool.
+        """
+        estimates = {
+            repo: self._estimate_memory(repo, copies, windows_per_line) for repo in args_by_repo
+        }
+        # largest first, so that a big repo does not start last and leave a long tail
+        order = sorted(args_by_repo, key=lambda repo: estimates[repo], reverse=True)
+        if self.max_workers <= 1:
+            for repo in order:
+                fn(*args_by_repo[repo])
+            return
+
+        budget = self.max_memory_mb * 2**20 if self.max_memory_mb else None
+        running: Dict[Any, str] = {}
+        in_flight = 0
+
+        def wait_for_one() -> int:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            freed = 0
+            for future in done:
+                freed += estimates[running.pop(future)]
+                for record in future.result():
+                    StageProfiler.add(record)
+            return freed
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            for repo in order:
+                while running and (
+                    len(running) >= self.max_workers
+                    or (budget is not None and in_flight + estimates[repo] > budget)
+                ):
+                    in_flight -= wait_for_one()
+                running[executor.submit(_run_in_worker, fn, args_by_repo[repo])] = repo
+                in_flight += estimates[repo]
+            while running:
+                in_flight -= wait_for_one()
+
+    def window_for_repo_files(self, near_duplicate_threshold: Optional[float] = None) -> None:
         """
         Generates context windows from raw Python files in each repository.
+
+        Args:
+            near_duplicate_threshold: If set, also collapse windows whose estimated Jaccard
+                similarity reaches it (see `RepoWindowMaker`).
         """
-        for window_size, slice_size in itertools.product(self.window_sizes, self.slice_sizes):
-            for repo in self.repos:
-                repo_window_maker = RepoWindowMaker(self.base_dir, repo, window_size, slice_size)
-                repo_window_maker.build_windows()
+        configs = list(itertools.product(self.window_sizes, self.slice_sizes))
+        slice_steps = [max(1, window_size // slice_size) for window_size, slice_size in configs]
+        # the loaded files and their normalized text, plus the distinct contexts: a line is in
+        # about window_size / slice step of them at most
+        copies = 1 + max(
+            window_size // slice_step for (window_size, _), slice_step in zip(configs, slice_steps)
+        )
+        self._run_repo_tasks(
+            _repo_windows_task,
+            {repo: (self.base_dir, repo, configs, near_duplicate_threshold) for repo in self.repos},
+            copies,
+            windows_per_line=1 / min(slice_steps),
+        )
 
     def window_for_baseline_and_ground(self) -> None:
         """
@@ -75,18 +229,21 @@ class MakeWindowWrapper:
         if self.task_file_path is None:
             raise ValueError("No benchmark was provided to resolve task file path.")
 
-        tasks = Tools.load_jsonl(self.task_file_path)
+        tasks_by_repo: Dict[str, List[Dict[str, Any]]] = {repo: [] for repo in self.repos}
+        for task in Tools.load_jsonl(self.task_file_path):
+            repo = task["metadata"]["task_id"].split("/")[0]
+            if repo in tasks_by_repo:
+                tasks_by_repo[repo].append(task)
 
-        for window_size in self.window_sizes:
-            for slice_size in self.slice_sizes:
-                for repo in self.repos:
-                    BaselineWindowMaker(
-                        self.benchmark, self.base_dir, repo, window_size, slice_size, tasks
-                    ).build_window()
-
-                    GroundTruthWindowMaker(
-                        self.benchmark, self.base_dir, repo, window_size, slice_size, tasks
-                    ).build_window()
+        configs = list(itertools.product(self.window_sizes, self.slice_sizes))
+        self._run_repo_tasks(
+            _baseline_and_ground_task,
+            {
+                repo: (self.benchmark, self.base_dir, repo, configs, tasks_by_repo[repo])
+                for repo in self.repos
+            },
+            copies=0,
+        )
 
     def window_for_prediction(self, mode: str, prediction_path_template: str) -> None:
         """
@@ -96,16 +253,15 @@ class MakeWindowWrapper:
             mode: Evaluation mode (e.g., 'r-g-r-g').
             prediction_path_template: Format string with {window_size} and {slice_size}.
         """
-        for window_size, slice_size in itertools.product(self.window_sizes, self.slice_sizes):
-            prediction_path = prediction_path_template.format(
-                window_size=window_size, slice_size=slice_size
+        configs = [
+            (
+                window_size,
+                prediction_path_template.format(window_size=window_size, slice_size=slice_size),
             )
-
-            for repo in self.repos:
-                window_path_builder = functools.partial(
-                    FilePathBuilder.gen_first_window_path, self.benchmark, mode
-                )
-                pred_window_maker = PredictionWindowMaker(
-                    self.base_dir, repo, window_size, prediction_path, window_path_builder
-                )
-                pred_window_maker.build_window()
+            for window_size, slice_size in itertools.product(self.window_sizes, self.slice_sizes)
+        ]
+        self._run_repo_tasks(
+            _prediction_task,
+            {repo: (self.benchmark, self.base_dir, repo, mode, configs) for repo in self.repos},
+            copies=0,
+        )
@@ -0,0 +1,134 @@
+from collections import defaultdict
+from typing import AbstractSet, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# hash parameters of the MinHash permutations, as in the usual universal hashing scheme
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+# multiplier combining the token ids of a shingle into one value
+_SHINGLE_MULTIPLIER = np.uint64(1000003)
+
+
+class MinHashDeduplicator:
+    """
+    Finds groups of near-duplicate token sequences with MinHash and locality-sensitive hashing.
+
+    Each sequence is reduced to the set of its `shingle_size`-grams of token ids, and its
+    MinHash signature estimates the Jaccard similarity between these sets. Signatures are
+    split into bands; sequences sharing a band are candidates, and candidates whose estimated
+    similarity reaches `threshold` are put in the same group (transitively).
+    """
+
+    def __init__(self, threshold: float, num_perm: int = 128, shingle_size: int = 5, seed: int = 0):
+        """
+        Args:
+            threshold: Estimated Jaccard similarity from which two sequences are duplicates.
+            num_perm: Number of hash functions of a signature.
+            shingle_size: Number of consecutive token ids in a shingle.
+            seed: Seed of the hash functions.
+        """
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError(f"Threshold must be in (0, 1], got {threshold}")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.num_bands, self.rows_per_band = self._choose_bands(threshold, num_perm)
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 2**61 - 1, size=num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.randint(0, 2**61 - 1, size=num_perm, dtype=np.uint64)[:, None]
+
+    @staticmethod
+    def _choose_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+        """
+        Returns the (bands, rows per band) splitting the signature whose LSH threshold,
+        (1 / bands) ** (1 / rows), is the closest to `threshold`.
+        """
+        splits = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+        return min(splits, key=lambda split: abs((1 / split[0]) ** (1 / split[1]) - threshold))
+
+    def _shingle_hashes(self, token_ids: Sequence[int]) -> np.ndarray:
+        ids = np.asarray(token_ids, dtype=np.uint64)
+        if len(ids) < self.shingle_size:
+            shingles = ids[None, :]
+        else:
+            shingles = np.lib.stride_tricks.sliding_window_view(ids, self.shingle_size)
+        powers = _SHINGLE_MULTIPLIER ** np.arange(shingles.shape[1], dtype=np.uint64)
+        values = (shingles * powers).sum(axis=1, dtype=np.uint64)
+        return np.unique((values ^ (values >> np.uint64(32))) & _MAX_HASH)
+
+    def signature(self, token_ids: Sequence[int]) -> np.ndarray:
+        """
+        Returns the MinHash signature of a token sequence; all ones (the largest hash) for an
+        empty sequence, which then only matches other empty sequences.
+        """
+        if len(token_ids) == 0:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        hashes = self._shingle_hashes(token_ids)[None, :]
+        permuted = ((self._a * hashes + self._b) % _MERSENNE_PRIME) & _MAX_HASH
+        return permuted.min(axis=1)
+
+    def find_groups(
+        self,
+        token_lists: Sequence[Sequence[int]],
+        exclusive_keys: Optional[Sequence[AbstractSet[Hashable]]] = None,
+    ) -> List[List[int]]:
+        """
+        Groups the indices of near-duplicate sequences.
+
+        Args:
+            token_lists: Token ids of each sequence.
+            exclusive_keys: Keys of each sequence (e.g. the files it comes from); sequences
+                sharing a key are never put in the same group, even through other sequences.
+
+        Returns:
+            Groups of indices in increasing order, ordered by their first index; every index is
+            in exactly one group.
+        """
+        if not token_lists:
+            return []
+        signatures = np.stack([self.signature(token_ids) for token_ids in token_lists])
+        parents = list(range(len(token_lists)))
+        # keys of the sequences of each group, by root
+        group_keys = (
+            {i: set(keys) for i, keys in enumerate(exclusive_keys)} if exclusive_keys else None
+        )
+
+        def find(i: int) -> int:
+            while parents[i] != i:
+                parents[i] = parents[parents[i]]
+                i = parents[i]
+            return i
+
+        for band in range(self.num_bands):
+            columns = slice(band * self.rows_per_band, (band + 1) * self.rows_per_band)
+            buckets: Dict[bytes, List[int]] = defaultdict(list)
+            for i, band_signature in enumerate(signatures[:, columns]):
+                buckets[band_signature.tobytes()].append(i)
+            for members in buckets.values():
+                # each member is compared to one member of every group already in the bucket
+                roots: List[int] = []
+                for i in members:
+                    for j, root in enumerate(roots):
+                        root = roots[j] = find(root)
+                        if find(i) == root:
+                            break
+                        if group_keys and not group_keys[find(i)].isdisjoint(group_keys[root]):
+                            continue
+                        similarity = np.mean(signatures[i] == signatures[root])
+                        if similarity >= self.threshold:
+                            # the smallest index stays the root, so it represents the group
+                            low, high = sorted((find(i), root))
+                            parents[high] = low
+                            roots[j] = low
+                            if group_keys:
+                                group_keys[low] |= group_keys.pop(high)
+                            break
+                    else:
+                        roots.append(find(i))
+
+        groups: Dict[int, List[int]] = defaultdict(list)
+        for i in range(len(token_lists)):
+            groups[find(i)].append(i)
+        return list(groups.values())
@@ -1,4 +1,4 @@
-from typing import Any, Callable, Dict, List
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from src.build_windows.base_window_maker import BaseWindowMaker
 from src.utils.tools import Tools
@@ -17,6 +17,7 @@ class PredictionWindowMaker(BaseWindowMaker):
         window_size (int): Total number of lines in the prediction context window.
         prediction_path (str): Path to the `.jsonl` file containing model predictions.
         window_path_builder (Callable): Function that returns an output path based on prediction metadata.
+        source_code_files (dict, optional): Repository files already loaded by the caller.
     """
 
     def __init__(
@@ -26,13 +27,14 @@ class PredictionWindowMaker(BaseWindowMaker):
         window_size: int,
         prediction_path: str,
         window_path_builder: Callable[[str, str, int], str],
+        source_code_files: Optional[Dict[Tuple[str, ...], str]] = None,
     ):
-        super().__init__(base_dir, repo, window_size)
+        super().__init__(base_dir, repo, window_size, source_code_files)
         self.prediction_path = prediction_path
         self.predictions: List[Dict[str, Any]] = Tools.load_jsonl(prediction_path)
         self.window_path_builder = window_path_builder
 
-    def build_window(self, type: str = "centered") -> None:
+    def build_window(self, type: str = "centered") -> int:
         """
         Constructs windows by inserting predicted text at the specified line
         and extracting a symmetric window around the insertion point.
@@ -93,3 +95,4 @@ class PredictionWindowMaker(BaseWindowMaker):
 
         output_path = self.window_path_builder(self.prediction_path, self.repo, self.window_size)
         Tools.dump_pickle(code_windows, output_path)
+        return len(code_windows)
@@ -1,6 +1,9 @@
-from typing import Any, Dict, List, Tuple
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
 from collections import defaultdict
 
+from src.build_windows.near_duplicates import MinHashDeduplicator
+from src.build_windows.window_metadata import FileTable, MetadataRecord, as_metadata
 from src.utils.file_path_builder import FilePathBuilder
 from src.utils.tools import Tools
 
@@ -11,15 +14,28 @@ class RepoWindowMaker:
 
     Each window is a symmetric slice of lines around a target line, sampled
     at a regular interval (slice step). These windows are useful for building
-    search indexes or training context models.
+    search indexes or training context models. The metadata of each window is a compact
+    record sharing the repo's file table (see `window_metadata`).
 
     Args:
         repo (str): Repository name or relative path (within `data/repositories/`).
         window_size (int): Total number of lines in each context window.
         slice_size (int): Controls how densely windows are sampled across a file.
+        source_code_files (dict, optional): Repository files already loaded by the caller.
+        near_duplicate_threshold (float, optional): If set, of windows from different files
+            whose estimated Jaccard similarity of token shingles reaches it, only the first
+            is kept.
     """
 
-    def __init__(self, base_dir: str, repo: str, window_size: int, slice_size: int):
+    def __init__(
+        self,
+        base_dir: str,
+        repo: str,
+        window_size: int,
+        slice_size: int,
+        source_code_files: Optional[Dict[Tuple[str, ...], str]] = None,
+        near_duplicate_threshold: Optional[float] = None,
+    ):
         self.repo = repo
         self.window_size = window_size
         self.slice_size = slice_size
@@ -28,88 +44,193 @@ class RepoWindowMaker:
         self.slice_step = max(1, window_size // slice_size)
 
         # Dict mapping (tuple-based path) -> file content string
-        self.source_code_files: Dict[Tuple[str, ...], str] = Tools.iterate_repository(
-            base_dir, repo
-        )
+        if source_code_files is None:
+            source_code_files = Tools.iterate_repository(base_dir, repo)
+        self.source_code_files: Dict[Tuple[str, ...], str] = source_code_files
+        # file paths shared by the metadata of all windows of the repo
+        self.file_table = FileTable(repo)
+        self.near_duplicate_threshold = near_duplicate_threshold
+        # size of the corpus before and after merging near-duplicates, set by build_windows
+        self.dedup_stats: Optional[Dict[str, int]] = None
+
+    @staticmethod
+    def _normalize(code: str) -> Tuple[str, List[int]]:
+        """
+        Joins the lines of a file with "\\n" once, so that every window is a contiguous span
+        of the result, and returns the offset at which each line starts.
+        """
+        code_lines = code.splitlines()
+        text = "\n".join(code_lines)
+        line_starts = [0]
+        position = text.find("\n")
+        while position != -1:
+            line_starts.append(position + 1)
+            position = text.find("\n", position + 1)
+        # an empty file has no lines, not one empty line
+        return text, line_starts[: len(code_lines)]
 
     def _build_windows_for_file(
-        self, fpath_tuple: Tuple[str, ...], code: str
-    ) -> List[Dict[str, Any]]:
+        self, fpath_tuple: Tuple[str, ...], text: str, line_starts: List[int]
+    ) -> List[Tuple[int, int, MetadataRecord]]:
         """
-        Creates a list of context windows from a single source file.
+        Creates the context windows of a single source file as spans of its text, without
+        copying any line.
 
         Args:
             fpath_tuple: Normalized path to the source file as tuple of path parts.
-            code: Raw source code string.
+            text: File content as returned by `_normalize`.
+            line_starts: Offset of the start of each line in `text`.
 
         Returns:
-            List of dicts, each representing a code window with metadata.
+            List of (start offset, end offset, metadata) tuples, one per window.
         """
-        code_windows: List[Dict[str, Any]] = []
-        code_lines = code.splitlines()
+        code_windows: List[Tuple[int, int, MetadataRecord]] = []
+        file_id = self.file_table.intern(fpath_tuple)
+        num_lines = len(line_starts)
         delta_size = self.window_size // 2
 
-        for line_no in range(0, len(code_lines), self.slice_step):
+        for line_no in range(0, num_lines, self.slice_step):
             start_line = max(0, line_no - delta_size)
-            end_line = min(len(code_lines), line_no + self.window_size - delta_size)
-
-            window_lines = [line for line in code_lines[start_line:end_line]]
-            if not window_lines:  # skip empty windows
+            end_line = min(num_lines, line_no + self.window_size - delta_size)
+            if start_line >= end_line:  # skip empty windows
                 continue
 
-            context = "\n".join(window_lines)
-            metadata = {
-                "fpath_tuple": fpath_tuple,
-                "line_no": line_no,
-                "start_line_no": start_line,
-                "end_line_no": end_line,
-                "window_size": self.window_size,
-                "repo": self.repo,
-                "slice_size": self.slice_size,
-            }
-
-            code_windows.append(
-                {
-                    "context": context,
-                    "metadata": metadata,
-                }
+            # the last line of the window ends right before the next line's "\\n"
+            end_offset = line_starts[end_line] - 1 if end_line < num_lines else len(text)
+            metadata = (
+                self.file_table,
+                file_id,
+                line_no,
+                start_line,
+                end_line,
+                self.window_size,
+                self.slice_size,
             )
+            code_windows.append((line_starts[start_line], end_offset, metadata))
 
         return code_windows
 
+    @staticmethod
+    def _byte_offsets(text: str, data: bytes) -> Optional[Dict[int, int]]:
+        """
+        Maps the offset of each line start in `text`, and its end, to the same position in
+        `data`, its UTF-8 encoding; None when the text is ASCII, as both offsets are then equal.
+        """
+        if len(data) == len(text):
+            return None
+        byte_offsets = {}
+        char_offset = byte_offset = 0
+        for line in text.split("\n"):
+            byte_offsets[char_offset] = byte_offset
+            char_offset += len(line) + 1
+            byte_offset += len(line.encode("utf8")) + 1
+        byte_offsets[len(text)] = len(data)
+        return byte_offsets
+
     def _merge_windows_with_same_context(
-        self, code_windows: List[Dict[str, Any]]
+        self, spans: List[Tuple[str, List[Tuple[int, int, MetadataRecord]]]]
     ) -> List[Dict[str, Any]]:
         """
         Deduplicates windows by merging metadata of windows with identical context.
 
+        Windows are keyed by a digest of their span of the file's UTF-8 bytes, hashed in place,
+        so a context string is only built for the first window of each distinct context.
+
         Args:
-            code_windows: List of windows (each with 'context' and 'metadata').
+            spans: For each file, its text and its window spans.
 
         Returns:
             Merged list with unique 'context' entries and grouped metadata.
         """
-        merged_code_windows: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
-        for window in code_windows:
-            context = window["context"]
-            merged_code_windows[context].append(window["metadata"])
-
-        return [
-            {"context": context, "metadata": metadata_list}
-            for context, metadata_list in merged_code_windows.items()
+        merged_code_windows: Dict[bytes, Dict[str, Any]] = {}
+        for text, windows in spans:
+            data = text.encode("utf8")
+            view = memoryview(data)
+            byte_offsets = self._byte_offsets(text, data)
+            for start, end, metadata in windows:
+                if byte_offsets is None:
+                    byte_start, byte_end = start, end
+                else:
+                    # a window ends at the end of the text or right before a line's "\n"
+                    byte_start = byte_offsets[start]
+                    byte_end = (
+                        byte_offsets[end] if end in byte_offsets else byte_offsets[end + 1] - 1
+                    )
+                digest = hashlib.blake2b(view[byte_start:byte_end], digest_size=16).digest()
+                window = merged_code_windows.get(digest)
+                if window is None:
+                    merged_code_windows[digest] = {
+                        "context": text[start:end],
+                        "metadata": [metadata],
+                    }
+                else:
+                    window["metadata"].append(metadata)
+            view.release()
+
+        return list(merged_code_windows.values())
+
+    def _merge_near_duplicate_windows(
+        self, merged_windows: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Collapses windows whose contexts are near-duplicates, judged by MinHash over their
+        token ids, into the first window of each group.
+
+        Unlike identical windows, the other windows of a group are dropped rather than merged
+        into the metadata of the kept one: their text differs from the kept context, so
+        listing their locations would let `CodeSearchWorker._is_context_after_hole` keep a
+        context whose own location is after the hole in the task's file. Windows of the same
+        file are never grouped, so that overlapping windows of a file are all kept.
+
+        Args:
+            merged_windows: Windows with distinct contexts.
+
+        Returns:
+            Windows with no two near-duplicate contexts from different files.
+        """
+        token_lists = Tools.tokenize_batch([window["context"] for window in merged_windows])
+        fpath_tuples = [
+            {as_metadata(metadata)["fpath_tuple"] for metadata in window["metadata"]}
+            for window in merged_windows
         ]
+        groups = MinHashDeduplicator(self.near_duplicate_threshold).find_groups(
+            token_lists, fpath_tuples
+        )
+        near_deduplicated_windows = [merged_windows[group[0]] for group in groups]
+
+        self.dedup_stats = {
+            "windows": len(merged_windows),
+            "windows_after_dedup": len(near_deduplicated_windows),
+            "context_chars": sum(len(window["context"]) for window in merged_windows),
+            "context_chars_after_dedup": sum(
+                len(window["context"]) for window in near_deduplicated_windows
+            ),
+        }
+        print(
+            f"Collapsed near-duplicate windows of repo '{self.repo}': "
+            f"{len(merged_windows)} -> {len(near_deduplicated_windows)} windows, "
+            f"{self.dedup_stats['context_chars']} -> "
+            f"{self.dedup_stats['context_chars_after_dedup']} context characters "
+            f"({1 - len(near_deduplicated_windows) / max(1, len(merged_windows)):.1%} fewer windows)"
+        )
+        return near_deduplicated_windows
 
-    def build_windows(self) -> None:
+    def build_windows(self) -> int:
         """
         Builds windows for the entire repository and writes them to a pickle file.
         Each window is a symmetric context slice sampled at regular intervals.
-        """
-        all_code_windows: List[Dict[str, Any]] = []
 
+        Returns:
+            The number of (merged) windows written.
+        """
+        spans = []
         for fpath_tuple, code in self.source_code_files.items():
-            all_code_windows.extend(self._build_windows_for_file(fpath_tuple, code))
+            text, line_starts = self._normalize(code)
+            spans.append((text, self._build_windows_for_file(fpath_tuple, text, line_starts)))
 
-        merged_windows = self._merge_windows_with_same_context(all_code_windows)
+        merged_windows = self._merge_windows_with_same_context(spans)
+        if self.near_duplicate_threshold is not None:
+            merged_windows = self._merge_near_duplicate_windows(merged_windows)
 
         print(
             f"Built {len(merged_windows)} windows for repo '{self.repo}' "
@@ -120,3 +241,4 @@ class RepoWindowMaker:
             self.repo, self.window_size, self.slice_size
         )
         Tools.dump_pickle(merged_windows, output_path)
+        return len(merged_windows)
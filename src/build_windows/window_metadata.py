@@ -0,0 +1,115 @@
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+
+class FileTable:
+    """
+    Interned file paths of one repository's windows.
+
+    Every metadata record of a repo points at the same table, so pickle stores the table, and
+    each path in it, once per file instead of once per window.
+    """
+
+    __slots__ = ("repo", "fpath_tuples", "_ids")
+
+    def __init__(self, repo: str, fpath_tuples: Tuple[Tuple[str, ...], ...] = ()):
+        """
+        Args:
+            repo: Repository the files belong to.
+            fpath_tuples: Paths already interned, in id order.
+        """
+        self.repo = repo
+        self.fpath_tuples: List[Tuple[str, ...]] = list(fpath_tuples)
+        self._ids = {fpath_tuple: i for i, fpath_tuple in enumerate(self.fpath_tuples)}
+
+    def intern(self, fpath_tuple: Tuple[str, ...]) -> int:
+        """
+        Returns the id of a file path, adding it to the table if needed.
+        """
+        file_id = self._ids.get(fpath_tuple)
+        if file_id is None:
+            file_id = self._ids[fpath_tuple] = len(self.fpath_tuples)
+            self.fpath_tuples.append(fpath_tuple)
+        return file_id
+
+    def __reduce__(self):
+        return FileTable, (self.repo, tuple(self.fpath_tuples))
+
+
+# A repo window's metadata record is the plain tuple
+#   (file_table, file_id, line_no, start_line_no, end_line_no, window_size, slice_size).
+# Plain tuples are about a third of the size of the equivalent dict in memory, and pickle
+# writes and reads them natively, unlike instances of a tuple subclass or a slotted class.
+MetadataRecord = Tuple[FileTable, int, int, int, int, int, int]
+
+# keys of the metadata dicts the window makers used to build, in their order
+_KEYS = (
+    "fpath_tuple",
+    "line_no",
+    "start_line_no",
+    "end_line_no",
+    "window_size",
+    "repo",
+    "slice_size",
+)
+# position in the record of the keys stored as plain ints
+_FIELD_INDEX = {
+    "line_no": 2,
+    "start_line_no": 3,
+    "end_line_no": 4,
+    "window_size": 5,
+    "slice_size": 6,
+}
+
+
+class WindowMetadata(Mapping):
+    """
+    Read-only view of a metadata record with the keys and values of the old metadata dict, in
+    the same order, so `dict(WindowMetadata(record))` gives that dict back.
+    """
+
+    __slots__ = ("record",)
+
+    def __init__(self, record: MetadataRecord):
+        self.record = record
+
+    def __getitem__(self, key: str) -> Any:
+        index = _FIELD_INDEX.get(key)
+        if index is not None:
+            return self.record[index]
+        if key == "fpath_tuple":
+            return self.record[0].fpath_tuples[self.record[1]]
+        if key == "repo":
+            return self.record[0].repo
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(_KEYS)
+
+    def __len__(self) -> int:
+        return len(_KEYS)
+
+    def __repr__(self) -> str:
+        return f"WindowMetadata({dict(self)!r})"
+
+
+def as_metadata(metadata: Union[Dict[str, Any], MetadataRecord]) -> Mapping:
+    """
+    Returns window metadata as a mapping: records are wrapped, dicts (query windows, merged
+    fragments, windows built before records were introduced) are returned as they are.
+    """
+    if isinstance(metadata, tuple):
+        return WindowMetadata(metadata)
+    return metadata
+
+
+def metadata_to_dicts(
+    metadata_list: List[Union[Dict[str, Any], MetadataRecord]],
+) -> List[Dict[str, Any]]:
+    """
+    Converts a list of window metadata to plain dicts, e.g. for JSON output.
+    """
+    return [
+        metadata if isinstance(metadata, dict) else dict(as_metadata(metadata))
+        for metadata in metadata_list
+    ]
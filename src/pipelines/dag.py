@@ -0,0 +1,231 @@
+"""
+Content-addressed execution of pipeline stages.
+
+Every node declares the callable it runs with its parameters, the files or directories it
+reads and the files it writes. A node is skipped when the hash of its parameters and of the
+content of its inputs matches the one recorded in the manifest at its last run, and its
+outputs are still on disk unchanged. Nodes whose inputs do not depend on each other run in
+parallel worker processes.
+"""
+
+import os
+import json
+import hashlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from src.utils.constants import Constants
+from src.utils.stage_profiler import StageProfiler
+
+
+class Node:
+    """
+    A pipeline stage: `fn(*args, **kwargs)` reads `inputs` and writes `outputs`.
+
+    `fn` and its arguments must be picklable (module-level functions and plain values), so
+    that the node can run in a worker process.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable,
+        args: Sequence[Any] = (),
+        kwargs: Optional[Dict[str, Any]] = None,
+        inputs: Sequence[str] = (),
+        outputs: Sequence[str] = (),
+    ):
+        """
+        Args:
+            name: Unique node name, used as its key in the manifest.
+            fn: Callable running the stage.
+            args: Positional arguments of `fn`, part of the node's parameters.
+            kwargs: Keyword arguments of `fn`, part of the node's parameters.
+            inputs: Files or directories the stage reads.
+            outputs: Files the stage writes.
+        """
+        self.name = name
+        self.fn = fn
+        self.args = tuple(args)
+        self.kwargs = kwargs or {}
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+    def params(self) -> str:
+        fn_name = f"{self.fn.__module__}.{self.fn.__qualname__}"
+        kwargs = sorted(self.kwargs.items())
+        return repr((fn_name, self.args, kwargs))
+
+
+def _run_node(node: Node) -> List[Dict[str, Any]]:
+    # runs in a pool process; the stage records are handed back to the parent
+    StageProfiler.reset()
+    node.fn(*node.args, **node.kwargs)
+    return StageProfiler.records
+
+
+class DagExecutor:
+    """
+    Runs a set of `Node`s in dependency order, skipping those that are up to date.
+
+    A node depends on the nodes producing any of its inputs. File hashes are cached in the
+    manifest by modification time and size, so unchanged files are not re-read.
+    """
+
+    def __init__(
+        self,
+        nodes: List[Node],
+        manifest_path: str = Constants.cache_manifest_path,
+        max_workers: Optional[int] = None,
+    ):
+        """
+        Args:
+            nodes: Nodes of the graph.
+            manifest_path: JSON file recording node keys and file hashes between runs.
+            max_workers: Nodes running at the same time; 1 runs them in this process.
+        """
+        self.nodes = {node.name: node for node in nodes}
+        if len(self.nodes) != len(nodes):
+            raise ValueError("Node names must be unique")
+        self.manifest_path = manifest_path
+        self.max_workers = max_workers or os.cpu_count()
+
+        producers = {}
+        for node in nodes:
+            for output in node.outputs:
+                if output in producers:
+                    raise ValueError(f"{output} is written by {producers[output]} and {node.name}")
+                producers[output] = node.name
+        self.dependencies = {
+            node.name: {producers[path] for path in node.inputs if path in producers}
+            for node in nodes
+        }
+        self._check_acyclic()
+
+        self.manifest = {"nodes": {}, "files": {}}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf8") as f:
+                self.manifest = json.load(f)
+
+    def _check_acyclic(self) -> None:
+        remaining = {name: set(deps) for name, deps in self.dependencies.items()}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"Dependency cycle between {sorted(remaining)}")
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+    def _hash_file(self, path: str) -> str:
+        stat = os.stat(path)
+        cached = self.manifest["files"].get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self.manifest["files"][path] = [stat.st_mtime_ns, stat.st_size, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def _hash_path(self, path: str) -> Optional[str]:
+        """
+        Content hash of a file, or of every file under a directory; None if it is missing.
+        """
+        if os.path.isfile(path):
+            return self._hash_file(path)
+        if not os.path.isdir(path):
+            return None
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for fname in sorted(files):
+                file_path = os.path.join(root, fname)
+                digest.update(os.path.relpath(file_path, path).encode("utf8"))
+                digest.update(self._hash_file(file_path).encode("utf8"))
+        return digest.hexdigest()
+
+    def _node_key(self, node: Node) -> str:
+        input_hashes = []
+        for path in node.inputs:
+            input_hash = self._hash_path(path)
+            if input_hash is None:
+                raise FileNotFoundError(f"Input {path} of node {node.name} does not exist")
+            input_hashes.append((path, input_hash))
+        return hashlib.sha256(repr((node.params(), input_hashes)).encode("utf8")).hexdigest()
+
+    def _is_up_to_date(self, node: Node, key: str) -> bool:
+        entry = self.manifest["nodes"].get(node.name)
+        if entry is None or entry["key"] != key:
+            return False
+        return all(self._hash_path(path) == entry["outputs"].get(path) for path in node.outputs)
+
+    def _record(self, node: Node, key: str) -> None:
+        self.manifest["nodes"][node.name] = {
+            "key": key,
+            "outputs": {path: self._hash_path(path) for path in node.outputs},
+        }
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def run(self, force: bool = False) -> Dict[str, str]:
+        """
+        Runs every node that is not up to date.
+
+        Args:
+            force: Run every node, even if it is up to date.
+
+        Returns:
+            "ran" or "skipped" for each node name.
+        """
+        status: Dict[str, str] = {}
+        keys: Dict[str, str] = {}
+        running = {}
+        executor = ProcessPoolExecutor(self.max_workers) if self.max_workers > 1 else None
+        try:
+            while len(status) < len(self.nodes):
+                # start (or skip) every node whose dependencies are done
+                progressed = False
+                for name, node in self.nodes.items():
+                    if name in status or name in keys:
+                        continue
+                    if not all(dep in status for dep in self.dependencies[name]):
+                        continue
+                    progressed = True
+                    keys[name] = self._node_key(node)
+                    if not force and self._is_up_to_date(node, keys[name]):
+                        status[name] = "skipped"
+                        print(f"[dag] {name}: up to date, skipped")
+                    elif executor is None:
+                        print(f"[dag] {name}: running")
+                        node.fn(*node.args, **node.kwargs)
+                        self._record(node, keys[name])
+                        status[name] = "ran"
+                    else:
+                        print(f"[dag] {name}: running")
+                        running[executor.submit(_run_node, node)] = name
+                if progressed:
+                    continue
+                if not running:
+                    raise RuntimeError("No node can run; the graph is inconsistent")
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        records = future.result()
+                    except Exception as e:
+                        raise RuntimeError(f"Node {name} failed") from e
+                    for record in records:
+                        StageProfiler.add(record)
+                    self._record(self.nodes[name], keys[name])
+                    status[name] = "ran"
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        return status
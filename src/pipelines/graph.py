@@ -0,0 +1,139 @@
+"""
+Graph of the repo and RG1/GT stages for `DagExecutor`.
+
+Windows, vectors and retrievals get one node per (repo, window size, slice size), so that
+different repos and window settings run in parallel and are recomputed independently.
+Prompts get one node per (window size, slice size), as their files cover all repos.
+"""
+
+import itertools
+from typing import List
+
+from src.build_windows.make_window import MakeWindowWrapper
+from src.pipelines.dag import Node
+from src.pipelines.prompting import build_prompts_for_baseline_and_ground
+from src.pipelines.retrieval import search_baseline_and_ground
+from src.pipelines.vectorization import (
+    vectorize_repo_windows,
+    vectorize_baseline_and_ground_windows,
+)
+from src.pipelines.windowing import make_repo_windows, make_baseline_and_ground_windows
+from src.utils.codegen_tokenizer import CodeGenTokenizer
+from src.utils.constants import Constants
+from src.utils.file_path_builder import FilePathBuilder
+
+
+def build_first_stage_nodes(
+    benchmark: str,
+    base_dir: str,
+    repos: List[str],
+    window_sizes: List[int],
+    slice_sizes: List[int],
+    vector_type: str = "one-gram",
+    tokenizer_cls=CodeGenTokenizer,
+) -> List[Node]:
+    """
+    Builds the nodes of `run_repo_stage` followed by `run_rg1_and_gt_stage`.
+
+    Args:
+        benchmark: Benchmark identifier (e.g., "short_api_benchmark").
+        base_dir: Base directory where the repositories are stored.
+        repos: List of repository names.
+        window_sizes: List of context window sizes.
+        slice_sizes: List of stride values.
+        vector_type: Vector type used for retrieval; only 'one-gram' has a vectorizer.
+        tokenizer_cls: Tokenizer class used to build prompts.
+    """
+    if vector_type != "one-gram":
+        raise ValueError(f"No vectorizer for vector type {vector_type}")
+    task_file_path = MakeWindowWrapper(
+        benchmark, base_dir, repos, window_sizes, slice_sizes
+    ).task_file_path
+    repo_dirs = {repo: f"{base_dir}/{repo}" for repo in repos}
+
+    nodes = []
+    for window_size, slice_size in itertools.product(window_sizes, slice_sizes):
+        suffix = f"ws{window_size}-ss{slice_size}"
+        retrieval_paths = []
+        for repo in repos:
+            args = ([repo], [window_size], [slice_size])
+            repo_windows = FilePathBuilder.repo_windows_path(repo, window_size, slice_size)
+            repo_vectors = FilePathBuilder.one_gram_vector_path(repo_windows)
+            query_windows = [
+                FilePathBuilder.search_first_window_path(
+                    benchmark, mode, repo, window_size, slice_size
+                )
+                for mode in (Constants.rg, Constants.gt)
+            ]
+            query_vectors = [FilePathBuilder.one_gram_vector_path(path) for path in query_windows]
+            retrievals = [
+                FilePathBuilder.retrieval_results_path(
+                    path, repo_vectors, Constants.retrieval_max_top_k
+                )
+                for path in query_vectors
+            ]
+            retrieval_paths.extend(retrievals)
+
+            nodes.extend(
+                [
+                    Node(
+                        f"repo_windows/{repo}/{suffix}",
+                        make_repo_windows,
+                        (base_dir, *args),
+                        # the executor already runs repos in parallel, so the repo nodes
+                        # do not start pools of their own
+                        {"max_workers": 1},
+                        inputs=[repo_dirs[repo]],
+                        outputs=[repo_windows],
+                    ),
+                    Node(
+                        f"repo_vectors/{repo}/{suffix}",
+                        vectorize_repo_windows,
+                        args,
+                        {"max_workers": 1},
+                        inputs=[repo_windows],
+                        outputs=[repo_vectors],
+                    ),
+                    Node(
+                        f"query_windows/{benchmark}/{repo}/{suffix}",
+                        make_baseline_and_ground_windows,
+                        (benchmark, base_dir, *args),
+                        {"max_workers": 1},
+                        inputs=[task_file_path, repo_dirs[repo]],
+                        outputs=query_windows,
+                    ),
+                    Node(
+                        f"query_vectors/{benchmark}/{repo}/{suffix}",
+                        vectorize_baseline_and_ground_windows,
+                        (benchmark, *args),
+                        {"max_workers": 1},
+                        inputs=query_windows,
+                        outputs=query_vectors,
+                    ),
+                    Node(
+                        f"retrieval/{benchmark}/{repo}/{suffix}",
+                        search_baseline_and_ground,
+                        (benchmark, *args, vector_type),
+                        {"max_workers": 1},
+                        inputs=[*query_vectors, repo_vectors],
+                        outputs=retrievals,
+                    ),
+                ]
+            )
+
+        # the r-g prompts read extended fragments from the repository files
+        prompt_paths = [
+            FilePathBuilder.prompt_path(mode, vector_type, window_size, slice_size)
+            for mode in (Constants.rg, Constants.gt)
+        ]
+        nodes.append(
+            Node(
+                f"prompts/{benchmark}/{suffix}",
+                build_prompts_for_baseline_and_ground,
+                (benchmark, repos, [window_size], [slice_size], vector_type),
+                {"tokenizer_cls": tokenizer_cls},
+                inputs=[task_file_path, *repo_dirs.values(), *retrieval_paths],
+                outputs=prompt_paths,
+            )
+        )
+    return nodes
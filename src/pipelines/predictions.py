@@ -1,10 +1,71 @@
+import os
+from typing import Optional
+
 from src.build_predictions.build_prediction import BuildPrediction
+from src.build_predictions.quantization_report import QuantizationReport
+from src.utils.constants import Constants
+from src.utils.file_path_builder import FilePathBuilder
+
+
+def build_predictions(
+    shard_id: int = 0,
+    num_shards: int = 1,
+    num_replicas: int = 1,
+    threads_per_replica: Optional[int] = None,
+    benchmark: Optional[str] = None,
+    prefix_cache: bool = False,
+) -> None:
+    """
+    Generates completions for a prompt file. Runs with the same `num_shards` and distinct
+    `shard_id`s can be spread over processes or machines; the shards are merged into
+    a single prediction file once all of them are complete.
+
+    Args:
+        shard_id: Index of the shard of task ids generated by this run.
+        num_shards: Total number of shards the prompt file is split into.
+        num_replicas: Number of model replicas (processes) generating in parallel.
+        threads_per_replica: Torch threads per replica (default: cores split evenly).
+        benchmark: Benchmark the prompts come from; if given, generation of a completion stops
+            once it has the number of lines the benchmark scores.
+        prefix_cache: Instead, generate the RG, GT and (once built) RepoCoder prompts together
+            in this process, reusing the key/value cache of the prompt prefixes they share;
+            this path is neither sharded nor stopped early.
+    """
+    file_path = FilePathBuilder.prompt_path(Constants.rg, "one-gram", 20, 2)
+    tiny_codegen = "Salesforce/codegen-350M-mono"
+    if prefix_cache and (num_shards > 1 or num_replicas > 1):
+        raise ValueError("Prefix-cached generation runs unsharded, with a single replica")
+
+    cg = BuildPrediction(
+        tiny_codegen,
+        batch_size=8,
+        max_batch_tokens=8192,
+        num_replicas=num_replicas,
+        threads_per_replica=threads_per_replica,
+        benchmark=benchmark,
+    )
+    if prefix_cache:
+        prompt_files = [
+            FilePathBuilder.prompt_path(mode, "one-gram", 20, 2)
+            for mode in (Constants.rg, Constants.gt, "repocoder")
+        ]
+        # the RepoCoder prompts are only there once the RepoCoder stage has run
+        cg.prefix_cached_generate([path for path in prompt_files if os.path.exists(path)])
+        return
+    cg.batch_generate(file_path, shard_id, num_shards)
+
 
+def compare_quantized_predictions(num_prompts: int = 20) -> None:
+    """
+    Compares dynamic int8 against fp32 CPU generation on a sample of prompts
+    (latency, peak RSS and exact-match drift) and saves the report as JSON.
 
-def build_predictions() -> None:
-    """ """
+    Args:
+        num_prompts: Number of prompts sampled from the prompt file.
+    """
     file_path = "data/prompts/r-g-one-gram-ws-20-ss-2.jsonl"
     tiny_codegen = "Salesforce/codegen-350M-mono"
 
-    cg = BuildPrediction(tiny_codegen, batch_size=1)
-    cg.batch_generate(file_path)
+    QuantizationReport(tiny_codegen, file_path, num_prompts).run(
+        "data/predictions/quantization-report.codegen-350M-mono.json"
+    )
@@ -1,8 +1,9 @@
-from typing import List
+from typing import List, Optional
 
 from src.build_prompts.build_prompt_wrapper import BuildPromptWrapper
 from src.utils.constants import Constants
 from src.utils.codegen_tokenizer import CodeGenTokenizer
+from src.utils.file_path_builder import FilePathBuilder
 
 
 def build_prompts_for_baseline_and_ground(
@@ -12,6 +13,8 @@ def build_prompts_for_baseline_and_ground(
     slice_sizes: List[int],
     vector_type: str = "one-gram",
     tokenizer_cls=CodeGenTokenizer,
+    merge_fragments: bool = True,
+    num_threads: Optional[int] = None,
 ) -> None:
     """
     Builds prompts for inference based on baseline (RG1) and ground-truth (GT) retrieval results.
@@ -23,15 +26,25 @@ def build_prompts_for_baseline_and_ground(
         slice_sizes: List of stride values.
         vector_type: Vector type used for retrieval (e.g., 'one-gram').
         tokenizer_cls: Tokenizer class to use (default: CodeGenTokenizer).
+        merge_fragments: Whether to coalesce overlapping retrieved windows of the same file.
+        num_threads: Threads the tokenizer may use to count tokens in batch (its default if
+            None); CodeGenTokenizer only uses them if TOKENIZERS_PARALLELISM is not "false".
     """
     for window_size in window_sizes:
         for slice_size in slice_sizes:
             for mode in [Constants.rg, Constants.gt]:
-                output_file_path = (
-                    f"data/prompts/{mode}-{vector_type}-ws-{window_size}-ss-{slice_size}.jsonl"
+                output_file_path = FilePathBuilder.prompt_path(
+                    mode, vector_type, window_size, slice_size
                 )
                 BuildPromptWrapper(
-                    vector_type, benchmark, repos, window_size, slice_size, tokenizer_cls
+                    vector_type,
+                    benchmark,
+                    repos,
+                    window_size,
+                    slice_size,
+                    tokenizer_cls,
+                    merge_fragments,
+                    num_threads,
                 ).build_first_search_prompt(mode, output_file_path)
 
 
@@ -44,6 +57,8 @@ def build_prompts_for_predictions(
     prediction_path_template: str,
     vector_type: str = "one-gram",
     tokenizer_cls=CodeGenTokenizer,
+    merge_fragments: bool = True,
+    num_threads: Optional[int] = None,
 ) -> None:
     """
     Builds prompts for inference using windows generated from predicted completions (e.g., RepoCoder).
@@ -57,15 +72,25 @@ def build_prompts_for_predictions(
         prediction_path_template: Format string for prediction JSONL file.
         vector_type: Vector type used for retrieval (e.g., 'one-gram').
         tokenizer_cls: Tokenizer class to use (default: CodeGenTokenizer).
+        merge_fragments: Whether to coalesce overlapping retrieved windows of the same file.
+        num_threads: Threads the tokenizer may use to count tokens in batch (its default if
+            None); CodeGenTokenizer only uses them if TOKENIZERS_PARALLELISM is not "false".
     """
     for window_size in window_sizes:
         for slice_size in slice_sizes:
             prediction_path = prediction_path_template.format(
                 window_size=window_size, slice_size=slice_size
             )
-            output_file_path = (
-                f"data/prompts/repocoder-{vector_type}-ws-{window_size}-ss-{slice_size}.jsonl"
+            output_file_path = FilePathBuilder.prompt_path(
+                "repocoder", vector_type, window_size, slice_size
             )
             BuildPromptWrapper(
-                vector_type, benchmark, repos, window_size, slice_size, tokenizer_cls
+                vector_type,
+                benchmark,
+                repos,
+                window_size,
+                slice_size,
+                tokenizer_cls,
+                merge_fragments,
+                num_threads,
             ).build_prediction_prompt(mode, prediction_path, output_file_path)
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 
 from src.build_retrievals.code_search_wrapper import CodeSearchWrapper
 
@@ -9,9 +9,13 @@ def search_baseline_and_ground(
     window_sizes: List[int],
     slice_sizes: List[int],
     vector_type: str = "one-gram",
+    prediction_mode: Optional[str] = None,
+    prediction_path_template: Optional[str] = None,
+    max_workers: Optional[int] = None,
 ) -> None:
     """
-    Performs vector-based retrieval for both baseline (RG1) and ground truth (GT) modes.
+    Performs vector-based retrieval for both baseline (RG1) and ground truth (GT) modes, and
+    optionally for prediction-derived windows, loading each repo corpus once for all of them.
 
     Args:
         benchmark: Benchmark identifier (e.g., "short_api_benchmark").
@@ -19,10 +23,14 @@ def search_baseline_and_ground(
         window_sizes: List of context window sizes.
         slice_sizes: List of slicing strides.
         vector_type: Embedding type used for retrieval (default: 'one-gram').
+        prediction_mode: Mode of prediction windows to also search (e.g., 'r-g-r-g').
+        prediction_path_template: Template string for prediction path, with `prediction_mode`.
+        max_workers: Search processes (os.cpu_count() if None); with 1, the searches run in
+            this process.
     """
     CodeSearchWrapper(
-        vector_type, benchmark, repos, window_sizes, slice_sizes
-    ).search_baseline_and_ground()
+        vector_type, benchmark, repos, window_sizes, slice_sizes, max_workers
+    ).search_baseline_and_ground(prediction_mode, prediction_path_template)
 
 
 def search_predictions(
@@ -33,6 +41,7 @@ def search_predictions(
     mode: str,
     prediction_path_template: str,
     vector_type: str = "one-gram",
+    max_workers: Optional[int] = None,
 ) -> None:
     """
     Performs vector-based retrieval for prediction-derived windows (e.g., RepoCoder).
@@ -45,7 +54,9 @@ def search_predictions(
         mode: Evaluation mode (e.g., 'r-g-r-g').
         prediction_path_template: Template string for prediction path.
         vector_type: Embedding type used for retrieval (default: 'one-gram').
+        max_workers: Search processes (os.cpu_count() if None); with 1, the searches run in
+            this process.
     """
-    CodeSearchWrapper(vector_type, benchmark, repos, window_sizes, slice_sizes).search_prediction(
-        mode, prediction_path_template
-    )
+    CodeSearchWrapper(
+        vector_type, benchmark, repos, window_sizes, slice_sizes, max_workers
+    ).search_prediction(mode, prediction_path_template)
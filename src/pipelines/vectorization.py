@@ -1,11 +1,15 @@
-from typing import List
+from typing import List, Optional
 
 from src.build_vectors.bag_of_words import BagOfWords
 from src.build_vectors.build_vector import BuildVectorWrapper
 
 
 def vectorize_repo_windows(
-    repos: List[str], window_sizes: List[int], slice_sizes: List[int]
+    repos: List[str],
+    window_sizes: List[int],
+    slice_sizes: List[int],
+    max_workers: Optional[int] = None,
+    num_threads: Optional[int] = None,
 ) -> None:
     """
     Vectorizes windows generated from raw repository files.
@@ -14,13 +18,24 @@ def vectorize_repo_windows(
         repos: List of repository names.
         window_sizes: List of context window sizes.
         slice_sizes: List of slicing strides.
+        max_workers: Processes tokenizing the windows of each file (BagOfWords' default if
+            None); with 1, they are tokenized in this process.
+        num_threads: Threads the tokenizer of each process may use to encode a batch (its
+            default if None).
     """
     vectorizer = BagOfWords
-    BuildVectorWrapper(None, vectorizer, repos, window_sizes, slice_sizes).vectorize_repo_windows()
+    BuildVectorWrapper(
+        None, vectorizer, repos, window_sizes, slice_sizes, max_workers, num_threads
+    ).vectorize_repo_windows()
 
 
 def vectorize_baseline_and_ground_windows(
-    benchmark: str, repos: List[str], window_sizes: List[int], slice_sizes: List[int]
+    benchmark: str,
+    repos: List[str],
+    window_sizes: List[int],
+    slice_sizes: List[int],
+    max_workers: Optional[int] = None,
+    num_threads: Optional[int] = None,
 ) -> None:
     """
     Vectorizes windows for both baseline (RG1) and ground truth (GT) modes.
@@ -30,10 +45,14 @@ def vectorize_baseline_and_ground_windows(
         repos: List of repository names.
         window_sizes: List of context window sizes.
         slice_sizes: List of slicing strides.
+        max_workers: Processes tokenizing the windows of each file (BagOfWords' default if
+            None); with 1, they are tokenized in this process.
+        num_threads: Threads the tokenizer of each process may use to encode a batch (its
+            default if None).
     """
     vectorizer = BagOfWords
     BuildVectorWrapper(
-        benchmark, vectorizer, repos, window_sizes, slice_sizes
+        benchmark, vectorizer, repos, window_sizes, slice_sizes, max_workers, num_threads
     ).vectorize_baseline_and_ground_windows()
 
 
@@ -44,6 +63,8 @@ def vectorize_prediction_windows(
     slice_sizes: List[int],
     mode: str,
     prediction_path_template: str,
+    max_workers: Optional[int] = None,
+    num_threads: Optional[int] = None,
 ) -> None:
     """
     Vectorizes windows generated from model predictions (e.g., RepoCoder).
@@ -55,8 +76,12 @@ def vectorize_prediction_windows(
         slice_sizes: List of slicing strides.
         mode: Evaluation mode (e.g., 'r-g-r-g').
         prediction_path_template: Format string for prediction path.
+        max_workers: Processes tokenizing the windows of each file (BagOfWords' default if
+            None); with 1, they are tokenized in this process.
+        num_threads: Threads the tokenizer of each process may use to encode a batch (its
+            default if None).
     """
     vectorizer = BagOfWords
     BuildVectorWrapper(
-        benchmark, vectorizer, repos, window_sizes, slice_sizes
+        benchmark, vectorizer, repos, window_sizes, slice_sizes, max_workers, num_threads
     ).vectorize_prediction_windows(mode, prediction_path_template)
@@ -7,12 +7,18 @@ This module provides methods for generating:
 - Prediction-derived context windows
 """
 
-from typing import List
+from typing import List, Optional
 from src.build_windows.make_window import MakeWindowWrapper
 
 
 def make_repo_windows(
-    base_dir: str, repos: List[str], window_sizes: List[int], slice_sizes: List[int]
+    base_dir: str,
+    repos: List[str],
+    window_sizes: List[int],
+    slice_sizes: List[int],
+    max_workers: Optional[int] = None,
+    max_memory_mb: Optional[int] = None,
+    near_duplicate_threshold: Optional[float] = None,
 ) -> None:
     """
     Builds context windows directly from repository source files.
@@ -22,12 +28,24 @@ def make_repo_windows(
         repos: List of repository names.
         window_sizes: List of context window sizes.
         slice_sizes: List of stride values for slicing.
+        max_workers: Number of worker processes (default: CPU count).
+        max_memory_mb: Estimated memory budget of concurrently windowed repos (default: none).
+        near_duplicate_threshold: MinHash similarity from which only the first of
+            near-duplicate windows is kept (default: only identical windows are merged).
     """
-    MakeWindowWrapper(None, base_dir, repos, window_sizes, slice_sizes).window_for_repo_files()
+    MakeWindowWrapper(
+        None, base_dir, repos, window_sizes, slice_sizes, max_workers, max_memory_mb
+    ).window_for_repo_files(near_duplicate_threshold)
 
 
 def make_baseline_and_ground_windows(
-    benchmark: str, base_dir: str, repos: List[str], window_sizes: List[int], slice_sizes: List[int]
+    benchmark: str,
+    base_dir: str,
+    repos: List[str],
+    window_sizes: List[int],
+    slice_sizes: List[int],
+    max_workers: Optional[int] = None,
+    max_memory_mb: Optional[int] = None,
 ) -> None:
     """
     Builds task-based windows for both the baseline (RG1) and oracle (GT) methods.
@@ -38,9 +56,11 @@ def make_baseline_and_ground_windows(
         repos: List of repository names.
         window_sizes: List of context window sizes.
         slice_sizes: List of stride values.
+        max_workers: Number of worker processes (default: CPU count).
+        max_memory_mb: Estimated memory budget of concurrently windowed repos (default: none).
     """
     MakeWindowWrapper(
-        benchmark, base_dir, repos, window_sizes, slice_sizes
+        benchmark, base_dir, repos, window_sizes, slice_sizes, max_workers, max_memory_mb
     ).window_for_baseline_and_ground()
 
 
@@ -52,6 +72,8 @@ def make_prediction_windows(
     slice_sizes: List[int],
     mode: str,
     prediction_path_template: str,
+    max_workers: Optional[int] = None,
+    max_memory_mb: Optional[int] = None,
 ) -> None:
     """
     Builds windows from predicted completions (e.g., RepoCoder outputs).
@@ -64,7 +86,9 @@ def make_prediction_windows(
         slice_sizes: List of stride values.
         mode: Evaluation mode (e.g., 'r-g-r-g').
         prediction_path_template: Format string for prediction path (e.g., 'predictions/...-ws-{window_size}-ss-{slice_size}.jsonl').
+        max_workers: Number of worker processes (default: CPU count).
+        max_memory_mb: Estimated memory budget of concurrently windowed repos (default: none).
     """
-    MakeWindowWrapper(benchmark, base_dir, repos, window_sizes, slice_sizes).window_for_prediction(
-        mode, prediction_path_template
-    )
+    MakeWindowWrapper(
+        benchmark, base_dir, repos, window_sizes, slice_sizes, max_workers, max_memory_mb
+    ).window_for_prediction(mode, prediction_path_template)
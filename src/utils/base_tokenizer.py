@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+
+class BaseTokenizer:
+    """
+    Common interface of the tokenizer wrappers: single and batch tokenization, token
+    counting and decoding.
+
+    Token ids of recently tokenized strings are kept in an LRU cache, as the same windows and
+    prompt blocks are tokenized again and again. Subclasses implement `_encode`, `decode`
+    and, when their backend can encode several strings at once, `_encode_batch`.
+    """
+
+    def __init__(self, num_threads: Optional[int] = None, cache_size: int = 4096) -> None:
+        """
+        Args:
+            num_threads: Threads the backend may use to encode a batch; None for its default.
+            cache_size: Strings whose token ids are cached; 0 disables the cache.
+        """
+        self.num_threads = num_threads
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[int, ...]]" = OrderedDict()
+
+    def _encode(self, text: str) -> List[int]:
+        raise NotImplementedError
+
+    def _encode_batch(self, texts: List[str]) -> List[List[int]]:
+        return [self._encode(text) for text in texts]
+
+    def decode(self, token_ids: List[int]) -> str:
+        """
+        Decodes a sequence of token IDs back to text.
+        """
+        raise NotImplementedError
+
+    def _cache_put(self, text: str, token_ids: List[int]) -> None:
+        if self.cache_size <= 0:
+            return
+        self._cache[text] = tuple(token_ids)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def tokenize(self, text: str) -> List[int]:
+        """
+        Tokenizes the given text.
+        """
+        cached = self._cache.get(text)
+        if cached is not None:
+            self._cache.move_to_end(text)
+            return list(cached)
+        token_ids = self._encode(text)
+        self._cache_put(text, token_ids)
+        return token_ids
+
+    def tokenize_batch(self, texts: Sequence[str]) -> List[List[int]]:
+        """
+        Tokenizes several texts, encoding those not in the cache in a single backend call.
+        """
+        results: List[Optional[List[int]]] = [None] * len(texts)
+        missing_indices: List[int] = []
+        for i, text in enumerate(texts):
+            cached = self._cache.get(text)
+            if cached is not None:
+                self._cache.move_to_end(text)
+                results[i] = list(cached)
+            else:
+                missing_indices.append(i)
+        if missing_indices:
+            # texts repeated within the batch are encoded once
+            missing_texts = list(dict.fromkeys(texts[i] for i in missing_indices))
+            token_ids_by_text = dict(zip(missing_texts, self._encode_batch(missing_texts)))
+            for text, token_ids in token_ids_by_text.items():
+                self._cache_put(text, token_ids)
+            for i in missing_indices:
+                results[i] = list(token_ids_by_text[texts[i]])
+        return results
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Returns the number of tokens of the given text.
+        """
+        return len(self.tokenize(text))
+
+    def count_tokens_batch(self, texts: Sequence[str]) -> List[int]:
+        """
+        Returns the number of tokens of each of the given texts.
+        """
+        return [len(token_ids) for token_ids in self.tokenize_batch(texts)]
@@ -1,23 +1,33 @@
-from typing import List
+import os
+from typing import List, Optional
 from transformers import AutoTokenizer
 
+from src.utils.base_tokenizer import BaseTokenizer
 from src.utils.constants import Constants
 
 
-class CodeGenTokenizer:
+class CodeGenTokenizer(BaseTokenizer):
     """
     Tokenizer wrapper for CodeGen using HuggingFace Transformers.
+
+    Batches are only encoded on several threads if the TOKENIZERS_PARALLELISM environment
+    variable is not "false"; `run.py` sets it to "false", which overrides `num_threads`.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, num_threads: Optional[int] = None, cache_size: int = 4096) -> None:
+        super().__init__(num_threads, cache_size)
+        if num_threads is not None:
+            # the fast tokenizer encodes batches on a Rayon thread pool, sized by this variable
+            # when the pool is first used in the process
+            os.environ["RAYON_NUM_THREADS"] = str(num_threads)
         self.tokenizer = AutoTokenizer.from_pretrained(Constants.codegen_tokenizer)
 
-    def tokenize(self, text: str) -> List[int]:
-        """
-        Tokenizes the given text using CodeGen tokenizer.
-        """
+    def _encode(self, text: str) -> List[int]:
         return self.tokenizer.encode(text)
 
+    def _encode_batch(self, texts: List[str]) -> List[List[int]]:
+        return self.tokenizer(texts)["input_ids"]
+
     def decode(self, token_ids: List[int]) -> str:
         """
         Decodes a sequence of token IDs back to text.
@@ -1,23 +1,27 @@
 import tiktoken
-from typing import List
+from typing import List, Optional
 
+from src.utils.base_tokenizer import BaseTokenizer
 from src.utils.constants import Constants
 
 
-class CodexTokenizer:
+class CodexTokenizer(BaseTokenizer):
     """
     Tokenizer wrapper for Codex using TikToken.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, num_threads: Optional[int] = None, cache_size: int = 4096) -> None:
+        super().__init__(num_threads, cache_size)
         self.tokenizer = tiktoken.get_encoding(Constants.codex_tokenizer)
 
-    def tokenize(self, text: str) -> List[int]:
-        """
-        Tokenizes the given text using Codex encoding.
-        """
+    def _encode(self, text: str) -> List[int]:
         return self.tokenizer.encode_ordinary(text)
 
+    def _encode_batch(self, texts: List[str]) -> List[List[int]]:
+        if self.num_threads is None:
+            return self.tokenizer.encode_ordinary_batch(texts)
+        return self.tokenizer.encode_ordinary_batch(texts, num_threads=self.num_threads)
+
     def decode(self, token_ids: List[int]) -> str:
         """
         Decodes a sequence of token IDs back to text.
@@ -25,6 +25,12 @@ class Constants:
     base_datasets_dir: str = "data/datasets"
     base_cache_windows_dir: str = "data/cache/window"
     base_predictions_dir = "data/predictions"
+    base_reports_dir: str = "data/reports"
+    base_prompts_dir: str = "data/prompts"
+    cache_manifest_path: str = "data/cache/manifest.json"
+
+    # Retrieved contexts stored per query window for prompt construction (which uses the top 10)
+    retrieval_max_top_k: int = 20
 
     # TODO: fix this path
     repo_base_dir: str = "data/repositories/line_and_api_level"
@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 
 from src.utils.constants import Constants
 
@@ -103,3 +104,66 @@ class FilePathBuilder:
         )
         FilePathBuilder.create_dir(out_path)
         return out_path
+
+    @staticmethod
+    def prompt_path(mode: str, vector_type: str, window_size: int, slice_size: int) -> str:
+        """
+        Constructs the path of the prompt file of a mode (e.g. 'r-g', 'gt' or 'repocoder'),
+        e.g. `data/prompts/r-g-one-gram-ws-20-ss-2.jsonl`.
+        """
+        out_path = os.path.join(
+            Constants.base_prompts_dir,
+            f"{mode}-{vector_type}-ws-{window_size}-ss-{slice_size}.jsonl",
+        )
+        FilePathBuilder.create_dir(out_path)
+        return out_path
+
+    @staticmethod
+    def prediction_path(prompt_file: str, model_name: str) -> str:
+        """
+        Constructs the path of the merged predictions for a prompt file and model,
+        e.g. `data/predictions/rg-one-gram-ws-20-ss-2.codegen-350M-mono.jsonl`.
+        """
+        base_name = os.path.splitext(os.path.basename(prompt_file))[0]
+        model_suffix = model_name.split("/")[-1]  # e.g., "codegen-350M-mono"
+        out_path = os.path.join(Constants.base_predictions_dir, f"{base_name}.{model_suffix}.jsonl")
+        FilePathBuilder.create_dir(out_path)
+        return out_path
+
+    @staticmethod
+    def prediction_shard_path(
+        prompt_file: str,
+        model_name: str,
+        shard_id: int,
+        num_shards: int,
+        decoder: Optional[str] = None,
+    ) -> str:
+        """
+        Constructs the path of the append-only checkpoint file of one prediction shard.
+        Decoders other than the default one (e.g. 'prompt-lookup') checkpoint to their own
+        files, e.g. `rg-one-gram-ws-20-ss-2.codegen-350M-mono.prompt-lookup.shard-0-of-1.jsonl`.
+        """
+        merged_path = FilePathBuilder.prediction_path(prompt_file, model_name)
+        decoder_suffix = f".{decoder}" if decoder else ""
+        shard_name = os.path.basename(merged_path).replace(
+            ".jsonl", f"{decoder_suffix}.shard-{shard_id}-of-{num_shards}.jsonl"
+        )
+        out_path = os.path.join(Constants.base_predictions_dir, "shards", shard_name)
+        FilePathBuilder.create_dir(out_path)
+        return out_path
+
+    @staticmethod
+    def stage_report_path(run_name: str) -> str:
+        """
+        Constructs the path of the per-stage timing report of a pipeline run.
+        """
+        out_path = os.path.join(Constants.base_reports_dir, f"{run_name}.stages.json")
+        FilePathBuilder.create_dir(out_path)
+        return out_path
+
+    @staticmethod
+    def stage_profile_dir(run_name: str) -> str:
+        """
+        Constructs the directory holding the cProfile captures of a pipeline run.
+        """
+        return os.path.join(Constants.base_reports_dir, f"{run_name}.profiles")
@@ -0,0 +1,35 @@
+import re
+import zlib
+from typing import Dict, List, Optional
+
+from src.utils.base_tokenizer import BaseTokenizer
+
+
+class SimpleTokenizer(BaseTokenizer):
+    """
+    Offline stand-in for the Codex and CodeGen tokenizers, used where their vocabularies
+    cannot be downloaded (e.g. for benchmarks).
+
+    Splits text into identifiers, numbers, single punctuation characters and whitespace runs,
+    and maps every piece to a stable id (CRC32), so that ids agree across processes.
+    """
+
+    pattern = re.compile(r"[A-Za-z_]\w*|\d+|\s+|[^\w\s]")
+
+    def __init__(self, num_threads: Optional[int] = None, cache_size: int = 4096) -> None:
+        super().__init__(num_threads, cache_size)
+        self.vocab: Dict[int, str] = {}
+
+    def _encode(self, text: str) -> List[int]:
+        token_ids = []
+        for piece in self.pattern.findall(text):
+            token_id = zlib.crc32(piece.encode("utf8"))
+            self.vocab[token_id] = piece
+            token_ids.append(token_id)
+        return token_ids
+
+    def decode(self, token_ids: List[int]) -> str:
+        """
+        Decodes ids produced by this tokenizer instance back to text.
+        """
+        return "".join(self.vocab[token_id] for token_id in token_ids)
@@ -0,0 +1,118 @@
+import os
+import time
+import cProfile
+import resource
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.utils.tools import Tools
+
+
+class StageProfiler:
+    """
+    Process-wide collector of per-stage, per-repo timing records.
+
+    Each `profile` block records wall time, CPU time (including child processes reaped during
+    the block), the max RSS of the process, and the number of items the stage processed.
+    Stages that run in worker processes return their record to the parent, which adds it
+    with `add`. With `capture_dir` set, every block is also profiled with cProfile and saved
+    as a `.prof` file (readable by pstats, snakeviz, etc.).
+    """
+
+    records: List[Dict[str, Any]] = []
+    capture_dir: Optional[str] = None
+
+    @staticmethod
+    def _cpu_seconds() -> float:
+        seconds = 0.0
+        for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+            usage = resource.getrusage(who)
+            seconds += usage.ru_utime + usage.ru_stime
+        return seconds
+
+    @staticmethod
+    @contextmanager
+    def profile(stage: str, repo: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Times the enclosed block. The yielded record can be given the processed item count
+        (`record["items"] = n`) and any extra fields before the block ends.
+
+        Args:
+            stage: Stage name, e.g. "make_repo_windows".
+            repo: Repository the block works on, or None for a whole-stage record.
+        """
+        record: Dict[str, Any] = {"stage": stage, "repo": repo, "items": None}
+        profiler = cProfile.Profile() if StageProfiler.capture_dir else None
+        start_wall = time.perf_counter()
+        start_cpu = StageProfiler._cpu_seconds()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            wall_seconds = time.perf_counter() - start_wall
+            record["wall_s"] = round(wall_seconds, 4)
+            record["cpu_s"] = round(StageProfiler._cpu_seconds() - start_cpu, 4)
+            # ru_maxrss is reported in kilobytes on Linux
+            record["max_rss_mb"] = round(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+            )
+            if record["items"] is not None:
+                record["items_per_s"] = round(record["items"] / max(wall_seconds, 1e-9), 2)
+            if profiler:
+                os.makedirs(StageProfiler.capture_dir, exist_ok=True)
+                profile_path = os.path.join(
+                    StageProfiler.capture_dir, f"{stage}.{repo or 'all'}.{os.getpid()}.prof"
+                )
+                profiler.dump_stats(profile_path)
+                record["profile_path"] = profile_path
+            StageProfiler.records.append(record)
+
+    @staticmethod
+    def add(record: Dict[str, Any]) -> None:
+        """
+        Adds a record returned by a worker process.
+        """
+        StageProfiler.records.append(record)
+
+    @staticmethod
+    def reset() -> None:
+        StageProfiler.records = []
+
+    @staticmethod
+    def summarize() -> Dict[str, Dict[str, Any]]:
+        """
+        Aggregates the records per stage. Wall and CPU times are summed over the records, so
+        for stages whose repos run in parallel the wall time exceeds the elapsed time.
+        """
+        summary: Dict[str, Dict[str, Any]] = defaultdict(
+            lambda: {"records": 0, "wall_s": 0.0, "cpu_s": 0.0, "items": 0, "max_rss_mb": 0.0}
+        )
+        for record in StageProfiler.records:
+            stage = summary[record["stage"]]
+            stage["records"] += 1
+            stage["wall_s"] = round(stage["wall_s"] + record["wall_s"], 4)
+            stage["cpu_s"] = round(stage["cpu_s"] + record["cpu_s"], 4)
+            stage["items"] += record["items"] or 0
+            stage["max_rss_mb"] = max(stage["max_rss_mb"], record["max_rss_mb"])
+        for stage in summary.values():
+            stage["items_per_s"] = round(stage["items"] / max(stage["wall_s"], 1e-9), 2)
+        return dict(summary)
+
+    @staticmethod
+    def dump_report(output_path: str) -> None:
+        """
+        Prints the per-stage summary and writes it, with every record, as JSON.
+        """
+        summary = StageProfiler.summarize()
+        for stage, stats in summary.items():
+            print(
+                f"{stage}: {stats['wall_s']}s wall, {stats['cpu_s']}s cpu, "
+                f"{stats['items']} items ({stats['items_per_s']}/s), "
+                f"max RSS {stats['max_rss_mb']} MB"
+            )
+        Tools.dump_json({"stages": summary, "records": StageProfiler.records}, output_path)
+        print(f"Saved stage report to {output_path}")
@@ -2,8 +2,9 @@ import os
 import glob
 import pickle
 import json
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
+from src.utils.base_tokenizer import BaseTokenizer
 from src.utils.codex_tokenizer import CodexTokenizer
 
 
@@ -12,6 +13,10 @@ class Tools:
     Collection of utility functions for file I/O, tokenization, and source code parsing.
     """
 
+    # tokenizer used by `tokenize`; process pools forked afterwards inherit a replacement
+    tokenizer_cls = CodexTokenizer
+    _tokenizer: Optional[BaseTokenizer] = None
+
     @staticmethod
     def read_code(fname: str) -> str:
         """
@@ -56,6 +61,19 @@ class Tools:
             for item in obj:
                 f.write(json.dumps(item) + "\n")
 
+    @staticmethod
+    def append_jsonl(obj: List[Any], fname: str) -> None:
+        """
+        Appends a list of Python objects to a JSONL file and flushes them to disk,
+        so completed records survive a crash of the writing process.
+        """
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        with open(fname, "a", encoding="utf8") as f:
+            for item in obj:
+                f.write(json.dumps(item) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
     @staticmethod
     def load_jsonl(fname: str) -> List[Any]:
         """
@@ -94,10 +112,33 @@ class Tools:
 
         return loaded_code_files
 
+    @staticmethod
+    def get_tokenizer(num_threads: Optional[int] = None) -> BaseTokenizer:
+        """
+        Returns this process's instance of `Tools.tokenizer_cls`, created on first use, so
+        that the tokenizer is loaded and its cache kept once per process.
+
+        Args:
+            num_threads: Threads the tokenizer may use to encode a batch; if given and not
+                the current instance's, the instance is created again with it.
+        """
+        if type(Tools._tokenizer) is not Tools.tokenizer_cls or (
+            num_threads is not None and Tools._tokenizer.num_threads != num_threads
+        ):
+            Tools._tokenizer = Tools.tokenizer_cls(num_threads)
+        return Tools._tokenizer
+
     @staticmethod
     def tokenize(code: str) -> List[int]:
         """
-        Tokenizes code using the Codex tokenizer.
+        Tokenizes code using `Tools.tokenizer_cls` (the Codex tokenizer by default).
+        """
+        return Tools.get_tokenizer().tokenize(code)
+
+    @staticmethod
+    def tokenize_batch(codes: List[str], num_threads: Optional[int] = None) -> List[List[int]]:
+        """
+        Tokenizes several pieces of code at once using `Tools.tokenizer_cls`, on
+        `num_threads` threads if given (see `get_tokenizer`).
         """
-        tokenizer = CodexTokenizer()
-        return tokenizer.tokenize(code)
+        return Tools.get_tokenizer(num_threads).tokenize_batch(codes)
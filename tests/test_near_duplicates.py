@@ -0,0 +1,45 @@
+import os
+
+from src.build_retrievals.code_search_worker import CodeSearchWorker
+from src.build_windows.near_duplicates import MinHashDeduplicator
+from src.build_windows.repo_window_maker import RepoWindowMaker
+from src.utils.simple_tokenizer import SimpleTokenizer
+from src.utils.tools import Tools
+
+
+def _write_repo(base_dir):
+    lines = [f"value_{i} = compute_value(value_{i - 1}, {i})" for i in range(1, 31)]
+    target_lines = list(lines)
+    target_lines[19] = "secret = leak_ground_truth(value_19)"
+    copied_lines = list(lines[10:])
+    copied_lines[9] = "secret = other_value(value_19)"
+    for fname, file_lines in (("target.py", target_lines), ("copied.py", copied_lines)):
+        with open(os.path.join(base_dir, "repo", fname), "w", encoding="utf8") as f:
+            f.write("\n".join(file_lines) + "\n")
+
+
+def test_near_duplicates_do_not_bring_back_windows_after_the_hole(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / "repo")
+    _write_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Tools, "tokenizer_cls", SimpleTokenizer)
+
+    maker = RepoWindowMaker(str(tmp_path), "repo", 10, 10, near_duplicate_threshold=0.5)
+    maker.build_windows()
+    assert maker.dedup_stats["windows_after_dedup"] < maker.dedup_stats["windows"]
+
+    windows = Tools.load_pickle("data/cache/window/repos/repo_ws10_slice10.pkl")
+    # the hole is at line 10 of target.py, before the line only target.py contains
+    query_line = {"metadata": {"fpath_tuple": ("repo", "target.py"), "context_start_lineno": 0}}
+    for window in windows:
+        if "leak_ground_truth" in window["context"]:
+            assert CodeSearchWorker._is_context_after_hole(None, window, query_line)
+
+
+def test_sequences_sharing_a_key_are_never_grouped():
+    tokens = list(range(100))
+    near_copy = tokens[:50] + [1000] + tokens[51:]
+    deduplicator = MinHashDeduplicator(0.8)
+    assert deduplicator.find_groups([tokens, near_copy, tokens]) == [[0, 1, 2]]
+    groups = deduplicator.find_groups([tokens, near_copy, tokens], [{"a"}, {"b"}, {"a"}])
+    assert groups == [[0, 1], [2]]